@@ -9,24 +9,28 @@ const AdminViewScheduleScreen = ({ navigation }) => {
   const [selectedBatch, setSelectedBatch] = useState('');
   const [selectedDay, setSelectedDay] = useState('');
   const [teacherId, setTeacherId] = useState('');
+  const [nextCursor, setNextCursor] = useState(null);
 
   const semesters = Array.from({ length: 8 }, (_, i) => `${i + 1}`);
   const batches = ['A', 'B', 'C', 'D', 'E', 'F'];
   const daysOfWeek = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday'];
 
-  // Fetch schedules with applied filters
-  const fetchSchedules = async () => {
-    setLoading(true);
+  // Fetch schedules with applied filters, a page at a time
+  const fetchSchedules = async (cursor = null) => {
+    if (!cursor) setLoading(true);
     try {
       const params = {
         ...(selectedSemester && { semester: selectedSemester }),
         ...(selectedBatch && { batch: selectedBatch }),
         ...(selectedDay && { day: selectedDay }),
         ...(teacherId && { teacherId }),
+        limit: 100,
+        ...(cursor && { cursor }),
       };
 
       const response = await axios.get(`http://172.20.10.10:5000/get_schedules`, { params });
-      setSchedules(response.data);
+      setSchedules(cursor ? prevSchedules => [...prevSchedules, ...response.data] : response.data);
+      setNextCursor(response.headers['x-next-cursor'] || null);
     } catch (error) {
       console.error('Error fetching schedules:', error);
     } finally {
@@ -101,7 +105,7 @@ const AdminViewScheduleScreen = ({ navigation }) => {
       </View>
 
       {/* Apply Filters Button */}
-      <TouchableOpacity onPress={fetchSchedules} style={styles.applyFilterButton}>
+      <TouchableOpacity onPress={() => fetchSchedules()} style={styles.applyFilterButton}>
         <Text style={styles.applyFilterButtonText}>Apply Filters</Text>
       </TouchableOpacity>
 
@@ -110,6 +114,8 @@ const AdminViewScheduleScreen = ({ navigation }) => {
         <FlatList
           data={schedules}
           keyExtractor={(item) => item.id.toString()}
+          onEndReached={() => nextCursor && fetchSchedules(nextCursor)}
+          onEndReachedThreshold={0.5}
           renderItem={({ item }) => (
             <View style={styles.scheduleItem}>
               <Text style={styles.scheduleText}>
@@ -4,12 +4,15 @@ import { Camera, CameraType } from 'expo-camera/legacy';
 import { FontAwesome } from '@expo/vector-icons';
 import { useAuth } from '../context/AuthContext';
 import * as ImageManipulator from 'expo-image-manipulator';
+import * as Crypto from 'expo-crypto';
 
 const GiveAttendanceScreen = ({ route, navigation }) => {
   const { courseName, studentId: passedStudentId } = route.params; // Get student ID from params
   const { logout } = useAuth();
   const [hasPermission, setHasPermission] = useState(null);
   const [capturedImage, setCapturedImage] = useState(null);
+  // One key per captured photo, so resubmitting the same photo cannot record attendance twice
+  const [idempotencyKey, setIdempotencyKey] = useState(null);
   const [studentId, setStudentId] = useState(passedStudentId || ''); // Set the state to the passed student ID
   const cameraRef = useRef(null);
   const [cameraType, setCameraType] = useState(CameraType.back);
@@ -69,6 +72,7 @@ const GiveAttendanceScreen = ({ route, navigation }) => {
       );
 
       setCapturedImage(fixedImage.uri);
+      setIdempotencyKey(Crypto.randomUUID());
     }
   };
 
@@ -86,6 +90,7 @@ const GiveAttendanceScreen = ({ route, navigation }) => {
     try {
       const response = await fetch('http://172.20.10.10:5000/process_attendance', {
         method: 'POST',
+        headers: { 'Idempotency-Key': idempotencyKey },
         body: formData,
       });
 
@@ -23,6 +23,24 @@ const UploadAndTuneScreen = ({ navigation }) => {
     }
   };
 
+  // Training runs in the background on the server; poll until it finishes
+  const pollTrainingStatus = async (statusUrl) => {
+    try {
+      const response = await fetch(`http://172.20.10.10:5000${statusUrl}`); // Replace with your server URL
+      const job = await response.json();
+      if (job.status === 'done') {
+        Alert.alert('Success', 'Training completed successfully');
+      } else if (job.status === 'failed') {
+        Alert.alert('Error', job.error || 'Training failed');
+      } else {
+        setTimeout(() => pollTrainingStatus(statusUrl), 2000);
+      }
+    } catch (error) {
+      Alert.alert('Error', 'An error occurred while checking the training status.');
+      console.error(error);
+    }
+  };
+
   const handleUploadAndTune = async () => {
     const formData = new FormData();
     selectedFiles.forEach(file => {
@@ -45,7 +63,8 @@ const UploadAndTuneScreen = ({ navigation }) => {
       
       const data = await response.json();
       if (response.ok) {
-        Alert.alert('Success', data.message);
+        Alert.alert('Uploaded', data.message);
+        pollTrainingStatus(data.status_url);
       } else {
         Alert.alert('Error', data.message);
       }
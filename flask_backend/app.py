@@ -2,17 +2,29 @@ from flask import Flask, request, jsonify, session, current_app, abort, redirect
 from flask_sqlalchemy import SQLAlchemy
 from flask_login import LoginManager, login_user, logout_user, current_user,login_required
 from werkzeug.security import generate_password_hash, check_password_hash
-from flask_backend.models import db, User, Student, Teacher, ScheduleEntry, Class, AttendanceRecord, AttendanceStatus, FeatureToggle
+from flask_backend.models import db, User, Student, Teacher, ScheduleEntry, Class, AttendanceRecord, AttendanceStatus, FeatureToggle, AttendanceSummary, CampusSite, check_database_url
+from flask_backend.attendance import record_attendance, record_attendance_bulk, rebuild_attendance_summaries
+from flask_backend.listing import Listing, ListingError
+from flask_backend.resource_versions import bump_versions, conditional, get_resource_versions
+from flask_backend.idempotency import idempotent, purge_idempotency_keys
+from flask_backend.geofence import get_geofence, parse_polygon
+from flask_backend.schedules import upsert_schedule_entries, read_timetable, TimetableImport, SCHEDULE_DAYS
 import os
 from flask_migrate import Migrate
 import logging
 from flask_cors import CORS
-from flask_backend.facial_recognition import train_model, get_model_directory, recognize_face, load_and_preprocess_image
+from flask_backend.embedding_store import get_embedding_store
+from flask_backend.lazy_imports import import_cost_report
+from flask_backend.enrollment_jobs import EnrollmentQueue, EnrollmentQueueFull
+from flask_backend.facial_recognition import train_model, get_model_directory, recognize_face, identify_face, match_group_faces, GroupMatchingUnavailable, SIMILARITY_THRESHOLD, start_inference, reload_feature_extractor, get_inference_stats, stale_enrollments
 from werkzeug.utils import secure_filename
+from sqlalchemy.exc import IntegrityError
 from datetime import datetime
-from geopy.distance import geodesic
 from authlib.integrations.flask_client import OAuth  
 import secrets
+import csv
+import json
+import click
 
 
 
@@ -35,6 +47,7 @@ app.config.update(
 )
 
 # Initialize the database and login manager
+check_database_url(app.config['SQLALCHEMY_DATABASE_URI'])
 db.init_app(app)
 login_manager = LoginManager()
 login_manager.init_app(app)
@@ -58,7 +71,7 @@ google = oauth.register(
 
 
 # Initialize Migrate
-migrate = Migrate(app, db)  
+migrate = Migrate(app, db, directory=os.path.join(os.path.dirname(os.path.abspath(__file__)), 'migrations'))
 
 # Configure logging
 logging.basicConfig(level=logging.DEBUG, format='%(asctime)s - %(levelname)s - %(message)s')
@@ -73,6 +86,10 @@ def load_user(user_id):
         current_app.logger.error(f"Error loading user: {e}")
         return None
 
+@app.errorhandler(ListingError)
+def handle_listing_error(e):
+    return jsonify({'message': str(e)}), 400
+
 
 @app.route('/google_login')
 def google_login():
@@ -174,6 +191,7 @@ def complete_registration():
             db.session.add(teacher)
 
         db.session.commit()
+        bump_versions('roster')
 
         # Log in the new user
         login_user(user)
@@ -241,6 +259,7 @@ def register():
             db.session.add(teacher)
 
         db.session.commit()
+        bump_versions('roster')
         return jsonify({"message": "User registered successfully!"}), 201
 
     except Exception as e:
@@ -313,12 +332,24 @@ def logout():
         current_app.logger.error(f"Logout error: {e}")
         return jsonify({"message": "Error logging out"}), 500
 
+TEACHER_LIST_COLUMNS = {
+    'id': Teacher.id,
+    'teacher_id': Teacher.teacher_id,
+    'name': Teacher.name,
+    'department': Teacher.department,
+}
+
 @app.route('/teachers', methods=['GET'])
+@conditional('roster')
 def get_teachers():
     try:
-        teachers = Teacher.query.all()
-        teacher_list = [{'id': teacher.id, 'teacher_id': teacher.teacher_id} for teacher in teachers]
-        return jsonify(teacher_list), 200
+        listing = Listing(TEACHER_LIST_COLUMNS, [(Teacher.id, False)], default_fields=['id', 'teacher_id'])
+        query = db.session.query(*listing.entities())
+        if request.args.get('department'):
+            query = query.filter(Teacher.department == request.args['department'])
+        return listing.response(listing.apply(query))
+    except ListingError:
+        raise
     except Exception as e:
         print(f"Error fetching teachers: {e}")
         return jsonify({'message': 'Error fetching teachers'}), 500
@@ -332,7 +363,7 @@ def create_schedule():
     departments = Student.query.with_entities(Student.department).distinct().all()
     semesters = [str(i) for i in range(1, 9)]
     batches = [chr(i) for i in range(ord('A'), ord('G') + 1)]
-    days = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday']
+    days = list(SCHEDULE_DAYS)
     teachers = Teacher.query.all()
 
     if request.method == 'POST':
@@ -361,78 +392,30 @@ def create_schedule():
         if not existing_class:
             new_class = Class(name=course_name, teacher_id=teacher_id, schedule=schedule_str)
             db.session.add(new_class)
+
+        # One entry for the whole cohort, or one only the teacher sees when no cohort is given
+        has_cohort = bool(department and semester and batch)
+        entry = {
+            'teacher_id': teacher_id,
+            'day_of_week': day_of_week,
+            'time_start': time_start,
+            'time_end': time_end,
+            'classroom': classroom,
+            'course_name': course_name,
+            'department': department if has_cohort else None,
+            'semester': semester if has_cohort else None,
+            'batch': batch if has_cohort else None,
+        }
+
+        # Insert or update the entry together with the class, in one transaction
+        try:
+            upsert_schedule_entries([entry])
             db.session.commit()
-            class_id = new_class.id
-        else:
-            class_id = existing_class.id
-
-        # Handle teacher schedule entry with duplication check
-        if teacher_id:
-            existing_teacher_entry = ScheduleEntry.query.filter_by(
-                teacher_id=teacher_id,
-                day_of_week=day_of_week,
-                time_start=time_start,
-                time_end=time_end
-            ).first()
-
-            if existing_teacher_entry:
-                # Update existing teacher entry
-                existing_teacher_entry.classroom = classroom
-                existing_teacher_entry.course_name = course_name
-                existing_teacher_entry.department = None
-                existing_teacher_entry.batch = None
-                existing_teacher_entry.semester = None
-                db.session.commit()  # Commit immediately after updating
-            else:
-                # Create new entry if not found
-                new_entry = ScheduleEntry(
-                    teacher_id=teacher_id,
-                    day_of_week=day_of_week,
-                    time_start=time_start,
-                    time_end=time_end,
-                    classroom=classroom,
-                    course_name=course_name
-                )
-                db.session.add(new_entry)
-
-        # Handle student schedule entry with duplication check
-        if department and semester and batch:
-            students = Student.query.filter_by(department=department, semester=semester, batch=batch).all()
-            for student in students:
-                existing_student_entry = ScheduleEntry.query.filter_by(
-                    student_id=student.id,
-                    day_of_week=day_of_week,
-                    time_start=time_start,
-                    time_end=time_end
-                ).first()
-
-                if existing_student_entry:
-                    # Update existing student entry
-                    existing_student_entry.classroom = classroom
-                    existing_student_entry.teacher_id = teacher_id
-                    existing_student_entry.course_name = course_name
-                    existing_student_entry.department = department
-                    existing_student_entry.batch = batch
-                    existing_student_entry.semester = semester
-                    db.session.commit()  # Commit immediately after updating
-                else:
-                    # Create new entry if not found
-                    new_student_entry = ScheduleEntry(
-                        student_id=student.id,
-                        day_of_week=day_of_week,
-                        time_start=time_start,
-                        time_end=time_end,
-                        classroom=classroom,
-                        teacher_id=teacher_id,
-                        course_name=course_name,
-                        department=department,
-                        batch=batch,
-                        semester=semester
-                    )
-                    db.session.add(new_student_entry)
-
-            # Commit all new entries at once, after handling all students
-            db.session.commit()
+            bump_versions('schedules')
+        except Exception as e:
+            db.session.rollback()
+            logger.error("Error creating schedule: %s", e)
+            return jsonify({'message': 'Error creating schedule'}), 500
 
         return jsonify({'message': 'Schedule created successfully!'}), 201
 
@@ -445,25 +428,92 @@ def create_schedule():
         'teachers': [{'id': teacher.id, 'name': teacher.name} for teacher in teachers]
     }), 200
 
+@app.route('/import_schedule', methods=['POST'])
+@login_required
+def import_schedule():
+    """Import a whole timetable from a CSV or JSON file, or a JSON list of rows.
+
+    Rows have the create_schedule fields; teacher_id may be the teacher's id or
+    their teacher code. Nothing is written unless every row is valid, and with
+    ?dry_run=1 nothing is written at all.
+    """
+    if not current_user.is_admin:
+        abort(403)
+
+    dry_run = request.args.get('dry_run', '0') in ('1', 'true')
+    timetable = TimetableImport()
+    try:
+        upload = request.files.get('file')
+        if upload is not None:
+            rows = read_timetable(upload.stream, upload.filename or '')
+        else:
+            data = request.get_json(silent=True)
+            if not isinstance(data, list):
+                return jsonify({'message': 'Upload a timetable file or send a JSON list of rows'}), 400
+            rows = enumerate(data, start=1)
+        for row_number, row in rows:
+            timetable.validate(row_number, row)
+    except (ValueError, UnicodeDecodeError, csv.Error) as e:
+        return jsonify({'message': f'Could not read the timetable: {e}'}), 400
+
+    report = {
+        'rows': timetable.rows,
+        'valid': len(timetable.slots),
+        'errors': timetable.errors,
+        'dry_run': dry_run,
+        'classes_created': 0,
+        'entries_written': 0,
+    }
+    if timetable.errors:
+        return jsonify(report), 422
+    if dry_run:
+        return jsonify(report), 200
+
+    try:
+        report['classes_created'], report['entries_written'] = timetable.write()
+        db.session.commit()
+        bump_versions('schedules')
+    except Exception as e:
+        db.session.rollback()
+        logger.error("Error importing timetable: %s", e)
+        return jsonify({'message': 'Error importing timetable'}), 500
+    return jsonify(report), 201
+
+SCHEDULE_LIST_COLUMNS = {
+    'id': ScheduleEntry.id,
+    'day_of_week': ScheduleEntry.day_of_week,
+    'time_start': ScheduleEntry.time_start,
+    'time_end': ScheduleEntry.time_end,
+    'course_name': ScheduleEntry.course_name,
+    'classroom': ScheduleEntry.classroom,
+    'teacher_id': ScheduleEntry.teacher_id,
+    'department': ScheduleEntry.department,
+    'semester': ScheduleEntry.semester,
+    'batch': ScheduleEntry.batch,
+}
+
 @app.route('/get_schedules', methods=['GET'])
 @login_required  # Ensure that only logged-in users can access this
+@conditional('schedules', 'roster')
 def get_schedules():
-    schedules = ScheduleEntry.query.all()  # Fetch all schedules
-    schedules_list = []
-    for schedule in schedules:
-        schedules_list.append({
-            'id': schedule.id,
-            'day_of_week': schedule.day_of_week,
-            'time_start': schedule.time_start,
-            'time_end': schedule.time_end,
-            'course_name': schedule.course_name,
-            'classroom': schedule.classroom,
-            'teacher_id': schedule.teacher_id,
-            'department': schedule.department,
-            'semester': schedule.semester,
-            'batch': schedule.batch
-        })
-    return jsonify(schedules_list), 200
+    listing = Listing(SCHEDULE_LIST_COLUMNS, [(ScheduleEntry.id, False)])
+    query = db.session.query(*listing.entities())
+
+    # Filters use the names the admin schedule screen sends
+    for arg, column in (('semester', ScheduleEntry.semester), ('batch', ScheduleEntry.batch),
+                        ('department', ScheduleEntry.department), ('day', ScheduleEntry.day_of_week),
+                        ('course_name', ScheduleEntry.course_name)):
+        if request.args.get(arg):
+            query = query.filter(column == request.args[arg])
+    teacher_id = request.args.get('teacherId')
+    if teacher_id:
+        # The teacher's code, or their id
+        by_teacher = ScheduleEntry.teacher_id.in_(db.session.query(Teacher.id).filter(Teacher.teacher_id == teacher_id))
+        if teacher_id.isdigit():
+            by_teacher = db.or_(by_teacher, ScheduleEntry.teacher_id == int(teacher_id))
+        query = query.filter(by_teacher)
+
+    return listing.response(listing.apply(query))
 
 @app.route('/api/schedule/<int:schedule_id>', methods=['DELETE'])
 def delete_schedule(schedule_id):
@@ -472,8 +522,9 @@ def delete_schedule(schedule_id):
         if not schedule_entry:
             return jsonify({'message': 'Schedule entry not found.'}), 404
         
-        db.session.delete(schedule_entry)  # Delete the schedule entry
+        db.session.delete(schedule_entry)  # Delete the schedule entry, for its whole cohort
         db.session.commit()  # Commit the transaction
+        bump_versions('schedules')
         
         return jsonify({'message': 'Schedule entry deleted successfully.'}), 200
     except Exception as e:
@@ -482,6 +533,7 @@ def delete_schedule(schedule_id):
 
 @app.route('/get_teacher_schedule', methods=['GET'])
 @login_required
+@conditional('schedules', per_user=True)
 def get_teacher_schedule():
     # Check if the current user is a teacher
     if not current_user.is_teacher:
@@ -517,6 +569,79 @@ if not os.path.exists(UPLOAD_FOLDER):
     os.makedirs(UPLOAD_FOLDER)
 app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
 
+# The ML stack is loaded on the first recognition or enrollment request.
+# Set PRELOAD_FEATURE_EXTRACTOR=1 to load the shared feature extractor (or
+# start the inference worker pool when INFERENCE_POOL_SIZE is set) at startup
+# instead, trading a slower worker start for a fast first request.
+app.config['PRELOAD_FEATURE_EXTRACTOR'] = os.getenv('PRELOAD_FEATURE_EXTRACTOR', '0') == '1'
+if app.config['PRELOAD_FEATURE_EXTRACTOR']:
+    start_inference()
+
+@app.route('/api/facial-recognition/reload', methods=['POST'])
+@login_required
+def reload_recognition_model():
+    if not current_user.is_admin:
+        return jsonify({'error': 'Unauthorized'}), 403
+
+    try:
+        reload_feature_extractor()
+        return jsonify({'message': 'Feature extractor reloaded successfully'}), 200
+    except Exception as e:
+        current_app.logger.error(f"Error reloading feature extractor: {e}")
+        return jsonify({'message': 'Error reloading feature extractor'}), 500
+
+@app.route('/api/facial-recognition/stats', methods=['GET'])
+@login_required
+def recognition_stats():
+    if not current_user.is_admin:
+        return jsonify({'error': 'Unauthorized'}), 403
+    return jsonify(get_inference_stats(get_model_directory())), 200
+
+@app.cli.command('rebuild-attendance-summary')
+def rebuild_attendance_summary():
+    """Recompute the attendance summaries from all attendance records."""
+    count = rebuild_attendance_summaries()
+    print(f"Rebuilt {count} attendance summaries.")
+
+@app.cli.command('purge-idempotency-keys')
+def purge_expired_idempotency_keys():
+    """Delete the Idempotency-Key responses that are no longer replayed."""
+    print(f"Deleted {purge_idempotency_keys()} idempotency keys.")
+
+@app.cli.command('import-report')
+def import_report():
+    """Print the cold import time of the app and of each heavy module it can load."""
+    for module, seconds in import_cost_report().items():
+        print(f"{module}: {seconds}")
+
+@app.cli.command('compact-embeddings')
+def compact_embeddings():
+    """Drop superseded enrollments from the embedding store."""
+    reclaimed = get_embedding_store(get_model_directory()).compact()
+    print(f"Reclaimed {reclaimed} embedding rows.")
+
+# Enrollment uploads are embedded in the background, one directory per job
+enrollment_queue = EnrollmentQueue(os.path.join(UPLOAD_FOLDER, 'jobs'))
+
+@app.cli.command('realign-enrollments')
+@click.option('--refresh', is_flag=True, help='Detect faces again instead of reusing the cached crops.')
+def realign_enrollments(refresh):
+    """Re-embed every student's latest enrollment photos with the current extractor backend and face preprocessing."""
+    enrollments = enrollment_queue.latest_enrollments()
+    failed = 0
+    for student_id, image_paths in enrollments.items():
+        try:
+            train_model(student_id, image_paths, get_model_directory(), refresh_faces=refresh)
+        except Exception as e:
+            logging.error(f"Re-embedding student {student_id} failed: {e}")
+            failed += 1
+    print(f"Re-embedded {len(enrollments) - failed} of {len(enrollments)} enrollments.")
+    stale = stale_enrollments(get_model_directory())
+    if stale:
+        # Their photos are gone, so they are not matched until they enroll again
+        print(f"{len(stale)} students have no enrollment photos left to re-embed: {', '.join(stale)}")
+    print(get_inference_stats(get_model_directory())['face_detection'])
+
 @app.route('/api/facial-recognition/upload', methods=['POST'])
 def upload_and_train():
     try:
@@ -528,20 +653,37 @@ def upload_and_train():
         if not images:
             return jsonify({'message': 'No images uploaded'}), 400
 
+        job_directory = enrollment_queue.create_job_directory()
         image_paths = []
-        for image in images:
-            filename = secure_filename(image.filename)
-            image_path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
+        for index, image in enumerate(images):
+            # Prefix with the position so identically named uploads don't overwrite each other
+            filename = f"{index:03d}_{secure_filename(image.filename) or 'image'}"
+            image_path = os.path.join(job_directory, filename)
             image.save(image_path)
             image_paths.append(image_path)
 
-        # Train the model with the uploaded images
-        train_model(student_id, image_paths, get_model_directory())
+        # Train the model with the uploaded images in the background
+        try:
+            job = enrollment_queue.submit(student_id, image_paths, job_directory, get_model_directory())
+        except EnrollmentQueueFull:
+            # The queue has already removed the job directory and the saved images
+            return jsonify({'message': 'Enrollment is busy, please try again shortly'}), 503, {'Retry-After': '30'}
 
-        return jsonify({'message': 'Training completed successfully'}), 200
+        return jsonify({
+            'message': 'Images uploaded, training started',
+            'job_id': job.id,
+            'status_url': url_for('get_enrollment_job', job_id=job.id)
+        }), 202
     except Exception as e:
         return jsonify({'message': str(e)}), 500
-        
+
+@app.route('/api/facial-recognition/jobs/<job_id>', methods=['GET'])
+def get_enrollment_job(job_id):
+    job = enrollment_queue.get(job_id)
+    if not job:
+        return jsonify({'message': 'Job not found'}), 404
+    return jsonify(job), 200
+
 @app.route('/api/facial-recognition/test', methods=['POST'])
 def test_recognition():
     try:
@@ -551,12 +693,8 @@ def test_recognition():
         if not student_id or not image_data:
             return jsonify({'message': 'Student ID and image data are required'}), 400
 
-        # Save the image temporarily
-        temp_image_path = os.path.join(app.config['UPLOAD_FOLDER'], secure_filename(image_data.filename))
-        image_data.save(temp_image_path)
-
-        # Pass the path of the saved image to the recognize_face function
-        result = recognize_face(temp_image_path, student_id, get_model_directory())
+        # Decode the upload straight from the request stream
+        result = recognize_face(image_data, student_id, get_model_directory())
         if result:
             return jsonify({'message': 'Face recognized successfully', 'student_id': result}), 200
         else:
@@ -564,8 +702,33 @@ def test_recognition():
     except Exception as e:
         return jsonify({'message': str(e)}), 500
 
+@app.route('/api/facial-recognition/identify', methods=['POST'])
+def identify_student():
+    try:
+        image_data = request.files.get('imageData')
+        if not image_data:
+            return jsonify({'message': 'Image data is required'}), 400
+
+        top_k = request.form.get('topK', 5, type=int)
+        matches = identify_face(image_data, get_model_directory(), top_k=top_k)
+        matches_data = [{'student_id': sid, 'similarity': score} for sid, score in matches]
+
+        if matches and matches[0][1] > SIMILARITY_THRESHOLD:
+            student = Student.query.filter_by(student_id=matches[0][0]).first()
+            return jsonify({
+                'message': 'Face identified successfully',
+                'student_id': matches[0][0],
+                'student_name': student.name if student else None,
+                'matches': matches_data
+            }), 200
+        else:
+            return jsonify({'message': 'Face not recognized', 'matches': matches_data}), 404
+    except Exception as e:
+        return jsonify({'message': str(e)}), 500
+
 @app.route('/process_attendance', methods=['POST'])
 @login_required
+@idempotent
 def process_attendance():
     logging.debug(f"Current user: {current_user}")
 
@@ -584,7 +747,7 @@ def process_attendance():
 
         if image_file and student_id and course_name:
             model_directory = get_model_directory()
-            # Use image_file for recognition, you might need to save it temporarily or read directly
+            # The upload is decoded in memory, nothing is written to disk
             recognized_id = recognize_face(image_file, student_id, model_directory)
 
             if recognized_id:
@@ -598,19 +761,14 @@ def process_attendance():
                     class_instance = Class.query.filter_by(name=course_name).first()
 
                     if class_instance:
-                        # Create attendance record
-                        attendance_record = AttendanceRecord(
-                            student_id=student.id,
-                            class_id=class_instance.id,
-                            timestamp=datetime.utcnow(),
-                            present=True
-                        )
-                        db.session.add(attendance_record)
+                        # Create attendance record and update the summary in the same transaction;
+                        # a retry for a session that is already recorded changes nothing
+                        recorded = record_attendance(student.id, class_instance.id, present=True)
                         db.session.commit()
 
                         # Fetch the student name for response
                         student_name = student.name
-                        return jsonify({'success': True, 'student_name': student_name}), 200
+                        return jsonify({'success': True, 'student_name': student_name, 'already_recorded': not recorded}), 200
                     else:
                         return jsonify({'success': False, 'error': 'Class not found.'}), 400
                 else:
@@ -623,6 +781,92 @@ def process_attendance():
         logging.error(f"Error processing attendance: {e}")
         return jsonify({'success': False, 'error': 'An error occurred while processing attendance.'}), 500
 
+# Most group photos accepted for one class session
+CLASS_SESSION_MAX_IMAGES = int(os.getenv('CLASS_SESSION_MAX_IMAGES', '10'))
+
+@app.route('/api/attendance/class-session', methods=['POST'])
+@login_required
+@idempotent
+def record_class_session():
+    """Take attendance for a whole scheduled class from one or a few group photos.
+
+    Every student of the schedule entry's cohort gets an attendance record:
+    present if their face was matched in a photo, absent otherwise. Students
+    whose enrollment was embedded differently from the group photos (stale)
+    get no record. Answers 409 when group matching is not available at all.
+    """
+    if not (current_user.is_teacher or current_user.is_admin):
+        abort(403)
+
+    entry = ScheduleEntry.query.get(request.form.get('schedule_entry_id', type=int) or 0)
+    if not entry:
+        return jsonify({'message': 'Schedule entry not found'}), 404
+    if current_user.is_teacher and not current_user.is_admin and entry.teacher_id != current_user.teacher_profile.id:
+        abort(403)
+    if not entry.department:
+        return jsonify({'message': 'This schedule entry has no cohort of students'}), 400
+
+    images = request.files.getlist('images')
+    if not images:
+        return jsonify({'message': 'No images uploaded'}), 400
+    if len(images) > CLASS_SESSION_MAX_IMAGES:
+        return jsonify({'message': f'At most {CLASS_SESSION_MAX_IMAGES} images per class session'}), 400
+
+    students = Student.query.filter_by(department=entry.department, semester=entry.semester, batch=entry.batch).all()
+    try:
+        result = match_group_faces(images, [student.student_id for student in students], get_model_directory())
+    except GroupMatchingUnavailable as e:
+        return jsonify({'message': str(e)}), 409
+    except ValueError as e:
+        return jsonify({'message': str(e)}), 400
+    if not result['faces']:
+        return jsonify({'message': 'No faces detected in the uploaded images'}), 422
+
+    schedule_str = f"{entry.day_of_week} {entry.time_start}-{entry.time_end}"
+    class_instance = Class.query.filter_by(name=entry.course_name, teacher_id=entry.teacher_id, schedule=schedule_str).first()
+    if not class_instance:
+        class_instance = Class(name=entry.course_name, teacher_id=entry.teacher_id, schedule=schedule_str)
+        db.session.add(class_instance)
+        db.session.flush()
+
+    # All records and their summary updates go in with one insert each, in one transaction
+    timestamp = datetime.utcnow()
+    report = []
+    records = []
+    for student in students:
+        match = result['students'][student.student_id]
+        # A stale enrollment cannot be compared, so it says nothing about attendance
+        if not match['stale']:
+            records.append((student.id, class_instance.id, timestamp, match['present']))
+        report.append({
+            'student_id': student.student_id,
+            'name': student.name,
+            'present': match['present'],
+            'enrolled': match['enrolled'],
+            'stale': match['stale'],
+            'similarity': match['similarity'],
+            'image': match['image'],
+        })
+    try:
+        recorded = record_attendance_bulk(records)
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        logger.error("Error recording class session: %s", e)
+        return jsonify({'message': 'Error recording attendance'}), 500
+
+    return jsonify({
+        'class_id': class_instance.id,
+        'faces': result['faces'],
+        'unmatched_faces': result['unmatched_faces'],
+        'present': sum(1 for row in report if row['present']),
+        'absent': sum(1 for row in report if not row['present'] and not row['stale']),
+        'stale': sum(1 for row in report if row['stale']),
+        'recorded': recorded,
+        'threshold': SIMILARITY_THRESHOLD,
+        'students': report,
+    }), 201
+
 @app.route('/toggle_attendance', methods=['POST'])
 @login_required
 def toggle_attendance():
@@ -640,6 +884,7 @@ def toggle_attendance():
         attendance.status = status
 
     db.session.commit()
+    bump_versions('attendance_status')
     return jsonify({'message': 'Attendance status updated successfully!', 'status': attendance.status}), 200
 
 @app.route('/edit_schedule/<int:entry_id>', methods=['GET', 'POST'])
@@ -660,11 +905,18 @@ def edit_schedule(entry_id):
         entry.course_name = data.get('course_name')
         entry.classroom = data.get('classroom')
         entry.teacher_id = data.get('teacher_id')
-        entry.department = data.get('department')
-        entry.semester = data.get('semester')
-        entry.batch = data.get('batch')
+        # The entry is shared by the whole cohort, so this one update moves every student's slot
+        has_cohort = bool(data.get('department') and data.get('semester') and data.get('batch'))
+        entry.department = data.get('department') if has_cohort else None
+        entry.semester = data.get('semester') if has_cohort else None
+        entry.batch = data.get('batch') if has_cohort else None
 
-        db.session.commit()
+        try:
+            db.session.commit()
+        except IntegrityError:
+            db.session.rollback()
+            return jsonify({'message': 'Another schedule entry already uses this slot'}), 409
+        bump_versions('schedules')
         return jsonify({'message': 'Schedule updated successfully!'}), 200
 
     # For GET request, return the current schedule details and teachers
@@ -693,43 +945,75 @@ def view_all_student_attendance():
     batch = request.args.get('batch')
     department = request.args.get('department')
     student_id = request.args.get('student_id')
+    sort = request.args.get('sort', 'id')
+    order = request.args.get('order', 'asc')
+    page = request.args.get('page', type=int)
+    per_page = min(request.args.get('per_page', 100, type=int), 500)
+
+    # One grouped query: attended/total per student summed in the database
+    attended = db.func.coalesce(db.func.sum(AttendanceSummary.attended_classes), 0)
+    total = db.func.coalesce(db.func.sum(AttendanceSummary.total_classes), 0)
+    percentage = db.case((total > 0, attended * 100 // total), else_=0)
+
+    sort_columns = {
+        'id': Student.id,
+        'student_id': Student.student_id,
+        'name': Student.name,
+        'attended': attended,
+        'total': total,
+        'percentage': percentage,
+    }
+    if sort not in sort_columns or order not in ('asc', 'desc'):
+        return jsonify({'message': 'Invalid sort or order'}), 400
+    listing = Listing(
+        {'student_id': Student.student_id, 'name': Student.name,
+         'attended': attended, 'total': total, 'percentage': percentage},
+        [(sort_columns[sort], order == 'desc'), (Student.id, False)],
+        converters={'attended': int, 'total': int, 'percentage': int},
+    )
+    query = db.session.query(*listing.entities()).outerjoin(
+        AttendanceSummary, AttendanceSummary.student_id == Student.id)
 
-    # Query for students based on provided filters
-    query = Student.query
     if semester:
-        query = query.filter_by(semester=semester)
+        query = query.filter(Student.semester == semester)
     if batch:
-        query = query.filter_by(batch=batch)
+        query = query.filter(Student.batch == batch)
     if department:
-        query = query.filter_by(department=department)
+        query = query.filter(Student.department == department)
     if student_id:
-        query = query.filter_by(student_id=student_id)
+        query = query.filter(Student.student_id == student_id)
 
-    students = query.all()
-    student_ids = [student.id for student in students]
+    if page:
+        # Offset pages and cursor pages are alternatives
+        listing.limit = listing.cursor = None
+    query = listing.apply(query.group_by(Student.id, Student.student_id, Student.name), having=True)
 
-    # Query attendance records for the filtered students
-    attendance_records = AttendanceRecord.query.filter(
-        AttendanceRecord.student_id.in_(student_ids)
-    ).all()
+    headers = {}
+    if page:
+        # Page through large cohorts; the total row count goes in a header so the body stays a list
+        headers['X-Total-Count'] = str(query.order_by(None).count())
+        query = query.limit(per_page).offset((page - 1) * per_page)
 
-    # Construct response data
-    student_data = []
-    for student in students:
-        records = [rec for rec in attendance_records if rec.student_id == student.id]
-        total_classes = len(records)
-        attended_classes = sum(rec.present for rec in records)
-        attendance_percentage = int((attended_classes / total_classes) * 100) if total_classes > 0 else 0
+    return listing.response(query, headers=headers)
 
-        student_data.append({
-            'student_id': student.student_id,
-            'name': student.name,
-            'attended': attended_classes,
-            'total': total_classes,
-            'percentage': attendance_percentage
-        })
+# Distinct semesters, batches and departments offered as report filters,
+# cached until the 'roster' resource version moves, so a student registered
+# through any worker process shows up in every worker's filters
+_student_filter_options = {'version': None, 'value': None}
 
-    return jsonify(student_data)
+def get_student_filter_options():
+    version = get_resource_versions().get('roster')
+    if _student_filter_options['value'] is None or _student_filter_options['version'] != version:
+        semesters = Student.query.with_entities(Student.semester).distinct().all()
+        batches = Student.query.with_entities(Student.batch).distinct().all()
+        departments = Student.query.with_entities(Student.department).distinct().all()
+        _student_filter_options['value'] = {
+            "semesters": [s.semester for s in semesters],
+            "batches": [b.batch for b in batches],
+            "departments": [d.department for d in departments]
+        }
+        _student_filter_options['version'] = version
+    return _student_filter_options['value']
 
 @app.route('/view_student_attendance', methods=['GET'])
 @login_required
@@ -746,66 +1030,47 @@ def view_student_attendance():
         department = request.args.get('department')
         student_id = request.args.get('student_id')
 
-        # Fetch all classes for the teacher
-        classes = Class.query.filter_by(teacher_id=teacher.id).all()
-
-        # Initialize the list to store attendance records
-        filtered_attendance_records = []
-
-        # Iterate over each class
-        for cls in classes:
-            # Fetch attendance records for the class, applying filters
-            query = AttendanceRecord.query.join(Student).filter(AttendanceRecord.class_id == cls.id)
-
-            if semester:
-                query = query.filter(Student.semester == semester)
-            if batch:
-                query = query.filter(Student.batch == batch)
-            if department:
-                query = query.filter(Student.department == department)
-            if student_id:
-                query = query.filter(Student.student_id == student_id)
-
-            records = query.all()
-
-            for record in records:
-                student = record.student
-                # Find or create the attendance summary for this student in this class
-                attendance_summary = next((item for item in filtered_attendance_records 
-                                           if item['student_id'] == student.id and item['class_name'] == cls.name), None)
-                if attendance_summary is None:
-                    attendance_summary = {
-                        'student_id': student.id,
-                        'student_name': student.name,
-                        'class_name': cls.name,
-                        'total_classes': 0,
-                        'attended_classes': 0,
-                        'student_database_id': student.student_id  # Add the actual database student_id here
-                    }
-                    filtered_attendance_records.append(attendance_summary)
-
-                # Update attendance summary
-                attendance_summary['total_classes'] += 1
-                if record.present:
-                    attendance_summary['attended_classes'] += 1
-
-        # Calculate attendance percentage for each record
-        for summary in filtered_attendance_records:
-            summary['attendance_percentage'] = (
-                (summary['attended_classes'] / summary['total_classes']) * 100 
-                if summary['total_classes'] > 0 else 0
+        # One grouped query across all of the teacher's classes, summing the
+        # per-class summaries of each student for each course name
+        query = db.session.query(
+            Student.id,
+            Student.name,
+            Student.student_id,
+            Class.name.label('class_name'),
+            db.func.sum(AttendanceSummary.total_classes).label('total_classes'),
+            db.func.sum(AttendanceSummary.attended_classes).label('attended_classes')
+        ).join(AttendanceSummary, AttendanceSummary.student_id == Student.id) \
+         .join(Class, AttendanceSummary.class_id == Class.id) \
+         .filter(Class.teacher_id == teacher.id)
+
+        if semester:
+            query = query.filter(Student.semester == semester)
+        if batch:
+            query = query.filter(Student.batch == batch)
+        if department:
+            query = query.filter(Student.department == department)
+        if student_id:
+            query = query.filter(Student.student_id == student_id)
+
+        rows = query.group_by(Student.id, Student.name, Student.student_id, Class.name) \
+                    .order_by(db.func.min(Class.id), Student.id).all()
+
+        filtered_attendance_records = [{
+            'student_id': row.id,
+            'student_name': row.name,
+            'class_name': row.class_name,
+            'total_classes': int(row.total_classes),
+            'attended_classes': int(row.attended_classes),
+            'student_database_id': row.student_id,  # Add the actual database student_id here
+            'attendance_percentage': (
+                (row.attended_classes / row.total_classes) * 100
+                if row.total_classes > 0 else 0
             )
-
-        # Optionally, you can return unique semesters, batches, and departments for filters
-        semesters = Student.query.with_entities(Student.semester).distinct().all()
-        batches = Student.query.with_entities(Student.batch).distinct().all()
-        departments = Student.query.with_entities(Student.department).distinct().all()
+        } for row in rows]
 
         return jsonify({
             "attendance_records": filtered_attendance_records,
-            "semesters": [s.semester for s in semesters],
-            "batches": [b.batch for b in batches],
-            "departments": [d.department for d in departments]
+            **get_student_filter_options()
         })
 
     except Exception as e:
@@ -821,30 +1086,24 @@ def get_student_attendance():
     if not student:
         return jsonify({'message': 'Student not found'}), 404
 
-    # Fetch attendance records for the student, including related Class data
-    attendance_records = (
-        AttendanceRecord.query
-        .filter_by(student_id=student.id)
-        .join(Class)  # Join the Class model
-        .all()
-    )
+    # Fetch the maintained attendance summaries for the student
+    summaries = AttendanceSummary.query.filter_by(student_id=student.id).all()
 
     # Create a dictionary to store course attendance data
     course_attendance = {}
     classes = Class.query.all()
     schedule_entry_map = {cls.id: cls.name for cls in classes}
 
-    for record in attendance_records:
-        course_name = schedule_entry_map.get(record.class_id, 'Unknown Course')
+    for summary in summaries:
+        course_name = schedule_entry_map.get(summary.class_id, 'Unknown Course')
         if course_name not in course_attendance:
             course_attendance[course_name] = {
                 'total_classes': 0,
                 'attended_classes': 0,
                 'batch': student.batch  # Add batch information
             }
-        course_attendance[course_name]['total_classes'] += 1
-        if record.present:
-            course_attendance[course_name]['attended_classes'] += 1
+        course_attendance[course_name]['total_classes'] += summary.total_classes
+        course_attendance[course_name]['attended_classes'] += summary.attended_classes
 
     # Calculate attendance percentage for each course
     for course, data in course_attendance.items():
@@ -893,14 +1152,28 @@ def get_attendance_calendar():
 
     return jsonify(attendance_by_date), 200
 
+STUDENT_LIST_COLUMNS = {
+    'id': Student.id,
+    'name': Student.name,
+    'student_id': Student.student_id,
+    'department': Student.department,
+    'semester': Student.semester,
+    'batch': Student.batch,
+}
+
 @app.route('/get_students', methods=['GET'])
 @login_required
+@conditional('roster')
 def get_students():
     try:
-        # Retrieve all students from the database
-        students = Student.query.all()
-        student_data = [{"id": student.id, "name": student.name, "student_id": student.student_id} for student in students]
-        return jsonify({"students": student_data}), 200
+        listing = Listing(STUDENT_LIST_COLUMNS, [(Student.id, False)], default_fields=['id', 'name', 'student_id'])
+        query = db.session.query(*listing.entities())
+        for arg in ('department', 'semester', 'batch'):
+            if request.args.get(arg):
+                query = query.filter(STUDENT_LIST_COLUMNS[arg] == request.args[arg])
+        return listing.response(listing.apply(query), envelope='students')
+    except ListingError:
+        raise
     except Exception as e:
         current_app.logger.error(f"Error fetching students: {e}")
         return jsonify({"error": "Error fetching student data"}), 500
@@ -913,6 +1186,7 @@ def toggle_manual_attendance_for_all():
         # Enable or disable manual attendance for all students
         Student.query.update({Student.manual_attendance_enabled: is_enabled})
         db.session.commit()
+        bump_versions('roster')
         return jsonify({"message": "Manual attendance updated for all students"}), 200
     except Exception as e:
         current_app.logger.error(f"Error toggling attendance for all students: {e}")
@@ -941,6 +1215,7 @@ def toggle_manual_attendance_for_selected():
             )
 
         db.session.commit()
+        bump_versions('roster')
         return jsonify({"message": "Manual attendance updated for selected students"}), 200
     except Exception as e:
         current_app.logger.error(f"Error toggling attendance for selected students: {e}")
@@ -948,6 +1223,7 @@ def toggle_manual_attendance_for_selected():
 
 @app.route('/get_student_manual_attendance_status', methods=['GET'])
 @login_required
+@conditional('roster')
 def get_student_manual_attendance_status():
     student_id = request.args.get('studentId')
     
@@ -965,6 +1241,7 @@ def get_student_manual_attendance_status():
 
 @app.route('/get_student_schedule', methods=['GET'])
 @login_required
+@conditional('schedules', 'roster', per_user=True)
 def get_student_schedule():
     if not current_user.is_registered:  # Ensure the user is a registered student
         abort(403)
@@ -1009,6 +1286,7 @@ def get_student_schedule():
 
 @app.route('/get_attendance_status', methods=['GET'])
 @login_required
+@conditional('attendance_status', 'roster')
 def get_attendance_status():
     try:
         student_id = request.args.get('studentId')
@@ -1087,17 +1365,18 @@ SCHOOL_LOCATIONS = [
 ]
 ALLOWED_RADIUS = 500  # in meters
 
+# Used while no campus site has been added through /admin/campus_sites
 app.config['SCHOOL_LOCATIONS'] = SCHOOL_LOCATIONS
 app.config['ALLOWED_RADIUS'] = ALLOWED_RADIUS
 
+# Most points accepted by one /check_locations request
+GEOFENCE_MAX_BATCH = int(os.getenv('GEOFENCE_MAX_BATCH', '1000'))
+
+def campus_geofence():
+    return get_geofence(app.config['SCHOOL_LOCATIONS'], app.config['ALLOWED_RADIUS'])
+
 def is_within_allowed_area(latitude, longitude):
-    student_coords = (latitude, longitude)
-    
-    for school_coords in app.config['SCHOOL_LOCATIONS']:
-        distance = geodesic(school_coords, student_coords).meters
-        if distance <= app.config['ALLOWED_RADIUS']:
-            return True
-    return False
+    return campus_geofence().contains(latitude, longitude)
 
 @app.route('/check_student_location', methods=['POST'])
 def check_student_location():
@@ -1110,14 +1389,94 @@ def check_student_location():
         app.logger.debug(f"Received location from frontend: Latitude = {latitude}, Longitude = {longitude}")
         
         
-        if is_within_allowed_area(latitude, longitude):
-            return jsonify({'status': 'success'})
+        site = campus_geofence().locate(latitude, longitude)
+        if site is not None:
+            return jsonify({'status': 'success', 'site': site})
         else:
             return jsonify({'status': 'error', 'message': 'You are not within the allowed area to take attendance.'})
     
     except Exception as e:
         return jsonify({'status': 'error', 'message': 'An error occurred during location verification.'}), 500
 
+@app.route('/check_locations', methods=['POST'])
+@login_required
+def check_locations():
+    """Check many points against the campus sites at once, e.g. to audit recorded locations."""
+    if not (current_user.is_teacher or current_user.is_admin):
+        abort(403)
+    locations = (request.get_json(silent=True) or {}).get('locations')
+    if not isinstance(locations, list) or not locations:
+        return jsonify({'message': 'locations must be a non-empty list'}), 400
+    if len(locations) > GEOFENCE_MAX_BATCH:
+        return jsonify({'message': f'At most {GEOFENCE_MAX_BATCH} locations per request'}), 400
+    try:
+        latitudes = [float(location['latitude']) for location in locations]
+        longitudes = [float(location['longitude']) for location in locations]
+    except (TypeError, KeyError, ValueError):
+        return jsonify({'message': 'Every location needs a numeric latitude and longitude'}), 400
+
+    sites = campus_geofence().locate_many(latitudes, longitudes)
+    return jsonify({'results': [{'within': site is not None, 'site': site} for site in sites]}), 200
+
+def campus_site_to_dict(site):
+    return {
+        'id': site.id,
+        'name': site.name,
+        'latitude': site.latitude,
+        'longitude': site.longitude,
+        'radius_meters': site.radius_meters,
+        'polygon': json.loads(site.polygon) if site.polygon else None,
+        'is_active': site.is_active,
+    }
+
+@app.route('/admin/campus_sites', methods=['GET', 'POST'])
+@login_required
+def campus_sites():
+    if not current_user.is_admin:
+        return jsonify({'error': 'Unauthorized'}), 403
+    if request.method == 'GET':
+        return jsonify([campus_site_to_dict(site) for site in CampusSite.query.order_by(CampusSite.id)]), 200
+
+    data = request.get_json(silent=True) or {}
+    name = (data.get('name') or '').strip()
+    if not name:
+        return jsonify({'message': 'name is required'}), 400
+    try:
+        if data.get('polygon') is not None:
+            vertices = parse_polygon(data['polygon'])
+            # The center is only informational for a polygon
+            latitude, longitude = (float(value) for value in vertices.mean(axis=0))
+            site = CampusSite(name=name, latitude=latitude, longitude=longitude,
+                              polygon=json.dumps(vertices.tolist()))
+        else:
+            latitude, longitude, radius = float(data['latitude']), float(data['longitude']), float(data['radius_meters'])
+            if abs(latitude) > 90 or abs(longitude) > 180 or radius <= 0:
+                raise ValueError('latitude, longitude or radius_meters is out of range')
+            site = CampusSite(name=name, latitude=latitude, longitude=longitude, radius_meters=radius)
+    except KeyError as e:
+        return jsonify({'message': f'Missing {e.args[0]}; give latitude, longitude and radius_meters, or a polygon'}), 400
+    except (TypeError, ValueError) as e:
+        return jsonify({'message': str(e)}), 400
+    site.is_active = bool(data.get('is_active', True))
+
+    db.session.add(site)
+    db.session.commit()
+    bump_versions('campus_sites')
+    return jsonify(campus_site_to_dict(site)), 201
+
+@app.route('/admin/campus_sites/<int:site_id>', methods=['DELETE'])
+@login_required
+def delete_campus_site(site_id):
+    if not current_user.is_admin:
+        return jsonify({'error': 'Unauthorized'}), 403
+    site = CampusSite.query.get(site_id)
+    if not site:
+        return jsonify({'message': 'Campus site not found'}), 404
+    db.session.delete(site)
+    db.session.commit()
+    bump_versions('campus_sites')
+    return jsonify({'message': 'Campus site deleted'}), 200
+
 mock_attendance_data = { "attendancePercentage": 85  }
 @app.route('/get-attendance', methods=['GET'])
 def get_attendance():
@@ -0,0 +1,130 @@
+from datetime import datetime
+from sqlalchemy import func, case, select, insert as generic_insert
+from flask_backend.models import db, AttendanceRecord, AttendanceSummary, dialect_insert
+
+# Rows per INSERT statement, to keep statements a reasonable size
+INSERT_CHUNK_SIZE = 1000
+
+def update_attendance_summaries(records, upgraded=()):
+    """Fold newly inserted (student_id, class_id, timestamp, present) records into the attendance summaries.
+
+    upgraded are (student_id, class_id) pairs of records that went from absent
+    to present; they count as attended without counting as another class.
+    Runs in the caller's transaction; the caller commits together with the records.
+    """
+    totals = {}
+    for student_id, class_id, timestamp, present in records:
+        total, attended, last_timestamp = totals.get((student_id, class_id), (0, 0, None))
+        totals[(student_id, class_id)] = (
+            total + 1,
+            attended + (1 if present else 0),
+            timestamp if last_timestamp is None or timestamp > last_timestamp else last_timestamp,
+        )
+    for student_id, class_id in upgraded:
+        total, attended, last_timestamp = totals.get((student_id, class_id), (0, 0, None))
+        totals[(student_id, class_id)] = (total, attended + 1, last_timestamp)
+    if not totals:
+        return
+
+    stmt = dialect_insert(AttendanceSummary).values([
+        {
+            'student_id': student_id,
+            'class_id': class_id,
+            'total_classes': total,
+            'attended_classes': attended,
+            'last_timestamp': last_timestamp,
+        }
+        for (student_id, class_id), (total, attended, last_timestamp) in totals.items()
+    ])
+    table = AttendanceSummary.__table__
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[table.c.student_id, table.c.class_id],
+        set_={
+            'total_classes': table.c.total_classes + stmt.excluded.total_classes,
+            'attended_classes': table.c.attended_classes + stmt.excluded.attended_classes,
+            'last_timestamp': case(
+                (table.c.last_timestamp.is_(None), stmt.excluded.last_timestamp),
+                (stmt.excluded.last_timestamp > table.c.last_timestamp, stmt.excluded.last_timestamp),
+                else_=table.c.last_timestamp,
+            ),
+        },
+    )
+    db.session.execute(stmt)
+
+def record_attendance_bulk(records):
+    """Record (student_id, class_id, timestamp, present) tuples, at most one per student, class and day.
+
+    A record for a session that is already recorded is skipped, except that a
+    present record turns an absent one present, so retried submissions never
+    add rows or inflate the summaries. Only what actually changed is counted
+    in the summaries. Runs in the caller's transaction; returns how many
+    records were inserted or turned present.
+    """
+    if not records:
+        return 0
+    table = AttendanceRecord.__table__
+    rows = [
+        {'student_id': student_id, 'class_id': class_id, 'timestamp': timestamp,
+         'session_date': timestamp.date(), 'present': present}
+        for student_id, class_id, timestamp, present in records
+    ]
+
+    inserted = []
+    for start in range(0, len(rows), INSERT_CHUNK_SIZE):
+        stmt = (
+            dialect_insert(AttendanceRecord).values(rows[start:start + INSERT_CHUNK_SIZE])
+            .on_conflict_do_nothing(index_elements=[table.c.student_id, table.c.class_id, table.c.session_date])
+            .returning(table.c.student_id, table.c.class_id, table.c.session_date,
+                       table.c.timestamp, table.c.present)
+        )
+        inserted.extend(db.session.execute(stmt))
+    inserted_sessions = {(student_id, class_id, session_date) for student_id, class_id, session_date, _, _ in inserted}
+
+    # Sessions already recorded as absent that this submission found the student present in
+    sessions = list({(row['student_id'], row['class_id'], row['session_date']) for row in rows
+                     if row['present']} - inserted_sessions)
+    upgraded = []
+    for start in range(0, len(sessions), INSERT_CHUNK_SIZE):
+        stmt = (
+            table.update()
+            .where(db.tuple_(table.c.student_id, table.c.class_id, table.c.session_date)
+                   .in_(sessions[start:start + INSERT_CHUNK_SIZE]),
+                   table.c.present.isnot(True))
+            .values(present=True)
+            .returning(table.c.student_id, table.c.class_id)
+        )
+        upgraded.extend(db.session.execute(stmt))
+
+    update_attendance_summaries([(student_id, class_id, timestamp, present)
+                                 for student_id, class_id, _, timestamp, present in inserted],
+                                [(student_id, class_id) for student_id, class_id in upgraded])
+    return len(inserted) + len(upgraded)
+
+def record_attendance(student_id, class_id, present=True, timestamp=None):
+    """Record one student's attendance for today's session of a class; the caller commits.
+
+    Returns False if the session was already recorded and nothing changed.
+    """
+    return record_attendance_bulk([(student_id, class_id, timestamp or datetime.utcnow(), present)]) > 0
+
+def rebuild_attendance_summaries():
+    """Recompute every attendance summary from the attendance records in one statement."""
+    db.session.query(AttendanceSummary).delete(synchronize_session=False)
+    totals = (
+        select(
+            AttendanceRecord.student_id,
+            AttendanceRecord.class_id,
+            func.count(AttendanceRecord.id),
+            func.sum(case((AttendanceRecord.present, 1), else_=0)),
+            func.max(AttendanceRecord.timestamp),
+        )
+        .group_by(AttendanceRecord.student_id, AttendanceRecord.class_id)
+    )
+    db.session.execute(
+        generic_insert(AttendanceSummary).from_select(
+            ['student_id', 'class_id', 'total_classes', 'attended_classes', 'last_timestamp'],
+            totals,
+        )
+    )
+    db.session.commit()
+    return db.session.query(func.count(AttendanceSummary.id)).scalar()
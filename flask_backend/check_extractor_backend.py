@@ -0,0 +1,26 @@
+import sys
+import json
+import glob
+import os
+from flask_backend.extractor_backends import compare_backends, EXTRACTOR_BACKENDS
+from flask_backend.facial_recognition import get_model_directory
+
+def check_backend(backend, image_directory):
+    """Compare an optimized extractor backend against the reference Keras model."""
+    image_paths = sorted(
+        path for path in glob.glob(os.path.join(image_directory, '**', '*.*'), recursive=True)
+        if path.lower().endswith(('.jpg', '.jpeg', '.png'))
+    )
+    if len(image_paths) < 2:
+        print(f"Need at least two images in {image_directory}.")
+        return False
+
+    report = compare_backends(backend, image_paths, get_model_directory())
+    print(json.dumps(report, indent=2))
+    return report['decision_agreement'] >= 0.99 and report['mixed_decision_agreement'] >= 0.99
+
+if __name__ == '__main__':
+    if len(sys.argv) != 3 or sys.argv[1] not in EXTRACTOR_BACKENDS:
+        print(f"Usage: python -m flask_backend.check_extractor_backend <{'|'.join(EXTRACTOR_BACKENDS)}> <image_directory>")
+        sys.exit(2)
+    sys.exit(0 if check_backend(sys.argv[1], sys.argv[2]) else 1)
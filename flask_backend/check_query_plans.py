@@ -0,0 +1,62 @@
+import sys
+import json
+from sqlalchemy import text
+from sqlalchemy.dialects import postgresql
+from flask_backend.models import db, Student, Teacher, Class, ScheduleEntry, AttendanceRecord, AttendanceStatus, AttendanceSummary
+
+# A Bitmap Heap Scan reads the rows a Bitmap Index Scan below it selected
+INDEX_SCANS = ('Index Scan', 'Index Only Scan', 'Bitmap Heap Scan')
+
+def hot_queries():
+    """(endpoint, table, query) for the lookups the hot endpoints run; the values are placeholders."""
+    return [
+        ('login', 'student', Student.query.filter_by(user_id=1)),
+        ('login', 'teacher', Teacher.query.filter_by(user_id=1)),
+        ('process_attendance', 'class', Class.query.filter_by(name='course')),
+        ('create_schedule', 'class', Class.query.filter_by(name='course', teacher_id=1, schedule='Monday 10:30-11:30')),
+        ('create_schedule', 'schedule_entry', ScheduleEntry.query.filter_by(
+            teacher_id=1, day_of_week='Monday', time_start='10:30', time_end='11:30')),
+        ('create_schedule', 'schedule_entry', ScheduleEntry.query.filter_by(
+            department='dept', batch='A', semester='1', day_of_week='Monday', time_start='10:30', time_end='11:30')),
+        ('get_teacher_schedule', 'schedule_entry', ScheduleEntry.query.filter_by(teacher_id=1)),
+        ('get_student_schedule', 'schedule_entry', ScheduleEntry.query.filter_by(
+            department='dept', batch='A', semester='1')),
+        ('toggle_attendance', 'attendance_status', AttendanceStatus.query.filter_by(day='mon', period='10:30-11:30')),
+        ('get_attendance_calendar', 'attendance_record', AttendanceRecord.query.filter_by(student_id=1)),
+        ('get_student_attendance', 'attendance_summary', AttendanceSummary.query.filter_by(student_id=1)),
+        ('view_student_attendance', 'class', Class.query.filter_by(teacher_id=1)),
+        ('view_student_attendance', 'attendance_summary', AttendanceSummary.query.filter_by(class_id=1)),
+    ]
+
+def plan_scans(plan):
+    """Yield (node type, relation) for every scan node of an EXPLAIN (FORMAT JSON) plan."""
+    if 'Relation Name' in plan:
+        yield plan['Node Type'], plan['Relation Name']
+    for child in plan.get('Plans', []):
+        yield from plan_scans(child)
+
+def check_query_plans():
+    """EXPLAIN each hot query and report whether it reads its table through an index.
+
+    Sequential scans are disabled for the check, so on a small development
+    database the planner still picks an index whenever a usable one exists.
+    """
+    failures = 0
+    with db.engine.connect() as conn:
+        conn.execute(text('SET enable_seqscan = off'))
+        for endpoint, table, query in hot_queries():
+            sql = str(query.statement.compile(dialect=postgresql.dialect(), compile_kwargs={'literal_binds': True}))
+            plan = conn.execute(text(f'EXPLAIN (FORMAT JSON) {sql}')).scalar()
+            if isinstance(plan, str):
+                plan = json.loads(plan)
+            scans = [node for node, relation in plan_scans(plan[0]['Plan']) if relation == table]
+            uses_index = bool(scans) and all(node in INDEX_SCANS for node in scans)
+            print(f"{'OK  ' if uses_index else 'FAIL'} {endpoint}: {table} via {', '.join(scans) or 'no scan'}")
+            if not uses_index:
+                failures += 1
+    return failures
+
+if __name__ == '__main__':
+    from flask_backend.app import app  # Import the app here to use its context
+    with app.app_context():
+        sys.exit(1 if check_query_plans() else 0)
@@ -1,5 +1,5 @@
 from flask_backend.app import db  # Keep this as is
-from flask_backend.models import User, Student, Teacher, Class, ScheduleEntry, AttendanceRecord, AttendanceStatus, FeatureToggle
+from flask_backend.models import User, Student, Teacher, Class, ScheduleEntry, AttendanceRecord, AttendanceStatus, FeatureToggle, AttendanceSummary
 
 def create_database():
     with app.app_context():  # Create an application context
@@ -0,0 +1,328 @@
+import os
+import struct
+import logging
+import threading
+from contextlib import contextmanager
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:  # Windows: only in-process locking is available
+    fcntl = None
+
+# On-disk layout of embeddings.bin:
+#   header  - magic, format version, embedding dimension, student id width,
+#             model tag width
+#   records - fixed-width (student_id, enrollment, vector[dimension], model)
+#             rows, model naming what produced the vector (see append)
+# Enrollments only ever append. A student's live rows are the ones carrying
+# their highest enrollment number; older rows stay behind until compaction.
+# Version 1 files have no model column; their rows were all embedded by the
+# reference Keras extractor from whole frames, and the file is rewritten as
+# version 2 on the next append or compaction.
+STORE_MAGIC = b'SASEMB\x00\x00'
+STORE_VERSION = 2
+SUPPORTED_VERSIONS = (1, 2)
+# Version 1 padded the header with zeros where version 2 keeps the model width
+HEADER_FORMAT = '<8sIIII40x'
+HEADER_SIZE = struct.calcsize(HEADER_FORMAT)
+STUDENT_ID_WIDTH = 64
+MODEL_WIDTH = 32
+# Model of the rows of a version 1 file
+LEGACY_MODEL = 'keras/frame'
+
+def record_dtype(dimension, id_width=STUDENT_ID_WIDTH, model_width=MODEL_WIDTH):
+    """Return the numpy dtype of one fixed-width embedding record; model_width 0 is the version 1 layout."""
+    fields = [
+        ('student_id', f'S{id_width}'),
+        ('enrollment', '<u8'),
+        ('vector', '<f4', (dimension,)),
+    ]
+    if model_width:
+        fields.append(('model', f'S{model_width}'))
+    return np.dtype(fields)
+
+class EmbeddingStore:
+    """Single-file, append-only store of every enrolled student's embeddings.
+
+    The file is memory-mapped for reads and indexed by student id in memory.
+    Appends from concurrent threads and processes are serialized with a lock
+    (plus an flock on POSIX); compaction rewrites live rows to a temporary
+    file and atomically swaps it in.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.lock_path = path + '.lock'
+        self._lock = threading.RLock()
+        self._stat_key = None
+        self._records = None
+        self._dimension = None
+        self._id_width = STUDENT_ID_WIDTH
+        self._model_width = MODEL_WIDTH
+        self._indexed_rows = 0
+        self._index = {}  # student_id -> (enrollment, [row, ...], model)
+        self.refresh()
+
+    @property
+    def dimension(self):
+        return self._dimension
+
+    @property
+    def version(self):
+        """Changes whenever the file was appended to or replaced."""
+        return self._stat_key
+
+    def __len__(self):
+        return len(self._index)
+
+    def __contains__(self, student_id):
+        return student_id in self._index
+
+    # Locking
+
+    @contextmanager
+    def _file_lock(self):
+        """Serialize writers across threads and, where flock exists, across processes."""
+        with self._lock:
+            if fcntl is None:
+                yield
+                return
+            with open(self.lock_path, 'a') as handle:
+                fcntl.flock(handle, fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    fcntl.flock(handle, fcntl.LOCK_UN)
+
+    # Reading
+
+    def _read_header(self, f):
+        header = f.read(HEADER_SIZE)
+        if len(header) < HEADER_SIZE:
+            return None
+        magic, version, dimension, id_width, model_width = struct.unpack(HEADER_FORMAT, header)
+        if magic != STORE_MAGIC:
+            raise ValueError(f"{self.path} is not an embedding store.")
+        if version not in SUPPORTED_VERSIONS:
+            raise ValueError(f"Unsupported embedding store version {version} in {self.path}.")
+        return dimension, id_width, model_width if version >= 2 else 0
+
+    def refresh(self):
+        """Pick up rows appended (or a compaction done) by this or another process."""
+        with self._lock:
+            try:
+                stat = os.stat(self.path)
+            except FileNotFoundError:
+                self._stat_key = None
+                self._records = None
+                self._indexed_rows = 0
+                self._index = {}
+                return
+            stat_key = (stat.st_ino, stat.st_size, stat.st_mtime_ns)
+            if stat_key == self._stat_key:
+                return
+
+            with open(self.path, 'rb') as f:
+                header = self._read_header(f)
+            if header is None:
+                return
+            self._dimension, self._id_width, self._model_width = header
+
+            dtype = record_dtype(self._dimension, self._id_width, self._model_width)
+            count = (stat.st_size - HEADER_SIZE) // dtype.itemsize
+            self._records = (
+                np.memmap(self.path, dtype=dtype, mode='r', offset=HEADER_SIZE, shape=(count,))
+                if count else None
+            )
+            # A new inode or a shorter file means a compaction replaced it
+            if self._stat_key is None or stat_key[0] != self._stat_key[0] or count < self._indexed_rows:
+                self._index = {}
+                self._indexed_rows = 0
+            self._index_rows(self._indexed_rows, count)
+            self._indexed_rows = count
+            self._stat_key = stat_key
+
+    def _index_rows(self, start, stop):
+        if start >= stop:
+            return
+        student_ids = self._records['student_id'][start:stop]
+        enrollments = self._records['enrollment'][start:stop]
+        if self._model_width:
+            models = self._records['model'][start:stop]
+        else:
+            models = [LEGACY_MODEL.encode()] * (stop - start)
+        for row, (raw_id, enrollment, model) in enumerate(zip(student_ids, enrollments, models), start):
+            student_id = raw_id.decode('utf-8')
+            enrollment = int(enrollment)
+            current = self._index.get(student_id)
+            if current is None or enrollment > current[0]:
+                self._index[student_id] = (enrollment, [row], model.decode('utf-8'))
+            elif enrollment == current[0]:
+                current[1].append(row)
+
+    def generation(self, student_id):
+        """Return the enrollment number of the student's live embeddings, or None."""
+        entry = self._index.get(student_id)
+        return entry[0] if entry else None
+
+    def model(self, student_id):
+        """Return the model tag the student's live embeddings were stored with, or None."""
+        entry = self._index.get(student_id)
+        return entry[2] if entry else None
+
+    def get(self, student_id):
+        """Return the student's live embeddings as a float32 array, or None if not enrolled."""
+        with self._lock:
+            entry = self._index.get(student_id)
+            if entry is None:
+                return None
+            rows = entry[1]
+            if rows[-1] - rows[0] + 1 == len(rows):
+                # One enrollment is written in a single append, so this is
+                # normally a contiguous, zero-copy slice of the mapping
+                return np.asarray(self._records['vector'][rows[0]:rows[-1] + 1])
+            return np.asarray(self._records['vector'][rows])
+
+    def items(self):
+        """Yield (student_id, embeddings) for every enrolled student."""
+        with self._lock:
+            student_ids = list(self._index)
+        for student_id in student_ids:
+            features = self.get(student_id)
+            if features is not None:
+                yield student_id, features
+
+    def generations(self):
+        """Return a snapshot of student_id -> enrollment number."""
+        with self._lock:
+            return {student_id: entry[0] for student_id, entry in self._index.items()}
+
+    def models(self):
+        """Return a snapshot of student_id -> model tag."""
+        with self._lock:
+            return {student_id: entry[2] for student_id, entry in self._index.items()}
+
+    # Writing
+
+    def _encode_id(self, student_id):
+        encoded = str(student_id).encode('utf-8')
+        if len(encoded) > self._id_width:
+            raise ValueError(f"Student ID {student_id!r} is longer than {self._id_width} bytes.")
+        return encoded
+
+    def _rewrite(self, rows):
+        """Replace the file with the given rows in the current format. Call with the file lock held."""
+        records = np.zeros(len(rows), dtype=record_dtype(self._dimension, self._id_width))
+        if len(rows):
+            source = self._records[rows]
+            for field in ('student_id', 'enrollment', 'vector'):
+                records[field] = source[field]
+            records['model'] = source['model'] if self._model_width else LEGACY_MODEL.encode()
+
+        temp_path = self.path + '.compact'
+        with open(temp_path, 'wb') as f:
+            f.write(struct.pack(HEADER_FORMAT, STORE_MAGIC, STORE_VERSION, self._dimension, self._id_width, MODEL_WIDTH))
+            f.write(records.tobytes())
+            f.flush()
+            os.fsync(f.fileno())
+        self._records = None
+        os.replace(temp_path, self.path)
+        self._stat_key = None
+        self.refresh()
+
+    def append(self, student_id, features, model):
+        """Store a new enrollment for a student, superseding any previous one. Returns its enrollment number.
+
+        model names what produced the features (extractor backend and
+        preprocessing), so readers can refuse embeddings that are not
+        comparable with the ones they compute.
+        """
+        features = np.atleast_2d(np.asarray(features, dtype=np.float32))
+        student_id = str(student_id)
+        encoded_model = model.encode('utf-8')
+        if len(encoded_model) > MODEL_WIDTH:
+            raise ValueError(f"Model tag {model!r} is longer than {MODEL_WIDTH} bytes.")
+        with self._file_lock():
+            if not os.path.exists(self.path) or os.path.getsize(self.path) < HEADER_SIZE:
+                with open(self.path, 'wb') as f:
+                    f.write(struct.pack(HEADER_FORMAT, STORE_MAGIC, STORE_VERSION, features.shape[1],
+                                        STUDENT_ID_WIDTH, MODEL_WIDTH))
+            self.refresh()
+            if features.shape[1] != self._dimension:
+                raise ValueError(f"Expected {self._dimension}-dimensional features, got {features.shape[1]}.")
+            if not self._model_width:
+                logging.info(f"Upgrading {self.path} to embedding store version {STORE_VERSION}")
+                self._rewrite(list(range(self._indexed_rows)))
+
+            dtype = record_dtype(self._dimension, self._id_width, self._model_width)
+            # Enrollment numbers only grow, so the newest enrollment always wins
+            enrollment = max((entry[0] for entry in self._index.values()), default=0) + 1
+            records = np.zeros(len(features), dtype=dtype)
+            records['student_id'] = self._encode_id(student_id)
+            records['enrollment'] = enrollment
+            records['vector'] = features
+            records['model'] = encoded_model
+
+            with open(self.path, 'r+b') as f:
+                # Drop a torn trailing record left by an interrupted write
+                f.truncate(HEADER_SIZE + self._indexed_rows * dtype.itemsize)
+                f.seek(0, os.SEEK_END)
+                f.write(records.tobytes())
+                f.flush()
+                os.fsync(f.fileno())
+            self.refresh()
+            return enrollment
+
+    def dead_rows(self):
+        """Number of superseded rows that compaction would reclaim."""
+        with self._lock:
+            live = sum(len(entry[1]) for entry in self._index.values())
+            return self._indexed_rows - live
+
+    def compact(self):
+        """Rewrite the file with only live rows and atomically replace it."""
+        with self._file_lock():
+            self.refresh()
+            if self._records is None:
+                return 0
+            live_rows = sorted(row for entry in self._index.values() for row in entry[1])
+            reclaimed = self._indexed_rows - len(live_rows)
+            if not reclaimed:
+                return 0
+
+            self._rewrite(live_rows)
+            logging.info(f"Compacted {self.path}: reclaimed {reclaimed} rows")
+            return reclaimed
+
+def import_legacy_features(store, model_directory):
+    """Append every legacy features_<student_id>.npy file to the store. Returns the number imported."""
+    imported = 0
+    for filename in sorted(os.listdir(model_directory)):
+        if filename.startswith('features_') and filename.endswith('.npy'):
+            student_id = filename[len('features_'):-len('.npy')]
+            if student_id in store:
+                continue
+            features = np.load(os.path.join(model_directory, filename))
+            if len(features):
+                store.append(student_id, features, LEGACY_MODEL)
+                imported += 1
+    if imported:
+        logging.info(f"Imported {imported} legacy feature files into {store.path}")
+    return imported
+
+_stores = {}
+_stores_lock = threading.Lock()
+
+def get_embedding_store(model_directory):
+    """Return the process-wide embedding store of a model directory, importing legacy files on first creation."""
+    with _stores_lock:
+        store = _stores.get(model_directory)
+        if store is None:
+            path = os.path.join(model_directory, 'embeddings.bin')
+            is_new = not os.path.exists(path)
+            store = EmbeddingStore(path)
+            if is_new:
+                import_legacy_features(store, model_directory)
+            _stores[model_directory] = store
+        return store
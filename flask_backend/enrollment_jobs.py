@@ -0,0 +1,186 @@
+import os
+import json
+import time
+import uuid
+import queue
+import shutil
+import logging
+import threading
+from flask_backend.facial_recognition import train_model, FACE_CACHE_SUFFIX
+
+# Number of background threads running enrollments. Kept small so that an
+# enrollment spike cannot take the CPU away from attendance recognition.
+ENROLLMENT_WORKERS = int(os.getenv('ENROLLMENT_WORKERS', '1'))
+# Jobs allowed to wait for a worker before uploads are rejected with 503
+ENROLLMENT_QUEUE_SIZE = int(os.getenv('ENROLLMENT_QUEUE_SIZE', '50'))
+# How long finished jobs stay queryable in memory, in seconds
+ENROLLMENT_JOB_RETENTION = int(os.getenv('ENROLLMENT_JOB_RETENTION', '3600'))
+
+QUEUED = 'queued'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+
+class EnrollmentQueueFull(Exception):
+    """Raised when no more enrollment jobs can be accepted right now."""
+
+class EnrollmentJob:
+    """One student's enrollment: a set of stored images waiting to be embedded."""
+
+    def __init__(self, student_id, image_paths, job_directory, model_directory):
+        self.id = os.path.basename(job_directory)
+        self.student_id = student_id
+        self.image_paths = image_paths
+        self.job_directory = job_directory
+        self.model_directory = model_directory
+        self.status = QUEUED
+        self.images_prepared = 0
+        self.images_done = 0
+        self.error = None
+        self.created_at = time.time()
+        self.finished_at = None
+
+    def to_dict(self):
+        return {
+            'job_id': self.id,
+            'student_id': self.student_id,
+            'status': self.status,
+            'images_prepared': self.images_prepared,
+            'images_done': self.images_done,
+            'images_total': len(self.image_paths),
+            'error': self.error,
+            'created_at': self.created_at,
+            'finished_at': self.finished_at,
+        }
+
+    def save_status(self):
+        """Write the job state next to its images so any worker process can report it."""
+        status_path = os.path.join(self.job_directory, 'status.json')
+        temp_path = status_path + '.tmp'
+        with open(temp_path, 'w') as f:
+            json.dump(self.to_dict(), f)
+        os.replace(temp_path, status_path)
+
+class EnrollmentQueue:
+    """Bounded queue of enrollment jobs drained by a small pool of worker threads."""
+
+    def __init__(self, jobs_directory, workers=ENROLLMENT_WORKERS, max_queued=ENROLLMENT_QUEUE_SIZE):
+        self.jobs_directory = jobs_directory
+        self.workers = workers
+        self._queue = queue.Queue(maxsize=max_queued)
+        self._jobs = {}
+        self._lock = threading.Lock()
+        self._threads = []
+
+    def _start_workers(self):
+        with self._lock:
+            if self._threads:
+                return
+            for i in range(self.workers):
+                thread = threading.Thread(target=self._work, name=f'enrollment-worker-{i}', daemon=True)
+                thread.start()
+                self._threads.append(thread)
+
+    def create_job_directory(self):
+        """Create and return a fresh directory to store a job's images in."""
+        job_directory = os.path.join(self.jobs_directory, uuid.uuid4().hex)
+        os.makedirs(job_directory)
+        return job_directory
+
+    def submit(self, student_id, image_paths, job_directory, model_directory):
+        """Queue an enrollment and return its job, or raise EnrollmentQueueFull.
+
+        A job that is turned away has its directory, images included, removed.
+        """
+        self._start_workers()
+        self._prune()
+        job = EnrollmentJob(student_id, image_paths, job_directory, model_directory)
+        job.save_status()
+        try:
+            self._queue.put_nowait(job)
+        except queue.Full:
+            shutil.rmtree(job_directory, ignore_errors=True)
+            raise EnrollmentQueueFull()
+        with self._lock:
+            self._jobs[job.id] = job
+        return job
+
+    def get(self, job_id):
+        """Return the status of a job as a dict, or None if it is unknown."""
+        with self._lock:
+            job = self._jobs.get(job_id)
+        if job is not None:
+            return job.to_dict()
+
+        # The job may have been accepted by another worker process
+        status_path = os.path.join(self.jobs_directory, os.path.basename(job_id), 'status.json')
+        try:
+            with open(status_path, 'r') as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def latest_enrollments(self):
+        """Return {student_id: image paths} of each student's most recent successful job still on disk."""
+        latest = {}
+        try:
+            job_ids = os.listdir(self.jobs_directory)
+        except FileNotFoundError:
+            return {}
+        for job_id in job_ids:
+            job_directory = os.path.join(self.jobs_directory, job_id)
+            try:
+                with open(os.path.join(job_directory, 'status.json'), 'r') as f:
+                    status = json.load(f)
+            except (OSError, ValueError):
+                continue
+            if status.get('status') != DONE:
+                continue
+            finished_at = status.get('finished_at') or 0
+            previous = latest.get(status['student_id'])
+            if previous is None or finished_at > previous[0]:
+                latest[status['student_id']] = (finished_at, job_directory)
+
+        enrollments = {}
+        for student_id, (_, job_directory) in latest.items():
+            # Uploads are stored with a numeric prefix, so sorting keeps the upload order
+            image_paths = [os.path.join(job_directory, name) for name in sorted(os.listdir(job_directory))
+                           if name != 'status.json' and not name.endswith(FACE_CACHE_SUFFIX)
+                           and not name.endswith('.tmp.png')]
+            if image_paths:
+                enrollments[student_id] = image_paths
+        return enrollments
+
+    def _prune(self):
+        cutoff = time.time() - ENROLLMENT_JOB_RETENTION
+        with self._lock:
+            for job_id in [job_id for job_id, job in self._jobs.items()
+                           if job.finished_at and job.finished_at < cutoff]:
+                del self._jobs[job_id]
+
+    def _work(self):
+        while True:
+            job = self._queue.get()
+            try:
+                self._run(job)
+            finally:
+                self._queue.task_done()
+
+    def _run(self, job):
+        job.status = RUNNING
+        job.save_status()
+
+        def report_progress(images_prepared, images_done, images_total):
+            job.images_prepared = images_prepared
+            job.images_done = images_done
+            job.save_status()
+
+        try:
+            train_model(job.student_id, job.image_paths, job.model_directory, progress_callback=report_progress)
+            job.status = DONE
+        except Exception as e:
+            logging.error(f"Enrollment job {job.id} failed: {e}", exc_info=True)
+            job.status = FAILED
+            job.error = str(e)
+        job.finished_at = time.time()
+        job.save_status()
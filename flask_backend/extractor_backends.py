@@ -0,0 +1,186 @@
+import os
+import glob
+import time
+import logging
+import threading
+import numpy as np
+from flask_backend.lazy_imports import lazy_import
+
+# Which implementation serves feature extraction:
+#   keras        - the MobileNetV2 Keras model and model.predict (reference)
+#   function     - the model exported once as a SavedModel and called as a
+#                  concrete function, skipping predict's per-call overhead
+#   tflite-fp16  - TFLite with float16 weights
+#   tflite-int8  - TFLite with int8 weights and activations, calibrated on
+#                  enrollment images
+EXTRACTOR_BACKEND = os.getenv('EXTRACTOR_BACKEND', 'keras')
+EXTRACTOR_BACKENDS = ('keras', 'function', 'tflite-fp16', 'tflite-int8')
+# Threads each TFLite interpreter may use
+TFLITE_NUM_THREADS = int(os.getenv('TFLITE_NUM_THREADS', os.getenv('INFERENCE_INTRA_OP_THREADS', '2')))
+# Images used to calibrate int8 quantization
+INT8_CALIBRATION_IMAGES = int(os.getenv('INT8_CALIBRATION_IMAGES', '100'))
+
+INPUT_SHAPE = (224, 224, 3)
+
+class ConcreteFunctionBackend:
+    """Serves embeddings from the exported SavedModel's serving function."""
+
+    name = 'function'
+
+    def __init__(self, export_path):
+        tf = lazy_import('tensorflow')
+        self._loaded = tf.saved_model.load(export_path)
+        self._function = self._loaded.signatures['serving_default']
+        self._output_key = list(self._function.structured_outputs)[0]
+
+    def predict(self, batch, batch_size=None, verbose=0):
+        tf = lazy_import('tensorflow')
+        outputs = self._function(tf.constant(batch, dtype=tf.float32))
+        return outputs[self._output_key].numpy()
+
+class TFLiteBackend:
+    """Serves embeddings from a TFLite flatbuffer, one interpreter per calling thread."""
+
+    def __init__(self, name, model_path, num_threads=TFLITE_NUM_THREADS):
+        self.name = name
+        self.model_path = model_path
+        self.num_threads = num_threads
+        # Interpreters are not thread-safe, so each thread gets its own
+        self._local = threading.local()
+
+    def _interpreter(self, batch_size):
+        interpreter = getattr(self._local, 'interpreter', None)
+        if interpreter is None:
+            tf = lazy_import('tensorflow')
+            interpreter = tf.lite.Interpreter(model_path=self.model_path, num_threads=self.num_threads)
+            self._local.interpreter = interpreter
+            self._local.batch_size = None
+        if self._local.batch_size != batch_size:
+            input_index = interpreter.get_input_details()[0]['index']
+            interpreter.resize_tensor_input(input_index, (batch_size,) + INPUT_SHAPE)
+            interpreter.allocate_tensors()
+            self._local.batch_size = batch_size
+        return interpreter
+
+    def predict(self, batch, batch_size=None, verbose=0):
+        batch = np.ascontiguousarray(batch, dtype=np.float32)
+        interpreter = self._interpreter(len(batch))
+        interpreter.set_tensor(interpreter.get_input_details()[0]['index'], batch)
+        interpreter.invoke()
+        return interpreter.get_tensor(interpreter.get_output_details()[0]['index']).copy()
+
+def export_saved_model(model, export_path):
+    """Export the Keras extractor with a batch-polymorphic float32 serving signature."""
+    tf = lazy_import('tensorflow')
+
+    @tf.function(input_signature=[tf.TensorSpec((None,) + INPUT_SHAPE, tf.float32)])
+    def serve(images):
+        return {'features': model(images, training=False)}
+
+    tf.saved_model.save(model, export_path, signatures={'serving_default': serve})
+
+def calibration_images(model_directory, limit=INT8_CALIBRATION_IMAGES):
+    """Yield preprocessed enrollment images to calibrate int8 quantization on."""
+    from flask_backend.facial_recognition import load_image_array, FACE_CACHE_SUFFIX
+
+    paths = sorted(glob.glob(os.path.join(model_directory, 'uploads', '**', '*.*'), recursive=True))
+    paths = [path for path in paths
+             if path.lower().endswith(('.jpg', '.jpeg', '.png')) and not path.endswith(FACE_CACHE_SUFFIX)][:limit]
+    if not paths:
+        logging.warning("No enrollment images found for int8 calibration, falling back to random inputs; "
+                        "run the accuracy check before serving this model.")
+        for _ in range(limit):
+            yield np.random.uniform(-1, 1, (1,) + INPUT_SHAPE).astype(np.float32)
+        return
+    for path in paths:
+        try:
+            yield np.expand_dims(load_image_array(path), axis=0)
+        except ValueError:
+            continue
+
+def export_tflite(model, model_path, quantization, model_directory):
+    """Convert the Keras extractor to a TFLite file with float16 or int8 quantization."""
+    tf = lazy_import('tensorflow')
+    converter = tf.lite.TFLiteConverter.from_keras_model(model)
+    converter.optimizations = [tf.lite.Optimize.DEFAULT]
+    if quantization == 'fp16':
+        converter.target_spec.supported_types = [tf.float16]
+    elif quantization == 'int8':
+        converter.representative_dataset = lambda: ([image] for image in calibration_images(model_directory))
+    else:
+        raise ValueError(f"Unknown quantization {quantization!r}.")
+    with open(model_path + '.tmp', 'wb') as f:
+        f.write(converter.convert())
+    os.replace(model_path + '.tmp', model_path)
+
+def create_backend(name, model_directory, rebuild=False):
+    """Return a feature extractor for the named backend, exporting the optimized model on first use."""
+    from flask_backend.facial_recognition import create_feature_extractor_model
+
+    if name not in EXTRACTOR_BACKENDS:
+        raise ValueError(f"Unknown extractor backend {name!r}, expected one of {', '.join(EXTRACTOR_BACKENDS)}.")
+    if name == 'keras':
+        return create_feature_extractor_model()
+
+    if name == 'function':
+        export_path = os.path.join(model_directory, 'mobilenetv2_savedmodel')
+        if rebuild or not os.path.exists(export_path):
+            logging.info(f"Exporting feature extractor to {export_path}")
+            export_saved_model(create_feature_extractor_model(), export_path)
+        return ConcreteFunctionBackend(export_path)
+
+    quantization = name.split('-', 1)[1]
+    model_path = os.path.join(model_directory, f'mobilenetv2_{quantization}.tflite')
+    if rebuild or not os.path.exists(model_path):
+        logging.info(f"Exporting feature extractor to {model_path}")
+        export_tflite(create_feature_extractor_model(), model_path, quantization, model_directory)
+    return TFLiteBackend(name, model_path)
+
+def _normalize(features):
+    return features / np.maximum(np.linalg.norm(features, axis=1, keepdims=True), 1e-12)
+
+def _timed_predict(model, batch):
+    """Embed images one at a time, as recognition does, and return (features, seconds per image)."""
+    model.predict(batch[:1], verbose=0)
+    start = time.perf_counter()
+    features = np.concatenate([model.predict(batch[i:i + 1], verbose=0) for i in range(len(batch))])
+    return features, (time.perf_counter() - start) / len(batch)
+
+def compare_backends(name, image_paths, model_directory, threshold=None):
+    """Check a backend against the reference Keras model on sample images.
+
+    Reports how close each image's embedding stays to the reference, how often
+    the accept/reject decision between every pair of images agrees with the
+    reference's at the recognition threshold, and per-image latency of both.
+    mixed_decision_agreement covers probes embedded by the backend against
+    enrollments embedded by the reference, which is what recognition would
+    do if the store were not re-embedded after switching backends.
+    """
+    from flask_backend.facial_recognition import preprocess_images, create_feature_extractor_model, SIMILARITY_THRESHOLD
+
+    threshold = SIMILARITY_THRESHOLD if threshold is None else threshold
+    batch = preprocess_images(image_paths)
+    reference, reference_latency = _timed_predict(create_feature_extractor_model(), batch)
+    candidate, candidate_latency = _timed_predict(create_backend(name, model_directory), batch)
+
+    reference, candidate = _normalize(reference), _normalize(candidate)
+    embedding_similarity = np.sum(reference * candidate, axis=1)
+    pairs = np.triu_indices(len(batch), k=1)
+    reference_decisions = (reference @ reference.T)[pairs] > threshold
+    candidate_decisions = (candidate @ candidate.T)[pairs] > threshold
+    # Candidate probe i against reference enrollment j, for every i and j; the
+    # diagonal is the same photo, which the reference always accepts
+    reference_mixed_decisions = (reference @ reference.T) > threshold
+    mixed_decisions = (candidate @ reference.T) > threshold
+
+    return {
+        'backend': name,
+        'images': len(batch),
+        'embedding_similarity_mean': float(embedding_similarity.mean()),
+        'embedding_similarity_min': float(embedding_similarity.min()),
+        'decision_agreement': float(np.mean(reference_decisions == candidate_decisions)) if len(pairs[0]) else 1.0,
+        'mixed_decision_agreement': float(np.mean(reference_mixed_decisions == mixed_decisions)),
+        'reference_latency_ms': reference_latency * 1000.0,
+        'backend_latency_ms': candidate_latency * 1000.0,
+        'speedup': reference_latency / candidate_latency if candidate_latency else None,
+    }
@@ -1,19 +1,22 @@
 import sys
 import io
-import tensorflow as tf
 import numpy as np
 import os
-import cv2
+import math
 import base64
 from io import BytesIO
-from PIL import Image
 import logging
 from flask import Blueprint, request, jsonify, current_app, flash, redirect, url_for, render_template
 from werkzeug.utils import secure_filename
-from sklearn.metrics.pairwise import cosine_similarity
-from tensorflow.keras.applications import MobileNetV2
-from tensorflow.keras.applications.mobilenet_v2 import preprocess_input
-import json
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from collections import OrderedDict
+from flask_backend.lazy_imports import lazy_import, IMPORT_TIMINGS
+from flask_backend.embedding_store import get_embedding_store
+from flask_backend.inference_pool import get_inference_pool, INFERENCE_POOL_SIZE
+from flask_backend.extractor_backends import create_backend, EXTRACTOR_BACKEND
+from flask_backend.micro_batcher import MicroBatcher, MICRO_BATCH_WINDOW_MS
+from flask_backend.recognition_cache import get_recognition_cache
 
 # Redirect stdout and stderr to handle encoding explicitly
 sys.stdout = io.TextIOWrapper(sys.stdout.buffer, encoding='utf-8')
@@ -32,99 +35,528 @@ def get_model_directory():
 
 model_directory = get_model_directory()
 
-def preprocess_image(img_path):
-    """Preprocess the image to be used for feature extraction."""
-    img = cv2.imread(img_path)
-    if img is None:
-        raise ValueError(f"Image at path {img_path} could not be loaded.")
+# Cosine similarity above which a face is accepted as a match
+SIMILARITY_THRESHOLD = 0.7
+
+# Memory budget of the per-student feature cache, in bytes
+FEATURE_CACHE_MAX_BYTES = int(os.getenv('FEATURE_CACHE_MAX_BYTES', str(64 * 1024 * 1024)))
+
+# Upper bound on images per forward pass when embedding a batch, to bound memory
+EMBEDDING_MAX_BATCH_SIZE = int(os.getenv('EMBEDDING_MAX_BATCH_SIZE', '32'))
+# Threads used to decode and resize images in parallel (cv2 releases the GIL)
+EMBEDDING_DECODE_WORKERS = int(os.getenv('EMBEDDING_DECODE_WORKERS', '4'))
+# Enrollment images are embedded in passes of this many, as soon as they are decoded,
+# so progress moves with every few images rather than once at the end
+ENROLLMENT_EMBED_CHUNK = int(os.getenv('ENROLLMENT_EMBED_CHUNK', '4'))
+
+# TensorFlow, OpenCV and the rest of the ML stack are imported on first use
+# (see lazy_import) so routes that never touch recognition, the flask CLI and
+# create_db.py start without paying for them.
+
+def preprocess_input(img):
+    """Scale pixels to [-1, 1], as tensorflow.keras.applications.mobilenet_v2.preprocess_input does."""
+    return img / 127.5 - 1.0
+
+def prepare_image_array(img):
+    """Resize and color-convert a decoded BGR image to a 224x224x3 float32 array."""
+    cv2 = lazy_import('cv2')
     img = cv2.resize(img, (224, 224))
     img = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
-    img = np.expand_dims(img, axis=0)
-    img = preprocess_input(img)
-    return img
+    return preprocess_input(img.astype(np.float32))
+
+def load_image_array(img_path):
+    """Read an image from disk, keep just its face, and prepare it for feature extraction."""
+    img = lazy_import('cv2').imread(img_path)
+    if img is None:
+        raise ValueError(f"Image at path {img_path} could not be loaded.")
+    return prepare_image_array(extract_face(img) if FACE_DETECTION else img)
+
+def load_enrollment_array(img_path, refresh=False):
+    """Like load_image_array, but reusing the face crop cached next to the image."""
+    if not FACE_DETECTION:
+        return load_image_array(img_path)
+    return prepare_image_array(load_enrollment_face(img_path, refresh))
+
+def preprocess_images(img_paths, loader=load_image_array):
+    """Decode and preprocess several images in parallel into one (N, 224, 224, 3) tensor.
+
+    Face detection runs in the same threads; pass loader=load_enrollment_array
+    to reuse and write the cached face crops of enrollment images.
+    """
+    if len(img_paths) == 1 or EMBEDDING_DECODE_WORKERS <= 1:
+        arrays = [loader(path) for path in img_paths]
+    else:
+        with ThreadPoolExecutor(max_workers=min(EMBEDDING_DECODE_WORKERS, len(img_paths))) as executor:
+            arrays = list(executor.map(loader, img_paths))
+    return np.stack(arrays)
 
-def get_feature_vector(model, img_path):
-    """Extract features from the image using the given model."""
-    img = preprocess_image(img_path)
-    features = model.predict(img)
-    return features.flatten()
+def embed_batch(model, batch, max_batch_size=None):
+    """Run batched forward passes over a preprocessed tensor, at most max_batch_size images at a time."""
+    max_batch_size = max_batch_size or EMBEDDING_MAX_BATCH_SIZE
+    features = []
+    for start in range(0, len(batch), max_batch_size):
+        features.append(model.predict(batch[start:start + max_batch_size], batch_size=max_batch_size, verbose=0))
+    return np.concatenate(features, axis=0)
 
 def create_feature_extractor_model():
     """Create and return a MobileNetV2 feature extractor model."""
-    model = MobileNetV2(weights='imagenet', include_top=False, pooling='avg')
+    applications = lazy_import('tensorflow.keras.applications')
+    model = applications.MobileNetV2(weights='imagenet', include_top=False, pooling='avg')
     return model
 
-def train_model(student_id, images, model_directory):
+# Process-wide feature extractor shared by training and recognition.
+# Building MobileNetV2 and loading its weights takes seconds, so it is done
+# once per process (at startup or on first use) instead of once per image.
+_feature_extractor = None
+_feature_extractor_lock = threading.Lock()
+
+def warm_up_feature_extractor(model):
+    """Run one dummy inference so the predict graph is built before real traffic."""
+    dummy = np.zeros((1, 224, 224, 3), dtype=np.float32)
+    model.predict(dummy, verbose=0)
+
+def load_feature_extractor(reload=False):
+    """Build and warm up the shared feature extractor, replacing any loaded one if reload is set."""
+    global _feature_extractor
+    with _feature_extractor_lock:
+        if _feature_extractor is None or reload:
+            logging.info(f"Loading MobileNetV2 feature extractor ({EXTRACTOR_BACKEND} backend)")
+            model = create_backend(EXTRACTOR_BACKEND, model_directory)
+            warm_up_feature_extractor(model)
+            # Swap in the new model only once it is warmed up, so requests
+            # already holding the old one finish against a fully built graph.
+            _feature_extractor = model
+        return _feature_extractor
+
+def get_feature_extractor():
+    """Return the shared feature extractor, loading it lazily on first use."""
+    model = _feature_extractor
+    if model is None:
+        model = load_feature_extractor()
+    return model
+
+def reload_feature_extractor():
+    """Rebuild the shared feature extractor, e.g. after the weights on disk changed."""
+    # Results embedded with the old weights must not be reused
+    get_recognition_cache().clear()
+    pool = get_inference_pool()
+    if pool is not None:
+        pool.restart()
+        return None
+    return load_feature_extractor(reload=True)
+
+def start_inference():
+    """Load the extractor up front: in the inference worker pool if one is configured, else in-process."""
+    pool = get_inference_pool()
+    if pool is not None:
+        pool.start()
+    else:
+        load_feature_extractor()
+
+def embed_now(batch):
+    """Run one forward pass over a tensor on the inference pool if configured, else in-process."""
+    pool = get_inference_pool()
+    if pool is None:
+        return embed_batch(get_feature_extractor(), batch)
+    return pool.embed(batch)
+
+_micro_batcher = None
+_micro_batcher_lock = threading.Lock()
+
+def get_micro_batcher():
+    """Return the process-wide micro-batcher, or None if MICRO_BATCH_WINDOW_MS is 0."""
+    global _micro_batcher
+    if MICRO_BATCH_WINDOW_MS <= 0:
+        return None
+    with _micro_batcher_lock:
+        if _micro_batcher is None:
+            # One dispatcher per inference worker keeps all of them busy
+            _micro_batcher = MicroBatcher(embed_now, dispatchers=INFERENCE_POOL_SIZE)
+        return _micro_batcher
+
+def extract_features(batch):
+    """Embed a preprocessed (N, 224, 224, 3) tensor.
+
+    Small requests such as a single attendance photo go through the
+    micro-batcher so concurrent requests share a forward pass; large ones
+    (group photos) run in chunks of EMBEDDING_MAX_BATCH_SIZE.
+    """
+    batcher = get_micro_batcher()
+    if batcher is not None and len(batch) <= batcher.max_batch_size:
+        return batcher.embed(batch)
+
+    features = []
+    for start in range(0, len(batch), EMBEDDING_MAX_BATCH_SIZE):
+        features.append(embed_now(batch[start:start + EMBEDDING_MAX_BATCH_SIZE]))
+    return np.concatenate(features, axis=0)
+
+def embed_images(img_paths, loader=load_image_array, progress_callback=None, chunk_size=None):
+    """Decode images in parallel and embed them in passes of chunk_size as they become ready.
+
+    Decoding of later images overlaps with the forward passes of earlier
+    ones. progress_callback, if given, is called with (images_prepared,
+    images_embedded, images_total) after every image decoded and every pass.
+    Enrollments bypass the micro-batcher so they do not hold up recognition.
+    """
+    chunk_size = max(1, min(chunk_size or ENROLLMENT_EMBED_CHUNK, EMBEDDING_MAX_BATCH_SIZE))
+    total = len(img_paths)
+    pending = []
+    features = []
+    embedded = 0
+    with ThreadPoolExecutor(max_workers=max(1, min(EMBEDDING_DECODE_WORKERS, total))) as executor:
+        # Collected in order, so every pass covers the next contiguous images
+        for prepared, future in enumerate([executor.submit(loader, path) for path in img_paths], start=1):
+            pending.append(future.result())
+            if progress_callback:
+                progress_callback(prepared, embedded, total)
+            if len(pending) == chunk_size or prepared == total:
+                features.append(embed_now(np.stack(pending)))
+                embedded += len(pending)
+                pending = []
+                if progress_callback:
+                    progress_callback(prepared, embedded, total)
+    return np.concatenate(features, axis=0)
+
+def embedding_model():
+    """Tag of what produces embeddings in this process, stored with every enrollment.
+
+    It is "<extractor backend>/<face|frame>": vectors of different backends,
+    or of face crops and whole frames, are not comparable, so enrollments
+    stored under another tag are not matched against.
+    """
+    return f"{EXTRACTOR_BACKEND}/{'face' if FACE_DETECTION else 'frame'}"
+
+def stale_enrollments(model_directory):
+    """Return the ids of students whose stored enrollment was embedded with another model."""
+    store = get_embedding_store(model_directory)
+    store.refresh()
+    current = embedding_model()
+    return sorted(student_id for student_id, model in store.models().items() if model != current)
+
+def get_inference_stats(model_directory):
+    """Return counters describing the recognition pipeline."""
+    feature_store = get_feature_store(model_directory)
+    batcher = get_micro_batcher()
+    pool = get_inference_pool()
+    return {
+        'micro_batching': batcher.stats() if batcher is not None else None,
+        'feature_cache': {'hits': feature_store.hits, 'misses': feature_store.misses},
+        'recognition_cache': get_recognition_cache().stats(),
+        'inference_pool_size': pool.size if pool is not None else 0,
+        'extractor_backend': EXTRACTOR_BACKEND,
+        'embedding_model': embedding_model(),
+        'stale_enrollments': len(stale_enrollments(model_directory)),
+        'face_detection': get_face_stats(),
+        'import_seconds': dict(IMPORT_TIMINGS),
+    }
+
+def l2_normalize(features):
+    """Return float32 row vectors scaled to unit length, so dot products are cosine similarities."""
+    features = np.atleast_2d(np.asarray(features, dtype=np.float32))
+    norms = np.linalg.norm(features, axis=1, keepdims=True)
+    return features / np.maximum(norms, 1e-12)
+
+class GalleryIndex:
+    """In-memory index of every enrolled student's embeddings for 1:N identification.
+
+    All embeddings live L2-normalized in one contiguous float32 matrix with a
+    parallel row -> student id array, so a search is one matrix-vector product
+    followed by a top-k selection.
+    """
+
+    def __init__(self, dimension=None, initial_capacity=1024):
+        self._lock = threading.RLock()
+        self._dimension = dimension
+        self._capacity = initial_capacity
+        self._matrix = None
+        self._row_students = np.empty(0, dtype=object)
+        self._size = 0
+        self._generations = {}
+        self._store_version = None
+
+    def __len__(self):
+        return self._size
+
+    @property
+    def student_ids(self):
+        with self._lock:
+            return set(self._row_students[:self._size])
+
+    def _reserve(self, extra_rows):
+        """Grow the backing matrix geometrically so appends stay amortized O(rows added)."""
+        needed = self._size + extra_rows
+        if self._matrix is not None and needed <= len(self._matrix):
+            return
+        capacity = max(self._capacity, needed)
+        if self._matrix is not None:
+            capacity = max(capacity, 2 * len(self._matrix))
+        matrix = np.empty((capacity, self._dimension), dtype=np.float32)
+        row_students = np.empty(capacity, dtype=object)
+        if self._matrix is not None:
+            matrix[:self._size] = self._matrix[:self._size]
+            row_students[:self._size] = self._row_students[:self._size]
+        self._matrix = matrix
+        self._row_students = row_students
+
+    def remove(self, student_id):
+        """Drop all rows belonging to a student."""
+        with self._lock:
+            if not self._size:
+                return
+            keep = self._row_students[:self._size] != student_id
+            kept = int(keep.sum())
+            if kept == self._size:
+                return
+            self._matrix[:kept] = self._matrix[:self._size][keep]
+            self._row_students[:kept] = self._row_students[:self._size][keep]
+            self._row_students[kept:self._size] = None
+            self._size = kept
+
+    def add(self, student_id, features, generation=None):
+        """Insert or replace a student's embeddings."""
+        features = l2_normalize(features)
+        with self._lock:
+            if self._dimension is None:
+                self._dimension = features.shape[1]
+            elif features.shape[1] != self._dimension:
+                raise ValueError(f"Expected {self._dimension}-dimensional features, got {features.shape[1]}.")
+            self.remove(student_id)
+            self._reserve(len(features))
+            self._matrix[self._size:self._size + len(features)] = features
+            self._row_students[self._size:self._size + len(features)] = student_id
+            self._size += len(features)
+            self._generations[student_id] = generation
+
+    def search(self, query, top_k=5):
+        """Return up to top_k (student_id, similarity) pairs, best first, one entry per student."""
+        query = l2_normalize(query)[0]
+        with self._lock:
+            if not self._size:
+                return []
+            scores = self._matrix[:self._size] @ query
+            row_students = self._row_students[:self._size]
+
+        # A student has several enrollment photos; over-fetch rows so that
+        # collapsing them to one score per student still leaves top_k students.
+        candidates = min(len(scores), top_k * 32)
+        if candidates < len(scores):
+            rows = np.argpartition(-scores, candidates - 1)[:candidates]
+        else:
+            rows = np.arange(len(scores))
+        rows = rows[np.argsort(-scores[rows])]
+
+        results = []
+        seen = set()
+        for row in rows:
+            student_id = row_students[row]
+            if student_id in seen:
+                continue
+            seen.add(student_id)
+            results.append((student_id, float(scores[row])))
+            if len(results) == top_k:
+                break
+        return results
+
+    def sync(self, store, model):
+        """Bring the index up to date with enrollments appended to the store, e.g. by other workers.
+
+        Students whose live enrollment was stored under another model tag are left out.
+        """
+        with self._lock:
+            if store.version == self._store_version:
+                return
+            generations = store.generations()
+            models = store.models()
+            for student_id, generation in generations.items():
+                if self._generations.get(student_id) == generation:
+                    continue
+                if models.get(student_id) != model:
+                    self.remove(student_id)
+                    self._generations[student_id] = generation
+                    continue
+                features = store.get(student_id)
+                if features is not None and len(features):
+                    self.add(student_id, features, generation)
+            self._store_version = store.version
+
+_gallery_index = None
+_gallery_index_lock = threading.Lock()
+
+def get_gallery_index(model_directory):
+    """Return the process-wide gallery index, building it on first use and syncing it with the store."""
+    global _gallery_index
+    store = get_embedding_store(model_directory)
+    store.refresh()
+    if _gallery_index is None:
+        with _gallery_index_lock:
+            if _gallery_index is None:
+                index = GalleryIndex(dimension=store.dimension)
+                index.sync(store, embedding_model())
+                logging.info(f"Loaded gallery index with {len(index)} embeddings of {len(index.student_ids)} students")
+                _gallery_index = index
+    _gallery_index.sync(store, embedding_model())
+    return _gallery_index
+
+class FeatureStore:
+    """LRU cache of per-student embeddings read from the memory-mapped embedding store.
+
+    Entries are kept L2-normalized and evicted least-recently-used first once
+    their total size exceeds max_bytes. Each entry remembers the enrollment
+    number it came from, so a re-enrollment written by any worker process is
+    picked up on the next lookup. Enrollments stored under another model tag
+    (see embedding_model) are refused like missing ones.
+    """
+
+    def __init__(self, model_directory, max_bytes=FEATURE_CACHE_MAX_BYTES):
+        self.store = get_embedding_store(model_directory)
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def invalidate(self, student_id):
+        """Forget the cached embeddings of one student."""
+        with self._lock:
+            entry = self._entries.pop(student_id, None)
+            if entry is not None:
+                self._bytes -= entry[0].nbytes
+
+    def get(self, student_id):
+        """Return the student's normalized embeddings, or None if they are not enrolled."""
+        self.store.refresh()
+        generation = self.store.generation(student_id)
+        if generation is None:
+            self.invalidate(student_id)
+            return None
+        model = self.store.model(student_id)
+        if model != embedding_model():
+            self.invalidate(student_id)
+            logging.warning(f"Enrollment of student {student_id} was embedded with {model!r}, not {embedding_model()!r}; "
+                            "re-embed it with `flask realign-enrollments` or enroll the student again.")
+            return None
+
+        with self._lock:
+            entry = self._entries.get(student_id)
+            if entry is not None and entry[1] == generation:
+                self._entries.move_to_end(student_id)
+                self.hits += 1
+                return entry[0]
+            self.misses += 1
+
+        # Rows are read through the mapping; only the normalized copy is kept
+        features = l2_normalize(self.store.get(student_id))
+        features.setflags(write=False)
+        self.put(student_id, features, generation)
+        return features
+
+    def put(self, student_id, features, generation):
+        with self._lock:
+            previous = self._entries.pop(student_id, None)
+            if previous is not None:
+                self._bytes -= previous[0].nbytes
+            if features.nbytes > self.max_bytes:
+                return
+            self._entries[student_id] = (features, generation)
+            self._bytes += features.nbytes
+            while self._bytes > self.max_bytes:
+                _, (evicted, _) = self._entries.popitem(last=False)
+                self._bytes -= evicted.nbytes
+
+_feature_stores = {}
+_feature_stores_lock = threading.Lock()
+
+def get_feature_store(model_directory):
+    """Return the process-wide feature store for a model directory."""
+    with _feature_stores_lock:
+        store = _feature_stores.get(model_directory)
+        if store is None:
+            store = _feature_stores[model_directory] = FeatureStore(model_directory)
+        return store
+
+def train_model(student_id, images, model_directory, progress_callback=None, refresh_faces=False):
     logging.debug(f"student_id in train model: {student_id}")
 
-    # Create label mapping
-    student_ids = list(set([student_id]))  # This is for the current student; adapt if handling multiple students
-    label_mapping = {id: idx for idx, id in enumerate(student_ids)}
-
-    # Save label mapping to a file
-    label_mapping_path = os.path.join(model_directory, 'label_mapping.json')
-    with open(label_mapping_path, 'w') as f:
-        json.dump(label_mapping, f)
-
-    # Preprocess images
-    processed_images = []
-    labels = []
-    for image in images:
-        # Ensure image is a path
-        img_path = image
+    # Ensure every image is a path
+    for img_path in images:
         if not isinstance(img_path, str):
             raise TypeError(f"Expected img_path to be a string, got {type(img_path).__name__}.")
-        # Convert image to feature vector
-        features = get_feature_vector(create_feature_extractor_model(), img_path)
-        processed_images.append(features)
-        labels.append(label_mapping[student_id])  # Use numeric label
 
-    processed_images = np.array(processed_images)
-    labels = np.array(labels)
+    # Convert all images' faces to feature vectors, reporting progress image by image
+    loader = lambda path: load_enrollment_array(path, refresh=refresh_faces)
+    processed_images = embed_images(images, loader=loader, progress_callback=progress_callback)
+
+    # Append the features to the consolidated store, superseding any earlier enrollment
+    generation = get_embedding_store(model_directory).append(student_id, processed_images, embedding_model())
+    get_feature_store(model_directory).invalidate(student_id)
+
+    # Keep the in-memory gallery (if loaded) in step with what was just enrolled
+    if _gallery_index is not None:
+        _gallery_index.add(student_id, processed_images, generation)
 
-    # Save the features
-    features_path = os.path.join(model_directory, f"features_{student_id}.npy")
-    np.save(features_path, processed_images)
-    
     return True
 
-def load_and_preprocess_image(img_path):
-    """Load and preprocess the image from the file path."""
-    try:
-        img = Image.open(img_path)
-        
-        # Save image to a temporary file if needed
-        img_path_temp = os.path.join(model_directory, 'temp_image.jpg')
-        img.save(img_path_temp)
-        
-        return img_path_temp
-    except Exception as e:
-        logging.error(f"Error during image preprocessing: {str(e)}", exc_info=True)
-        raise e
+def read_image_bytes(image_data):
+    """Return the raw encoded bytes of an image given as a path, bytes-like object or file-like upload."""
+    if isinstance(image_data, str):
+        with open(image_data, 'rb') as f:
+            return f.read()
+    if isinstance(image_data, (bytes, bytearray, memoryview)):
+        return image_data
+    # werkzeug FileStorage and other file-like objects
+    return image_data.read()
+
+def decode_image(data):
+    """Decode encoded image bytes in memory into a BGR image."""
+    buffer = np.frombuffer(data, dtype=np.uint8)
+    cv2 = lazy_import('cv2')
+    img = cv2.imdecode(buffer, cv2.IMREAD_COLOR) if buffer.size else None
+    if img is None:
+        raise ValueError("Uploaded image data could not be decoded.")
+    return img
+
+def decode_image_bytes(data):
+    """Decode encoded image bytes in memory, keep just the face, and prepare them for feature extraction."""
+    img = decode_image(data)
+    return prepare_image_array(extract_face(img) if FACE_DETECTION else img)
+
+def preprocess_image_data(image_data):
+    """Turn an uploaded image into a (1, 224, 224, 3) tensor without touching the filesystem."""
+    return np.expand_dims(decode_image_bytes(read_image_bytes(image_data)), axis=0)
+
+def recognition_model_version(model_directory, student_id):
+    """What a recognition result depends on besides the image: the extractor, the preprocessing and the enrollment."""
+    generation = get_embedding_store(model_directory).generation(student_id)
+    return f"{embedding_model()}:{generation}"
 
 def recognize_face(image_data, student_id, model_directory):
     logging.debug(f"student_id in recognize face: {student_id}")
     """Load model and make predictions."""
     
-    model = create_feature_extractor_model()
-    features_path = os.path.join(model_directory, f"features_{student_id}.npy")
-    label_mapping_path = os.path.join(model_directory, 'label_mapping.json')
+    known_person_features = get_feature_store(model_directory).get(student_id)
 
-    if not os.path.exists(features_path):
-        logging.error(f"Features not found at {features_path}. Please train the model first.")
+    if known_person_features is None:
+        logging.error(f"Features not found for student {student_id}. Please train the model first.")
         return None
 
     try:
-        # Load label mapping
-        with open(label_mapping_path, 'r') as f:
-            label_mapping = json.load(f)
-
-        known_person_features = np.load(features_path)
-        test_img_path = load_and_preprocess_image(image_data)
-        test_features = get_feature_vector(model, test_img_path)
-        
-        similarities = cosine_similarity([test_features], known_person_features)
-        if np.max(similarities) > 0.7:  # Adjust threshold as needed
+        data = read_image_bytes(image_data)
+        # A resubmitted photo is answered from the cache; a re-enrollment changes the key
+        cache = get_recognition_cache()
+        cache_key = cache.key(data, student_id, recognition_model_version(model_directory, student_id))
+        cached = cache.get(cache_key)
+        if cached is not None:
+            similarity = cached[1]
+        else:
+            test_img = np.expand_dims(decode_image_bytes(data), axis=0)
+            test_features = l2_normalize(extract_features(test_img))[0]
+
+            # Both sides are unit length, so the dot products are cosine similarities
+            similarity = float(np.max(known_person_features @ test_features))
+            cache.put(cache_key, test_features, similarity)
+
+        if similarity > SIMILARITY_THRESHOLD:
             return student_id
         else:
             return None
@@ -132,3 +564,238 @@ def recognize_face(image_data, student_id, model_directory):
         error_message = f"Prediction error: {str(e)}"
         logging.error(error_message, exc_info=True)
         raise e
+
+def identify_face(image_data, model_directory, top_k=5):
+    """Search the whole gallery for an uploaded face and return the best (student_id, similarity) matches."""
+    test_img = preprocess_image_data(image_data)
+    test_features = extract_features(test_img)
+    return get_gallery_index(model_directory).search(test_features, top_k=top_k)
+
+# Smallest face, in pixels, looked for in a group photo
+FACE_MIN_SIZE = int(os.getenv('FACE_MIN_SIZE', '40'))
+# Border kept around a detected face when cropping it, as a fraction of its size
+FACE_CROP_MARGIN = float(os.getenv('FACE_CROP_MARGIN', '0.2'))
+
+# Crop, align and embed only the face in enrollment and attendance photos.
+# Turning this on or off changes every embedding: enrollments stored with
+# the other setting are ignored until re-embedded with
+# `flask realign-enrollments`.
+FACE_DETECTION = os.getenv('FACE_DETECTION', '0') == '1'
+# Longest side, in pixels, a single-face photo is searched for its face at
+FACE_DETECTION_MAX_SIDE = int(os.getenv('FACE_DETECTION_MAX_SIDE', '640'))
+# Faces rolled further than this, in degrees, are left as detected
+FACE_MAX_ROLL = float(os.getenv('FACE_MAX_ROLL', '30'))
+# Suffix of the aligned face crop cached next to each enrollment image
+FACE_CACHE_SUFFIX = '.face.png'
+
+_face_detectors = threading.local()
+_face_stats = {'detected': 0, 'not_detected': 0, 'aligned': 0, 'cached': 0}
+_face_stats_lock = threading.Lock()
+
+def _cascade(name, filename):
+    """Return this thread's copy of one of OpenCV's bundled Haar cascades; they are not safe to share between threads."""
+    detector = getattr(_face_detectors, name, None)
+    if detector is None:
+        cv2 = lazy_import('cv2')
+        detector = cv2.CascadeClassifier(os.path.join(cv2.data.haarcascades, filename))
+        if detector.empty():
+            raise RuntimeError(f"OpenCV's {filename} cascade could not be loaded.")
+        setattr(_face_detectors, name, detector)
+    return detector
+
+def get_face_detector():
+    """Return this thread's frontal face detector."""
+    return _cascade('face', 'haarcascade_frontalface_default.xml')
+
+def get_eye_detector():
+    """Return this thread's eye detector, used to level faces before they are embedded."""
+    return _cascade('eye', 'haarcascade_eye.xml')
+
+def detect_faces(img, min_size=FACE_MIN_SIZE, max_side=None):
+    """Return the (x, y, w, h) boxes of the frontal faces in a BGR image, largest first.
+
+    With max_side, larger images are searched at that size and the boxes
+    scaled back, which bounds the cost of detection on full-resolution photos.
+    """
+    cv2 = lazy_import('cv2')
+    gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+    scale = 1.0
+    if max_side and max(gray.shape) > max_side:
+        scale = max(gray.shape) / max_side
+        gray = cv2.resize(gray, (round(gray.shape[1] / scale), round(gray.shape[0] / scale)), interpolation=cv2.INTER_AREA)
+        min_size = max(20, round(min_size / scale))
+    gray = cv2.equalizeHist(gray)
+    faces = get_face_detector().detectMultiScale(gray, scaleFactor=1.1, minNeighbors=5, minSize=(min_size, min_size))
+    boxes = [tuple(int(round(v * scale)) for v in face) for face in faces]
+    return sorted(boxes, key=lambda box: box[2] * box[3], reverse=True)
+
+def crop_face(img, box, margin=FACE_CROP_MARGIN):
+    """Cut a detected face out of an image, with some margin, clipped to the image."""
+    x, y, w, h = box
+    dx, dy = int(w * margin), int(h * margin)
+    return img[max(0, y - dy):y + h + dy, max(0, x - dx):x + w + dx]
+
+def find_eyes(img, box):
+    """Return the (left, right) eye centers of a detected face in image coordinates, or None if not both are found."""
+    cv2 = lazy_import('cv2')
+    x, y, w, h = box
+    # Eyes sit in the upper half of the box; searching only there avoids nostrils and mouth corners
+    region = cv2.equalizeHist(cv2.cvtColor(img[y:y + h * 11 // 20, x:x + w], cv2.COLOR_BGR2GRAY))
+    min_eye = max(8, w // 8)
+    eyes = get_eye_detector().detectMultiScale(region, scaleFactor=1.1, minNeighbors=5, minSize=(min_eye, min_eye))
+    if len(eyes) < 2:
+        return None
+    eyes = sorted(eyes, key=lambda eye: eye[2] * eye[3], reverse=True)[:2]
+    (lx, ly), (rx, ry) = sorted((x + ex + ew / 2, y + ey + eh / 2) for ex, ey, ew, eh in eyes)
+    if rx - lx < w * 0.2:
+        return None
+    return (lx, ly), (rx, ry)
+
+def align_face(img, box, margin=FACE_CROP_MARGIN):
+    """Crop a detected face and rotate it so the eyes are level.
+
+    The face is returned as crop_face would if its eyes cannot be found or
+    the roll is implausibly large, which is usually a false eye detection.
+    """
+    crop = crop_face(img, box, margin)
+    eyes = find_eyes(img, box)
+    if eyes is None:
+        return crop
+    (lx, ly), (rx, ry) = eyes
+    angle = math.degrees(math.atan2(ry - ly, rx - lx))
+    if abs(angle) < 1 or abs(angle) > FACE_MAX_ROLL:
+        return crop
+    cv2 = lazy_import('cv2')
+    x, y, w, h = box
+    # Rotate around the point between the eyes, in the crop's coordinates
+    left, top = max(0, x - int(w * margin)), max(0, y - int(h * margin))
+    center = ((lx + rx) / 2 - left, (ly + ry) / 2 - top)
+    rotation = cv2.getRotationMatrix2D(center, angle, 1.0)
+    with _face_stats_lock:
+        _face_stats['aligned'] += 1
+    return cv2.warpAffine(crop, rotation, (crop.shape[1], crop.shape[0]), flags=cv2.INTER_LINEAR,
+                          borderMode=cv2.BORDER_REPLICATE)
+
+def extract_face(img):
+    """Return the largest face of an image, cropped and aligned, or the whole image if none is found.
+
+    Embedding just the face keeps background and framing out of the vector.
+    Falling back to the whole image keeps photos that are already tight crops,
+    or where the detector misses the face, working as before.
+    """
+    boxes = detect_faces(img, max_side=FACE_DETECTION_MAX_SIDE)
+    with _face_stats_lock:
+        _face_stats['detected' if boxes else 'not_detected'] += 1
+    if not boxes:
+        return img
+    return align_face(img, boxes[0])
+
+def face_cache_path(img_path):
+    """Where the aligned face of an enrollment image is kept, next to the image."""
+    return os.path.splitext(img_path)[0] + FACE_CACHE_SUFFIX
+
+def load_enrollment_face(img_path, refresh=False):
+    """Read an enrollment image's aligned face, from its cached crop when that is up to date.
+
+    The crop is written on first use, so re-embedding an enrollment (after a
+    model change, say) skips detection. Images without a detectable face are
+    not cached and are embedded whole.
+    """
+    cv2 = lazy_import('cv2')
+    cache_path = face_cache_path(img_path)
+    if not refresh:
+        try:
+            if os.path.getmtime(cache_path) >= os.path.getmtime(img_path):
+                face = cv2.imread(cache_path)
+                if face is not None:
+                    with _face_stats_lock:
+                        _face_stats['cached'] += 1
+                    return face
+        except OSError:
+            pass
+
+    img = cv2.imread(img_path)
+    if img is None:
+        raise ValueError(f"Image at path {img_path} could not be loaded.")
+    face = extract_face(img)
+    if face is not img:
+        temp_path = cache_path + '.tmp.png'
+        if cv2.imwrite(temp_path, face):
+            os.replace(temp_path, cache_path)
+    return face
+
+def get_face_stats():
+    with _face_stats_lock:
+        return dict(_face_stats, enabled=FACE_DETECTION)
+
+class GroupMatchingUnavailable(Exception):
+    """Raised when group photos cannot be compared with the students' stored enrollments."""
+
+def match_group_faces(images_data, student_ids, model_directory, threshold=SIMILARITY_THRESHOLD):
+    """Find which of the given students appear in one or more group photos.
+
+    Every face in every photo is embedded in one batch and compared with the
+    enrolled embeddings of the given students only. Each face counts for at
+    most one student and each student for at most one face, best matches
+    first. Returns the number of faces found, how many matched nobody, and
+    per student the best similarity seen, whether they were matched, and the
+    photo they were matched in.
+
+    A group photo can only be embedded face by face, so this needs
+    FACE_DETECTION on and enrollments stored from face crops. Students whose
+    enrollment was stored otherwise are reported as stale and not matched;
+    if that leaves nobody to match, or face detection is off,
+    GroupMatchingUnavailable is raised instead of scoring crops against
+    whole frames.
+    """
+    if not FACE_DETECTION:
+        raise GroupMatchingUnavailable("Group attendance needs FACE_DETECTION=1 and the enrollments re-embedded "
+                                       "from face crops with `flask realign-enrollments`.")
+
+    feature_store = get_feature_store(model_directory)
+    report = {}
+    enrolled = {}
+    for student_id in student_ids:
+        # Enrollments stored under another model tag come back as None, like missing ones
+        features = feature_store.get(student_id)
+        stale = features is None and feature_store.store.model(student_id) is not None
+        report[student_id] = {'enrolled': features is not None, 'stale': stale,
+                              'similarity': None, 'present': False, 'image': None}
+        if features is not None:
+            enrolled[student_id] = features
+    if not enrolled and any(entry['stale'] for entry in report.values()):
+        raise GroupMatchingUnavailable(f"None of these students' enrollments were embedded as {embedding_model()}; "
+                                       "re-embed them with `flask realign-enrollments`.")
+
+    crops, sources = [], []
+    for image_index, image_data in enumerate(images_data):
+        img = decode_image(read_image_bytes(image_data))
+        for box in detect_faces(img):
+            crops.append(prepare_image_array(align_face(img, box)))
+            sources.append(image_index)
+
+    if not crops or not enrolled:
+        return {'faces': len(crops), 'unmatched_faces': len(crops), 'students': report}
+
+    faces = l2_normalize(extract_features(np.stack(crops)))
+    candidates = list(enrolled)
+    # Rows of a student are contiguous, so their best row per face is a reduceat over the segment starts
+    gallery = np.concatenate([enrolled[student_id] for student_id in candidates])
+    starts = np.cumsum([0] + [len(enrolled[student_id]) for student_id in candidates[:-1]])
+    similarities = np.maximum.reduceat(faces @ gallery.T, starts, axis=1)  # (faces, students)
+
+    for column, student_id in enumerate(candidates):
+        report[student_id]['similarity'] = float(similarities[:, column].max())
+
+    matched_faces = set()
+    for flat in np.argsort(similarities, axis=None)[::-1]:
+        face, column = np.unravel_index(flat, similarities.shape)
+        if similarities[face, column] <= threshold:
+            break
+        entry = report[candidates[column]]
+        if face in matched_faces or entry['present']:
+            continue
+        matched_faces.add(face)
+        entry.update(present=True, similarity=float(similarities[face, column]), image=sources[face])
+
+    return {'faces': len(crops), 'unmatched_faces': len(crops) - len(matched_faces), 'students': report}
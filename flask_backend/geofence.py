@@ -0,0 +1,154 @@
+import math
+import json
+import threading
+import numpy as np
+from geopy.distance import geodesic
+from flask_backend.models import db, CampusSite
+from flask_backend.resource_versions import get_resource_versions
+
+# Mean earth radius used by the haversine prefilter, in meters
+EARTH_RADIUS_METERS = 6371008.8
+# The haversine distance on a sphere is within about 0.5% of the geodesic one on the
+# ellipsoid; only points this close to a boundary, relatively, are checked with geodesic
+HAVERSINE_TOLERANCE = 0.006
+
+def haversine_meters(lat1, lon1, lat2, lon2):
+    """Great-circle distances between arrays of points given in radians."""
+    a = (np.sin((lat2 - lat1) / 2) ** 2
+         + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2)
+    return 2 * EARTH_RADIUS_METERS * np.arcsin(np.sqrt(np.clip(a, 0, 1)))
+
+def parse_polygon(value):
+    """Return a polygon given as a list (or JSON text) of [latitude, longitude] pairs as an (N, 2) array.
+
+    Raises ValueError unless it has at least three valid vertices.
+    """
+    if isinstance(value, str):
+        value = json.loads(value)
+    vertices = np.asarray(value, dtype=np.float64)
+    if vertices.ndim != 2 or vertices.shape[1] != 2 or len(vertices) < 3:
+        raise ValueError('A polygon needs at least three [latitude, longitude] pairs.')
+    if np.any(np.abs(vertices[:, 0]) > 90) or np.any(np.abs(vertices[:, 1]) > 180):
+        raise ValueError('Polygon coordinates are out of range.')
+    return vertices
+
+class Geofence:
+    """Precomputed campus geometry answering "which site is this point on?" for many points at once.
+
+    Sites are circles (a center and a radius in meters) or polygons of
+    [latitude, longitude] vertices. Points are first matched against every
+    site's bounding box, then circles are checked with a vectorized haversine
+    and only points within HAVERSINE_TOLERANCE of a circle's edge are settled
+    with geopy's geodesic. Polygons are tested by ray casting in a local flat
+    projection, which is exact enough at campus scale; they must not cross
+    the antimeridian.
+    """
+
+    def __init__(self, sites):
+        circles = [site for site in sites if site.get('polygon') is None]
+        self._circle_names = [site['name'] for site in circles]
+        self._circle_lat = np.radians([site['latitude'] for site in circles])
+        self._circle_lon = np.radians([site['longitude'] for site in circles])
+        self._circle_radius = np.array([site['radius'] for site in circles], dtype=np.float64)
+        # Half-sizes of the bounding boxes, in radians, widened by the tolerance
+        self._circle_dlat = self._circle_radius * (1 + HAVERSINE_TOLERANCE) / EARTH_RADIUS_METERS
+        self._circle_dlon = np.minimum(self._circle_dlat / np.maximum(np.cos(self._circle_lat), 1e-9), math.pi)
+
+        self._polygons = []
+        for site in sites:
+            if site.get('polygon') is None:
+                continue
+            vertices = parse_polygon(site['polygon'])
+            scale = math.cos(math.radians(vertices[:, 0].mean()))
+            self._polygons.append((site['name'], vertices, scale, vertices.min(axis=0), vertices.max(axis=0)))
+
+    def __len__(self):
+        return len(self._circle_names) + len(self._polygons)
+
+    def _circle_sites(self, lat, lon, sites):
+        if not self._circle_names:
+            return
+        dlat = np.abs(lat[:, None] - self._circle_lat[None, :])
+        dlon = np.abs((lon[:, None] - self._circle_lon[None, :] + math.pi) % (2 * math.pi) - math.pi)
+        points, circles = np.nonzero((dlat <= self._circle_dlat) & (dlon <= self._circle_dlon))
+        if not len(points):
+            return
+        radius = self._circle_radius[circles]
+        distance = haversine_meters(lat[points], lon[points], self._circle_lat[circles], self._circle_lon[circles])
+        inside = distance <= radius * (1 - HAVERSINE_TOLERANCE)
+        near = ~inside & (distance <= radius * (1 + HAVERSINE_TOLERANCE))
+        for i in np.nonzero(near)[0]:
+            point, circle = points[i], circles[i]
+            center = (math.degrees(self._circle_lat[circle]), math.degrees(self._circle_lon[circle]))
+            inside[i] = geodesic(center, (math.degrees(lat[point]), math.degrees(lon[point]))).meters <= radius[i]
+        # Pairs come out ordered by point then site, so each point keeps the first site it is inside
+        for point, circle in zip(points[inside], circles[inside]):
+            if sites[point] is None:
+                sites[point] = self._circle_names[circle]
+
+    def _polygon_sites(self, latitudes, longitudes, sites):
+        for name, vertices, scale, lower, upper in self._polygons:
+            candidates = np.nonzero((latitudes >= lower[0]) & (latitudes <= upper[0])
+                                    & (longitudes >= lower[1]) & (longitudes <= upper[1]))[0]
+            candidates = [point for point in candidates if sites[point] is None]
+            if not candidates:
+                continue
+            y = latitudes[candidates][:, None]
+            x = longitudes[candidates][:, None] * scale
+            y1, x1 = vertices[:, 0], vertices[:, 1] * scale
+            y2, x2 = np.roll(y1, -1), np.roll(x1, -1)
+            # Count the polygon edges a ray from each point towards +x crosses
+            with np.errstate(divide='ignore', invalid='ignore'):
+                crossing_x = x1 + (y - y1) * (x2 - x1) / (y2 - y1)
+            crosses = ((y1 > y) != (y2 > y)) & (x < crossing_x)
+            for point in np.asarray(candidates)[crosses.sum(axis=1) % 2 == 1]:
+                sites[point] = name
+
+    def locate_many(self, latitudes, longitudes):
+        """Return, for each point, the name of a site it is on, or None."""
+        latitudes = np.asarray(latitudes, dtype=np.float64).ravel()
+        longitudes = np.asarray(longitudes, dtype=np.float64).ravel()
+        sites = [None] * len(latitudes)
+        self._circle_sites(np.radians(latitudes), np.radians(longitudes), sites)
+        self._polygon_sites(latitudes, longitudes, sites)
+        return sites
+
+    def locate(self, latitude, longitude):
+        """Return the name of a site the point is on, or None."""
+        return self.locate_many([latitude], [longitude])[0]
+
+    def contains(self, latitude, longitude):
+        return self.locate(latitude, longitude) is not None
+
+def load_sites():
+    """Return the active campus sites from the database as dicts Geofence accepts."""
+    return [
+        {'name': site.name, 'latitude': site.latitude, 'longitude': site.longitude,
+         'radius': site.radius_meters, 'polygon': site.polygon}
+        for site in CampusSite.query.filter(CampusSite.is_active.is_(True)).order_by(CampusSite.id)
+    ]
+
+_geofence = None
+_geofence_version = None
+_geofence_lock = threading.Lock()
+
+def get_geofence(fallback_locations=(), fallback_radius=None):
+    """Return the process-wide geofence of the campus sites, rebuilt when they change.
+
+    Changes are noticed through the 'campus_sites' resource version, so a
+    check normally does not query the database. While no site is stored,
+    the fallback (latitude, longitude) locations are used as circles of
+    fallback_radius meters.
+    """
+    global _geofence, _geofence_version
+    version = get_resource_versions().get('campus_sites')
+    with _geofence_lock:
+        if _geofence is None or _geofence_version != version:
+            sites = load_sites()
+            if not sites:
+                sites = [{'name': f'location {i}', 'latitude': latitude, 'longitude': longitude,
+                          'radius': fallback_radius, 'polygon': None}
+                         for i, (latitude, longitude) in enumerate(fallback_locations, start=1)]
+            _geofence = Geofence(sites)
+            _geofence_version = version
+        return _geofence
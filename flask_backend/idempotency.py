@@ -0,0 +1,114 @@
+import os
+import hashlib
+from datetime import datetime, timedelta
+from functools import wraps
+from flask import request, jsonify, make_response, current_app
+from flask_login import current_user
+from flask_backend.models import db, IdempotencyKey, dialect_insert
+
+# How long a finished request's response is replayed for its key, in seconds
+IDEMPOTENCY_KEY_TTL = int(os.getenv('IDEMPOTENCY_KEY_TTL', str(24 * 60 * 60)))
+# After this many seconds a request still marked as running is assumed to have died
+IDEMPOTENCY_LOCK_TIMEOUT = int(os.getenv('IDEMPOTENCY_LOCK_TIMEOUT', '120'))
+
+MAX_KEY_LENGTH = 255
+
+def request_fingerprint():
+    """Hash the method, path, form fields and uploaded files of the current request."""
+    digest = hashlib.sha256(f'{request.method} {request.path}\0'.encode())
+    for name, value in sorted(request.form.items(multi=True)):
+        digest.update(f'{name}={value}\0'.encode())
+    # Files keep their upload order within a field
+    for name, upload in sorted(request.files.items(multi=True), key=lambda item: item[0]):
+        digest.update(f'{name}={upload.filename}\0'.encode())
+        for chunk in iter(lambda: upload.stream.read(64 * 1024), b''):
+            digest.update(chunk)
+        upload.stream.seek(0)
+    if not request.form and not request.files:
+        digest.update(request.get_data())
+    return digest.hexdigest()
+
+def _expired(now):
+    return db.or_(
+        IdempotencyKey.created_at < now - timedelta(seconds=IDEMPOTENCY_KEY_TTL),
+        db.and_(IdempotencyKey.status_code.is_(None),
+                IdempotencyKey.created_at < now - timedelta(seconds=IDEMPOTENCY_LOCK_TIMEOUT)),
+    )
+
+def _claim(user_id, key, fingerprint):
+    """Insert the key as running and return its id, or None if the user already used it."""
+    now = datetime.utcnow()
+    db.session.query(IdempotencyKey).filter(
+        IdempotencyKey.user_id == user_id, IdempotencyKey.key == key, _expired(now),
+    ).delete(synchronize_session=False)
+    table = IdempotencyKey.__table__
+    stmt = (
+        dialect_insert(IdempotencyKey)
+        .values(user_id=user_id, key=key, request_hash=fingerprint, created_at=now)
+        .on_conflict_do_nothing(index_elements=[table.c.user_id, table.c.key])
+        .returning(table.c.id)
+    )
+    claimed = db.session.execute(stmt).scalar()
+    db.session.commit()
+    return claimed
+
+def _release(claimed):
+    """Forget a key whose request failed, so a retry runs it again."""
+    db.session.rollback()
+    db.session.query(IdempotencyKey).filter_by(id=claimed).delete(synchronize_session=False)
+    db.session.commit()
+
+def idempotent(view):
+    """Make a POST view safe to retry with an Idempotency-Key header.
+
+    The first request with a key runs the view and stores its response; a
+    retry by the same user with the same key and request gets that response
+    back (marked Idempotent-Replayed: true) without the view running again.
+    Reusing a key for a different request is a 422, and retrying while the
+    first attempt is still running is a 409. Server errors are not stored,
+    so they can be retried. Requests without the header run as usual. Place
+    it below login_required.
+    """
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        key = request.headers.get('Idempotency-Key')
+        if key is None:
+            return view(*args, **kwargs)
+        key = key.strip()
+        if not key or len(key) > MAX_KEY_LENGTH:
+            return jsonify({'message': f'Idempotency-Key must be 1 to {MAX_KEY_LENGTH} characters'}), 400
+
+        fingerprint = request_fingerprint()
+        claimed = _claim(current_user.id, key, fingerprint)
+        if claimed is None:
+            previous = IdempotencyKey.query.filter_by(user_id=current_user.id, key=key).first()
+            if previous is not None and previous.request_hash != fingerprint:
+                return jsonify({'message': 'Idempotency-Key was already used for a different request'}), 422
+            if previous is None or previous.status_code is None:
+                return jsonify({'message': 'A request with this Idempotency-Key is still being processed'}), 409, {'Retry-After': '1'}
+            response = current_app.response_class(previous.response_body, status=previous.status_code,
+                                                  mimetype='application/json')
+            response.headers['Idempotent-Replayed'] = 'true'
+            return response
+
+        try:
+            response = make_response(view(*args, **kwargs))
+        except Exception:
+            _release(claimed)
+            raise
+        if response.status_code >= 500:
+            _release(claimed)
+            return response
+        db.session.query(IdempotencyKey).filter_by(id=claimed).update(
+            {'status_code': response.status_code, 'response_body': response.get_data(as_text=True)},
+            synchronize_session=False,
+        )
+        db.session.commit()
+        return response
+    return wrapper
+
+def purge_idempotency_keys():
+    """Delete the keys that will not be replayed any more; returns how many were deleted."""
+    deleted = db.session.query(IdempotencyKey).filter(_expired(datetime.utcnow())).delete(synchronize_session=False)
+    db.session.commit()
+    return deleted
@@ -0,0 +1,202 @@
+import os
+import time
+import uuid
+import logging
+import queue
+import threading
+import multiprocessing
+from concurrent.futures import Future
+from multiprocessing import shared_memory, resource_tracker
+import numpy as np
+
+# Worker processes running the feature extractor. 0 keeps inference in the
+# web process; N > 0 moves it into N separate processes (one model each).
+# The pool belongs to one web process: under gunicorn with W workers there
+# are W x N extractor processes, each holding its own model. Run a single
+# web worker with threads (gunicorn --workers 1 --threads T) to get one
+# shared pool, or keep W x N x INFERENCE_INTRA_OP_THREADS near the core count.
+INFERENCE_POOL_SIZE = int(os.getenv('INFERENCE_POOL_SIZE', '0'))
+# TensorFlow thread pools per worker. With several workers per host keep
+# intra_op * pool size close to the number of cores.
+INFERENCE_INTRA_OP_THREADS = int(os.getenv('INFERENCE_INTRA_OP_THREADS', '2'))
+INFERENCE_INTER_OP_THREADS = int(os.getenv('INFERENCE_INTER_OP_THREADS', '1'))
+# Seconds to wait for a worker before failing the request
+INFERENCE_TIMEOUT = float(os.getenv('INFERENCE_TIMEOUT', '30'))
+# How often the dispatcher checks for workers that died, in seconds
+WORKER_CHECK_INTERVAL = 0.5
+
+def _worker_main(request_queue, result_queue, current_request, intra_op_threads, inter_op_threads):
+    """Entry point of an inference worker: load one extractor and serve embedding requests."""
+    import tensorflow as tf
+    tf.config.threading.set_intra_op_parallelism_threads(intra_op_threads)
+    tf.config.threading.set_inter_op_parallelism_threads(inter_op_threads)
+
+    from flask_backend.facial_recognition import get_feature_extractor, embed_batch
+    model = get_feature_extractor()
+    result_queue.put(('ready', os.getpid(), None))
+
+    while True:
+        request = request_queue.get()
+        if request is None:
+            break
+        request_id, shm_name, shape = request
+        # Written straight to shared memory, so the parent can fail this request at once if the worker dies on it
+        current_request.value = request_id.encode()
+        shm = batch = None
+        try:
+            shm = shared_memory.SharedMemory(name=shm_name)
+            # Attaching registers the segment with the shared resource tracker
+            # as well; the parent owns and unlinks it, so undo that here.
+            resource_tracker.unregister(shm._name, 'shared_memory')
+            batch = np.ndarray(shape, dtype=np.float32, buffer=shm.buf)
+            features = embed_batch(model, batch)
+            result_queue.put((request_id, features, None))
+        except Exception as e:
+            result_queue.put((request_id, None, str(e)))
+        finally:
+            # The view must go before the segment can be closed
+            batch = None
+            if shm is not None:
+                shm.close()
+
+class InferencePool:
+    """Pool of worker processes, each holding one loaded feature extractor.
+
+    Preprocessed image tensors are handed to the workers through shared
+    memory instead of being pickled; only the small embedding comes back over
+    the result queue, where a dispatcher thread resolves the caller's future.
+    The dispatcher also watches the workers: one that dies is replaced, and
+    the request it was running fails right away instead of timing out.
+    """
+
+    def __init__(self, size=INFERENCE_POOL_SIZE, intra_op_threads=INFERENCE_INTRA_OP_THREADS,
+                 inter_op_threads=INFERENCE_INTER_OP_THREADS):
+        self.size = size
+        self.intra_op_threads = intra_op_threads
+        self.inter_op_threads = inter_op_threads
+        # spawn, not fork: TensorFlow state does not survive a fork
+        self._context = multiprocessing.get_context('spawn')
+        self._request_queue = None
+        self._result_queue = None
+        self._processes = []
+        self._pending = {}
+        self._current_requests = {}  # worker pid -> shared slot holding the id of the request it is running
+        self._lock = threading.Lock()
+        self._dispatcher = None
+
+    def start(self):
+        with self._lock:
+            if self._processes:
+                return
+            self._request_queue = self._context.Queue()
+            self._result_queue = self._context.Queue()
+            for _ in range(self.size):
+                self._processes.append(self._spawn_worker())
+            self._dispatcher = threading.Thread(target=self._dispatch, args=(self._result_queue,),
+                                                name='inference-dispatcher', daemon=True)
+            self._dispatcher.start()
+        logging.info(f"Started {self.size} inference workers for web process {os.getpid()}")
+
+    def _spawn_worker(self):
+        current_request = self._context.Array('c', 32, lock=False)
+        process = self._context.Process(
+            target=_worker_main,
+            args=(self._request_queue, self._result_queue, current_request, self.intra_op_threads, self.inter_op_threads),
+            daemon=True,
+        )
+        process.start()
+        self._current_requests[process.pid] = current_request
+        return process
+
+    def _replace_dead_workers(self):
+        """Restart workers that exited and fail the requests they were running."""
+        with self._lock:
+            for i, process in enumerate(self._processes):
+                if process.is_alive():
+                    continue
+                logging.warning(f"Inference worker {process.pid} exited with {process.exitcode}, restarting it")
+                current_request = self._current_requests.pop(process.pid, None)
+                future = self._pending.pop(current_request.value.decode(), None) if current_request is not None else None
+                if future is not None:
+                    future.set_exception(RuntimeError(f"Inference worker exited with {process.exitcode}"))
+                self._processes[i] = self._spawn_worker()
+
+    def stop(self):
+        """Shut the workers down; pending requests fail."""
+        with self._lock:
+            processes, self._processes = self._processes, []
+            for _ in processes:
+                self._request_queue.put(None)
+            for process in processes:
+                process.join(timeout=10)
+                if process.is_alive():
+                    process.terminate()
+            self._result_queue.put(('stop', None, None))
+            for future in self._pending.values():
+                future.set_exception(RuntimeError('Inference pool stopped'))
+            self._pending = {}
+            self._current_requests = {}
+
+    def restart(self):
+        """Reload the extractor in every worker by replacing the processes."""
+        self.stop()
+        self.start()
+
+    def _dispatch(self, result_queue):
+        next_check = time.monotonic() + WORKER_CHECK_INTERVAL
+        while True:
+            try:
+                message = result_queue.get(timeout=max(0, next_check - time.monotonic()))
+            except queue.Empty:
+                message = None
+            if time.monotonic() >= next_check:
+                self._replace_dead_workers()
+                next_check = time.monotonic() + WORKER_CHECK_INTERVAL
+            if message is None:
+                continue
+            request_id, features, error = message
+            if request_id == 'stop':
+                return
+            if request_id == 'ready':
+                continue
+            with self._lock:
+                future = self._pending.pop(request_id, None)
+            if future is None:
+                continue
+            if error is not None:
+                future.set_exception(RuntimeError(error))
+            else:
+                future.set_result(features)
+
+    def embed(self, batch, timeout=INFERENCE_TIMEOUT):
+        """Return the embeddings of a preprocessed (N, 224, 224, 3) float32 tensor."""
+        self.start()
+        self._replace_dead_workers()
+        batch = np.ascontiguousarray(batch, dtype=np.float32)
+        shm = shared_memory.SharedMemory(create=True, size=batch.nbytes)
+        request_id = uuid.uuid4().hex
+        future = Future()
+        try:
+            np.ndarray(batch.shape, dtype=np.float32, buffer=shm.buf)[:] = batch
+            with self._lock:
+                self._pending[request_id] = future
+            self._request_queue.put((request_id, shm.name, batch.shape))
+            return future.result(timeout=timeout)
+        finally:
+            with self._lock:
+                self._pending.pop(request_id, None)
+            shm.close()
+            shm.unlink()
+
+_inference_pool = None
+_inference_pool_lock = threading.Lock()
+
+def get_inference_pool():
+    """Return the process-wide inference pool, or None when inference runs in-process."""
+    global _inference_pool
+    if INFERENCE_POOL_SIZE <= 0:
+        return None
+    with _inference_pool_lock:
+        if _inference_pool is None:
+            _inference_pool = InferencePool()
+        return _inference_pool
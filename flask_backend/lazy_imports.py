@@ -0,0 +1,56 @@
+import sys
+import time
+import logging
+import importlib
+import subprocess
+import threading
+
+# Seconds spent on each lazily imported module in this process
+IMPORT_TIMINGS = {}
+_import_lock = threading.Lock()
+
+# The heavy modules the recognition stack loads on first use
+ML_MODULES = ('numpy', 'cv2', 'tensorflow', 'flask_backend.facial_recognition', 'flask_backend.app')
+
+# Modules whose import has finished. sys.modules can't be used as the fast path:
+# it holds a module as soon as its import starts, before its attributes exist.
+_imported = {}
+
+def lazy_import(name):
+    """Import a module on first use and record how long the import took."""
+    module = _imported.get(name)
+    if module is not None:
+        return module
+    with _import_lock:
+        module = _imported.get(name)
+        if module is None:
+            already_imported = name in sys.modules
+            start = time.perf_counter()
+            module = importlib.import_module(name)
+            if not already_imported:
+                IMPORT_TIMINGS[name] = time.perf_counter() - start
+                logging.info(f"Imported {name} in {IMPORT_TIMINGS[name]:.2f}s")
+            _imported[name] = module
+        return module
+
+def measure_import_cost(name):
+    """Import a module in a fresh interpreter and return the seconds it took."""
+    code = (
+        "import time; start = time.perf_counter(); "
+        f"import {name}; "
+        "print(time.perf_counter() - start)"
+    )
+    result = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.strip().splitlines()[-1] if result.stderr.strip() else f"Importing {name} failed")
+    return float(result.stdout.strip().splitlines()[-1])
+
+def import_cost_report(modules=ML_MODULES):
+    """Return the cold import cost of each module, in seconds, or the error importing it raised."""
+    report = {}
+    for name in modules:
+        try:
+            report[name] = round(measure_import_cost(name), 3)
+        except RuntimeError as e:
+            report[name] = str(e)
+    return report
@@ -0,0 +1,129 @@
+import json
+import base64
+import binascii
+from decimal import Decimal
+from urllib.parse import urlencode
+from flask import request, jsonify, Response, stream_with_context
+from flask_backend.models import db
+
+# The most rows a client may ask for in one page
+MAX_PAGE_SIZE = 500
+# Rows fetched from the database cursor at a time while streaming NDJSON
+STREAM_BATCH_SIZE = 1000
+
+class ListingError(ValueError):
+    """A bad fields, limit or cursor argument, reported to the client as a 400."""
+
+def _cursor_value(value):
+    # Aggregates come back as Decimal on some databases
+    if isinstance(value, Decimal):
+        return int(value) if value == value.to_integral_value() else float(value)
+    return value
+
+def encode_cursor(values):
+    return base64.urlsafe_b64encode(json.dumps([_cursor_value(value) for value in values]).encode()).decode()
+
+def decode_cursor(token, size):
+    try:
+        values = json.loads(base64.urlsafe_b64decode(token.encode()))
+    except (binascii.Error, ValueError):
+        raise ListingError('Invalid cursor')
+    if not isinstance(values, list) or len(values) != size:
+        raise ListingError('Invalid cursor')
+    return values
+
+class Listing:
+    """Keyset pagination, field selection and NDJSON streaming for a list endpoint.
+
+    columns maps each field a client may ask for with ?fields= to its SQL
+    expression; keys is the total order of the listing as (expression,
+    descending) pairs, ending in a unique column. A page is asked for with
+    ?limit= and continued with the cursor from the X-Next-Cursor header (also
+    given as a Link rel="next" URL), so the body keeps its usual shape.
+    ?format=ndjson streams every matching row, one JSON object per line,
+    straight from a server-side cursor.
+    """
+
+    def __init__(self, columns, keys, default_fields=None, converters=None):
+        self.columns = columns
+        self.keys = keys
+        self.converters = converters or {}
+        self.fields = self._selected_fields(default_fields or list(columns))
+        self.limit = request.args.get('limit', type=int)
+        if self.limit is not None and not 0 < self.limit <= MAX_PAGE_SIZE:
+            raise ListingError(f'limit must be between 1 and {MAX_PAGE_SIZE}')
+        cursor = request.args.get('cursor')
+        self.cursor = decode_cursor(cursor, len(keys)) if cursor else None
+        self.stream = request.args.get('format') == 'ndjson'
+
+    def _selected_fields(self, default_fields):
+        fields = request.args.get('fields')
+        if not fields:
+            return default_fields
+        names = [name.strip() for name in fields.split(',') if name.strip()]
+        unknown = [name for name in names if name not in self.columns]
+        if unknown or not names:
+            raise ListingError(f"Unknown fields: {', '.join(unknown)}" if unknown else 'No fields selected')
+        return names
+
+    def entities(self):
+        """The selected fields, followed by the sort keys the next cursor is built from."""
+        return ([self.columns[field].label(field) for field in self.fields]
+                + [expression.label(f'_key{i}') for i, (expression, _) in enumerate(self.keys)])
+
+    def _after_cursor(self):
+        directions = {descending for _, descending in self.keys}
+        if len(directions) == 1:
+            # A single row comparison, which an index on the keys can serve
+            row = db.tuple_(*[expression for expression, _ in self.keys])
+            values = db.tuple_(*[db.literal(value) for value in self.cursor])
+            return row < values if directions.pop() else row > values
+        conditions = []
+        for i, (expression, descending) in enumerate(self.keys):
+            equal = [key == value for (key, _), value in zip(self.keys[:i], self.cursor)]
+            beyond = expression < self.cursor[i] if descending else expression > self.cursor[i]
+            conditions.append(db.and_(*equal, beyond))
+        return db.or_(*conditions)
+
+    def apply(self, query, having=False):
+        """Order the query by the keys and continue it after the cursor.
+
+        Pass having=True when a key is an aggregate of a grouped query.
+        """
+        query = query.order_by(*[expression.desc() if descending else expression.asc()
+                                 for expression, descending in self.keys])
+        if self.cursor is not None:
+            query = query.having(self._after_cursor()) if having else query.filter(self._after_cursor())
+        if self.limit is not None:
+            # One extra row tells whether there is a next page
+            query = query.limit(self.limit + 1)
+        return query
+
+    def _row(self, row):
+        values = row._mapping
+        return {field: self.converters.get(field, lambda value: value)(values[field]) for field in self.fields}
+
+    def _next_page_headers(self, last_row):
+        cursor = encode_cursor([last_row._mapping[f'_key{i}'] for i in range(len(self.keys))])
+        args = request.args.to_dict()
+        args['cursor'] = cursor
+        return {
+            'X-Next-Cursor': cursor,
+            'Link': f'<{request.base_url}?{urlencode(args)}>; rel="next"',
+        }
+
+    def response(self, query, envelope=None, headers=None):
+        """Return the page as JSON (a list, or {envelope: list}) or stream it as NDJSON."""
+        headers = dict(headers or {})
+        if self.stream:
+            def generate():
+                for row in query.yield_per(STREAM_BATCH_SIZE):
+                    yield json.dumps(self._row(row)) + '\n'
+            return Response(stream_with_context(generate()), mimetype='application/x-ndjson', headers=headers)
+
+        rows = query.all()
+        if self.limit is not None and len(rows) > self.limit:
+            rows = rows[:self.limit]
+            headers.update(self._next_page_headers(rows[-1]))
+        data = [self._row(row) for row in rows]
+        return jsonify({envelope: data} if envelope else data), 200, headers
@@ -0,0 +1,113 @@
+import os
+import time
+import logging
+import threading
+from collections import Counter, deque
+from concurrent.futures import Future
+import numpy as np
+
+# How long a batch that already has several requests waits for more to join
+# it, in milliseconds; a lone request never waits. 0 disables micro-batching.
+MICRO_BATCH_WINDOW_MS = float(os.getenv('MICRO_BATCH_WINDOW_MS', '10'))
+# Most images run through the extractor in one micro-batch
+MICRO_BATCH_MAX_SIZE = int(os.getenv('MICRO_BATCH_MAX_SIZE', '16'))
+
+class MicroBatcher:
+    """Coalesces concurrent small embedding requests into one forward pass.
+
+    Callers hand in (n, 224, 224, 3) tensors and block on a future. Each of
+    the dispatcher threads (one per inference worker, so every worker can be
+    busy) takes all the waiting requests that fit in max_batch_size images,
+    runs them through embed_fn at once and hands every caller its own rows
+    back. A request that finds no other one waiting runs at once; only when
+    requests are queueing up does a batch wait up to window_ms for more.
+    """
+
+    def __init__(self, embed_fn, window_ms=MICRO_BATCH_WINDOW_MS, max_batch_size=MICRO_BATCH_MAX_SIZE, dispatchers=1):
+        self.embed_fn = embed_fn
+        self.window = window_ms / 1000.0
+        self.max_batch_size = max_batch_size
+        self.dispatchers = max(1, dispatchers)
+        self._waiting = deque()
+        self._ready = threading.Condition()
+        self._threads = []
+        self._lock = threading.Lock()
+        self._batch_sizes = Counter()
+        self.requests = 0
+        self.batches = 0
+
+    def _start(self):
+        with self._lock:
+            if not self._threads:
+                self._threads = [threading.Thread(target=self._run, name=f'micro-batcher-{i}', daemon=True)
+                                 for i in range(self.dispatchers)]
+                for thread in self._threads:
+                    thread.start()
+
+    def embed(self, batch):
+        """Return the embeddings of a small tensor, computed together with any concurrent requests."""
+        self._start()
+        future = Future()
+        with self._ready:
+            self._waiting.append((batch, future))
+            self._ready.notify()
+        return future.result()
+
+    def _take_fitting(self, items, size):
+        # Called with self._ready held; stops at the first request that would overflow the batch
+        while self._waiting and size + len(self._waiting[0][0]) <= self.max_batch_size:
+            item = self._waiting.popleft()
+            items.append(item)
+            size += len(item[0])
+        return size
+
+    def _collect(self):
+        with self._ready:
+            while not self._waiting:
+                self._ready.wait()
+            items = [self._waiting.popleft()]
+            size = self._take_fitting(items, len(items[0][0]))
+            if len(items) > 1:
+                deadline = time.monotonic() + self.window
+                while size < self.max_batch_size and not self._waiting:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._ready.wait(remaining)
+                    size = self._take_fitting(items, size)
+            if self._waiting:
+                # What did not fit goes to the next free dispatcher
+                self._ready.notify()
+        return items, size
+
+    def _run(self):
+        while True:
+            items, size = self._collect()
+            with self._lock:
+                self._batch_sizes[size] += 1
+                self.requests += len(items)
+                self.batches += 1
+            try:
+                features = self.embed_fn(np.concatenate([batch for batch, _ in items], axis=0))
+            except Exception as e:
+                logging.error(f"Micro-batch of {size} images failed: {e}", exc_info=True)
+                for _, future in items:
+                    future.set_exception(e)
+                continue
+
+            start = 0
+            for batch, future in items:
+                future.set_result(features[start:start + len(batch)])
+                start += len(batch)
+
+    def stats(self):
+        """Return request/batch counters and the histogram of images per forward pass."""
+        with self._lock:
+            return {
+                'requests': self.requests,
+                'batches': self.batches,
+                'window_ms': self.window * 1000.0,
+                'max_batch_size': self.max_batch_size,
+                'dispatchers': self.dispatchers,
+                'batch_size_histogram': {str(size): count for size, count in sorted(self._batch_sizes.items())},
+            }
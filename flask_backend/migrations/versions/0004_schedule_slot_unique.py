@@ -0,0 +1,47 @@
+"""schedule slot unique indexes
+
+Revision ID: 0004
+Revises: 0003
+Create Date: 2026-10-18 18:02:11.418230
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0004'
+down_revision = '0003'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Keep only the newest entry per slot, for students and for teachers' own entries,
+    # so the unique indexes can be added
+    op.execute(
+        "DELETE FROM schedule_entry WHERE student_id IS NOT NULL AND id NOT IN "
+        "(SELECT MAX(id) FROM schedule_entry WHERE student_id IS NOT NULL "
+        "GROUP BY student_id, day_of_week, time_start, time_end)"
+    )
+    op.execute(
+        "DELETE FROM schedule_entry WHERE student_id IS NULL AND id NOT IN "
+        "(SELECT MAX(id) FROM schedule_entry WHERE student_id IS NULL "
+        "GROUP BY teacher_id, day_of_week, time_start, time_end)"
+    )
+
+    with op.batch_alter_table('schedule_entry', schema=None) as batch_op:
+        batch_op.drop_index('ix_schedule_entry_student_slot')
+        batch_op.create_index('uq_schedule_entry_student_slot', ['student_id', 'day_of_week', 'time_start', 'time_end'],
+                              unique=True, postgresql_where=sa.text('student_id IS NOT NULL'),
+                              sqlite_where=sa.text('student_id IS NOT NULL'))
+        batch_op.create_index('uq_schedule_entry_teacher_only_slot', ['teacher_id', 'day_of_week', 'time_start', 'time_end'],
+                              unique=True, postgresql_where=sa.text('student_id IS NULL'),
+                              sqlite_where=sa.text('student_id IS NULL'))
+
+
+def downgrade():
+    with op.batch_alter_table('schedule_entry', schema=None) as batch_op:
+        batch_op.drop_index('uq_schedule_entry_teacher_only_slot')
+        batch_op.drop_index('uq_schedule_entry_student_slot')
+        batch_op.create_index('ix_schedule_entry_student_slot', ['student_id', 'day_of_week', 'time_start', 'time_end'], unique=False)
@@ -0,0 +1,86 @@
+"""cohort schedules
+
+Revision ID: 0005
+Revises: 0004
+Create Date: 2026-10-18 19:26:40.105733
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0005'
+down_revision = '0004'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Collapse the per-student copies into one entry per cohort and slot, keeping the newest
+    op.execute("DELETE FROM schedule_entry WHERE department IS NULL AND student_id IS NOT NULL")
+    op.execute(
+        "DELETE FROM schedule_entry WHERE department IS NOT NULL AND id NOT IN "
+        "(SELECT MAX(id) FROM schedule_entry WHERE department IS NOT NULL "
+        "GROUP BY department, batch, semester, day_of_week, time_start, time_end)"
+    )
+    # The teacher's own entry for a slot is now covered by the cohort entry
+    op.execute(
+        "DELETE FROM schedule_entry WHERE department IS NULL AND EXISTS "
+        "(SELECT 1 FROM schedule_entry AS cohort_entry WHERE cohort_entry.department IS NOT NULL "
+        "AND cohort_entry.teacher_id = schedule_entry.teacher_id "
+        "AND cohort_entry.day_of_week = schedule_entry.day_of_week "
+        "AND cohort_entry.time_start = schedule_entry.time_start "
+        "AND cohort_entry.time_end = schedule_entry.time_end)"
+    )
+
+    with op.batch_alter_table('schedule_entry', schema=None) as batch_op:
+        batch_op.drop_index('uq_schedule_entry_teacher_only_slot')
+        batch_op.drop_index('uq_schedule_entry_student_slot')
+        batch_op.drop_index('ix_schedule_entry_cohort')
+        batch_op.drop_column('student_id')
+
+    with op.batch_alter_table('schedule_entry', schema=None) as batch_op:
+        batch_op.create_index('uq_schedule_entry_cohort_slot',
+                              ['department', 'batch', 'semester', 'day_of_week', 'time_start', 'time_end'],
+                              unique=True, postgresql_where=sa.text('department IS NOT NULL'),
+                              sqlite_where=sa.text('department IS NOT NULL'))
+        batch_op.create_index('uq_schedule_entry_teacher_only_slot', ['teacher_id', 'day_of_week', 'time_start', 'time_end'],
+                              unique=True, postgresql_where=sa.text('department IS NULL'),
+                              sqlite_where=sa.text('department IS NULL'))
+
+
+def downgrade():
+    with op.batch_alter_table('schedule_entry', schema=None) as batch_op:
+        batch_op.drop_index('uq_schedule_entry_teacher_only_slot')
+        batch_op.drop_index('uq_schedule_entry_cohort_slot')
+        batch_op.add_column(sa.Column('student_id', sa.Integer(), nullable=True))
+        batch_op.create_foreign_key('schedule_entry_student_id_fkey', 'student', ['student_id'], ['id'])
+
+    # Copy each cohort entry to every student of the cohort, and turn it into the teacher's own entry
+    op.execute(
+        "INSERT INTO schedule_entry (teacher_id, student_id, day_of_week, time_start, time_end, classroom, "
+        "department, batch, semester, course_name) "
+        "SELECT e.teacher_id, s.id, e.day_of_week, e.time_start, e.time_end, e.classroom, "
+        "e.department, e.batch, e.semester, e.course_name "
+        "FROM schedule_entry e JOIN student s ON s.department = e.department "
+        "AND s.batch = e.batch AND s.semester = e.semester "
+        "WHERE e.department IS NOT NULL AND e.student_id IS NULL"
+    )
+    op.execute(
+        "UPDATE schedule_entry SET department = NULL, batch = NULL, semester = NULL WHERE student_id IS NULL"
+    )
+    op.execute(
+        "DELETE FROM schedule_entry WHERE student_id IS NULL AND id NOT IN "
+        "(SELECT MAX(id) FROM schedule_entry WHERE student_id IS NULL "
+        "GROUP BY teacher_id, day_of_week, time_start, time_end)"
+    )
+
+    with op.batch_alter_table('schedule_entry', schema=None) as batch_op:
+        batch_op.create_index('ix_schedule_entry_cohort', ['department', 'batch', 'semester'], unique=False)
+        batch_op.create_index('uq_schedule_entry_student_slot', ['student_id', 'day_of_week', 'time_start', 'time_end'],
+                              unique=True, postgresql_where=sa.text('student_id IS NOT NULL'),
+                              sqlite_where=sa.text('student_id IS NOT NULL'))
+        batch_op.create_index('uq_schedule_entry_teacher_only_slot', ['teacher_id', 'day_of_week', 'time_start', 'time_end'],
+                              unique=True, postgresql_where=sa.text('student_id IS NULL'),
+                              sqlite_where=sa.text('student_id IS NULL'))
@@ -0,0 +1,75 @@
+"""idempotent attendance
+
+Revision ID: 0006
+Revises: 0005
+Create Date: 2026-10-18 21:04:52.731905
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0006'
+down_revision = '0005'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('idempotency_key',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('key', sa.String(length=255), nullable=False),
+    sa.Column('request_hash', sa.String(length=64), nullable=False),
+    sa.Column('status_code', sa.Integer(), nullable=True),
+    sa.Column('response_body', sa.Text(), nullable=True),
+    sa.Column('created_at', sa.DateTime(), nullable=False),
+    sa.ForeignKeyConstraint(['user_id'], ['user.id'], ),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('user_id', 'key', name='uq_idempotency_key_user_key')
+    )
+    with op.batch_alter_table('idempotency_key', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_idempotency_key_created_at'), ['created_at'], unique=False)
+
+    with op.batch_alter_table('attendance_record', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('session_date', sa.Date(), nullable=True))
+    if op.get_bind().dialect.name == 'sqlite':
+        op.execute("UPDATE attendance_record SET session_date = date(timestamp)")
+    else:
+        op.execute("UPDATE attendance_record SET session_date = CAST(timestamp AS DATE)")
+
+    # Keep one record per student, class and day: the first present one, else the first one
+    op.execute(
+        "DELETE FROM attendance_record WHERE id IN (SELECT id FROM ("
+        "SELECT id, ROW_NUMBER() OVER (PARTITION BY student_id, class_id, session_date "
+        "ORDER BY CASE WHEN present THEN 1 ELSE 0 END DESC, id) AS position "
+        "FROM attendance_record) AS ranked WHERE position > 1)"
+    )
+
+    with op.batch_alter_table('attendance_record', schema=None) as batch_op:
+        batch_op.alter_column('session_date', existing_type=sa.Date(), nullable=False)
+        batch_op.drop_index('ix_attendance_record_student_class')
+        batch_op.create_unique_constraint('uq_attendance_record_student_class_session',
+                                          ['student_id', 'class_id', 'session_date'])
+
+    # The duplicates were counted in the summaries too
+    op.execute("DELETE FROM attendance_summary")
+    op.execute(
+        "INSERT INTO attendance_summary (student_id, class_id, total_classes, attended_classes, last_timestamp) "
+        "SELECT student_id, class_id, COUNT(*), SUM(CASE WHEN present THEN 1 ELSE 0 END), MAX(timestamp) "
+        "FROM attendance_record GROUP BY student_id, class_id"
+    )
+
+
+def downgrade():
+    # The duplicate records removed by the upgrade are not restored
+    with op.batch_alter_table('attendance_record', schema=None) as batch_op:
+        batch_op.drop_constraint('uq_attendance_record_student_class_session', type_='unique')
+        batch_op.create_index('ix_attendance_record_student_class', ['student_id', 'class_id'], unique=False)
+        batch_op.drop_column('session_date')
+
+    with op.batch_alter_table('idempotency_key', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_idempotency_key_created_at'))
+
+    op.drop_table('idempotency_key')
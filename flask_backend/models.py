@@ -1,8 +1,28 @@
 from flask_sqlalchemy import SQLAlchemy
 from flask_login import UserMixin
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.engine import make_url
 
 db = SQLAlchemy() 
 
+# Databases whose INSERT supports ON CONFLICT ... RETURNING, which attendance
+# recording, summaries, timetable imports and idempotency keys rely on
+SUPPORTED_DIALECTS = {'postgresql': postgresql.insert, 'sqlite': sqlite.insert}
+
+def check_database_url(url):
+    """Refuse, at startup, a database that dialect_insert cannot write to."""
+    dialect = make_url(url).get_backend_name()
+    if dialect not in SUPPORTED_DIALECTS:
+        raise RuntimeError(f"DATABASE_URL points at {dialect}, but only {' and '.join(SUPPORTED_DIALECTS)} "
+                           "are supported: attendance and timetable writes need INSERT ... ON CONFLICT.")
+
+def dialect_insert(model):
+    """Return an INSERT for the model that supports ON CONFLICT on the configured database."""
+    dialect = db.session.get_bind().dialect.name
+    if dialect not in SUPPORTED_DIALECTS:
+        raise NotImplementedError(f"ON CONFLICT upserts are not supported on {dialect}.")
+    return SUPPORTED_DIALECTS[dialect](model)
+
 class User(db.Model, UserMixin):
     id = db.Column(db.Integer, primary_key=True)
     email = db.Column(db.String(150), unique=True, nullable=False)
@@ -22,7 +42,7 @@ class User(db.Model, UserMixin):
 
 class Student(db.Model):
     id = db.Column(db.Integer, primary_key=True)
-    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False, index=True)
     student_id = db.Column(db.String(50), unique=True, nullable=False)
     name = db.Column(db.String(150), nullable=False)
     department = db.Column(db.String(100), nullable=False)
@@ -34,11 +54,14 @@ class Student(db.Model):
 
     user = db.relationship('User', back_populates='student_profile')
     attendance_records = db.relationship('AttendanceRecord', back_populates='student')
-    schedule_entries = db.relationship('ScheduleEntry', back_populates='student')
+
+    __table_args__ = (
+        db.Index('ix_student_cohort', 'department', 'semester', 'batch'),
+    )
 
 class Teacher(db.Model):
     id = db.Column(db.Integer, primary_key=True)
-    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False, index=True)
     teacher_id = db.Column(db.String(50), unique=True, nullable=False)
     name = db.Column(db.String(150), nullable=False)
     department = db.Column(db.String(100), nullable=False)
@@ -50,16 +73,22 @@ class Teacher(db.Model):
 class Class(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(150), nullable=False)
-    teacher_id = db.Column(db.Integer, db.ForeignKey('teacher.id'), nullable=False)
+    teacher_id = db.Column(db.Integer, db.ForeignKey('teacher.id'), nullable=False, index=True)
     schedule = db.Column(db.String(150), nullable=False)
 
     teacher = db.relationship('Teacher', back_populates='classes')
     attendance_records = db.relationship('AttendanceRecord', back_populates='class_')
 
+    __table_args__ = (
+        db.Index('ix_class_name_teacher', 'name', 'teacher_id'),
+    )
+
+# One row per slot for a whole cohort (department, batch and semester); students
+# find their schedule through their own cohort. A slot without a cohort is one
+# only the teacher sees.
 class ScheduleEntry(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     teacher_id = db.Column(db.Integer, db.ForeignKey('teacher.id'), nullable=False)
-    student_id = db.Column(db.Integer, db.ForeignKey('student.id'), nullable=True)  # Optional for student schedules
     day_of_week = db.Column(db.String(20), nullable=False)
     time_start = db.Column(db.String(10), nullable=False)
     time_end = db.Column(db.String(10), nullable=False)
@@ -70,25 +99,94 @@ class ScheduleEntry(db.Model):
     course_name = db.Column(db.String(150), nullable=False)  # Added
 
     teacher = db.relationship('Teacher', back_populates='schedule_entries')
-    student = db.relationship('Student', back_populates='schedule_entries')  # Optional for student schedules
+
+    __table_args__ = (
+        db.Index('ix_schedule_entry_teacher_slot', 'teacher_id', 'day_of_week', 'time_start', 'time_end'),
+        # One entry per slot for each cohort, and one cohort-less entry per slot for each teacher,
+        # so schedules can be upserted with INSERT ... ON CONFLICT. The cohort index also serves
+        # the lookups of a student's schedule by cohort.
+        db.Index('uq_schedule_entry_cohort_slot', 'department', 'batch', 'semester',
+                 'day_of_week', 'time_start', 'time_end',
+                 unique=True, postgresql_where=db.text('department IS NOT NULL'),
+                 sqlite_where=db.text('department IS NOT NULL')),
+        db.Index('uq_schedule_entry_teacher_only_slot', 'teacher_id', 'day_of_week', 'time_start', 'time_end',
+                 unique=True, postgresql_where=db.text('department IS NULL'),
+                 sqlite_where=db.text('department IS NULL')),
+    )
     
 class AttendanceRecord(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     student_id = db.Column(db.Integer, db.ForeignKey('student.id'), nullable=False)
     class_id = db.Column(db.Integer, db.ForeignKey('class.id'), nullable=False)
     timestamp = db.Column(db.DateTime, nullable=False)
+    # The (UTC) day of the class session, so a retried submission cannot record it twice
+    session_date = db.Column(db.Date, nullable=False)
     present = db.Column(db.Boolean, default=False)
 
     student = db.relationship('Student', back_populates='attendance_records')
     class_ = db.relationship('Class', back_populates='attendance_records')
 
+    __table_args__ = (
+        # Also serves the lookups by student and class
+        db.UniqueConstraint('student_id', 'class_id', 'session_date', name='uq_attendance_record_student_class_session'),
+        db.Index('ix_attendance_record_class', 'class_id'),
+    )
+
 class AttendanceStatus(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     day = db.Column(db.String(20), nullable=False)
     period = db.Column(db.String(20), nullable=False)
     status = db.Column(db.Boolean, default=False)  # True if attendance is allowed, False otherwise
 
+    __table_args__ = (
+        db.UniqueConstraint('day', 'period', name='uq_attendance_status_day_period'),
+    )
+
 class FeatureToggle(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     feature_name = db.Column(db.String(50), unique=True, nullable=False)
     is_enabled = db.Column(db.Boolean, default=False)
+
+class AttendanceSummary(db.Model):
+    # Running attendance totals per student and class, updated in the same
+    # transaction as every AttendanceRecord insert so reports never scan records
+    id = db.Column(db.Integer, primary_key=True)
+    student_id = db.Column(db.Integer, db.ForeignKey('student.id'), nullable=False)
+    class_id = db.Column(db.Integer, db.ForeignKey('class.id'), nullable=False, index=True)
+    total_classes = db.Column(db.Integer, nullable=False, default=0)
+    attended_classes = db.Column(db.Integer, nullable=False, default=0)
+    last_timestamp = db.Column(db.DateTime, nullable=True)
+
+    student = db.relationship('Student')
+    class_ = db.relationship('Class')
+
+    __table_args__ = (
+        db.UniqueConstraint('student_id', 'class_id', name='uq_attendance_summary_student_class'),
+    )
+
+class IdempotencyKey(db.Model):
+    # The outcome of a request sent with an Idempotency-Key header, replayed when
+    # the same user retries it; status_code is NULL while the first attempt runs
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    key = db.Column(db.String(255), nullable=False)
+    request_hash = db.Column(db.String(64), nullable=False)
+    status_code = db.Column(db.Integer, nullable=True)
+    response_body = db.Column(db.Text, nullable=True)
+    created_at = db.Column(db.DateTime, nullable=False, index=True)
+
+    __table_args__ = (
+        db.UniqueConstraint('user_id', 'key', name='uq_idempotency_key_user_key'),
+    )
+
+class CampusSite(db.Model):
+    # A place students may take attendance from: a circle of radius_meters around
+    # (latitude, longitude), or, when polygon is set, that polygon given as JSON
+    # [[latitude, longitude], ...] (latitude and longitude are then its center)
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(150), nullable=False)
+    latitude = db.Column(db.Float, nullable=False)
+    longitude = db.Column(db.Float, nullable=False)
+    radius_meters = db.Column(db.Float, nullable=True)
+    polygon = db.Column(db.Text, nullable=True)
+    is_active = db.Column(db.Boolean, nullable=False, default=True)
@@ -0,0 +1,145 @@
+import os
+import time
+import sqlite3
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+import numpy as np
+
+# Recognition results kept in memory per process
+RECOGNITION_CACHE_SIZE = int(os.getenv('RECOGNITION_CACHE_SIZE', '2048'))
+# How long a result is reused, in seconds
+RECOGNITION_CACHE_TTL = int(os.getenv('RECOGNITION_CACHE_TTL', '600'))
+# Optional SQLite file shared by the worker processes on a host; unset keeps the cache per process
+RECOGNITION_CACHE_FILE = os.getenv('RECOGNITION_CACHE_FILE')
+
+# Expired rows are purged from the shared file every this many writes
+SHARED_PURGE_INTERVAL = 256
+
+class RecognitionCache:
+    """LRU cache, with a TTL, of recognition results keyed by the exact image bytes.
+
+    A resubmitted photo gets its embedding and similarity back without being
+    decoded or embedded again. Keys also cover the student and the model
+    version (see recognize_face), so a re-enrollment or a different extractor
+    never reuses an old result. With a path, results are also written to a
+    SQLite file that every worker process on the host reads; entries found
+    there are promoted into memory. Errors of the shared file are logged and
+    treated as misses.
+    """
+
+    def __init__(self, max_entries=RECOGNITION_CACHE_SIZE, ttl=RECOGNITION_CACHE_TTL, path=None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.path = path
+        self._entries = OrderedDict()  # key -> (expires at, embedding, similarity)
+        self._lock = threading.Lock()
+        self._connections = threading.local()
+        self._writes = 0
+        self.hits = 0
+        self.shared_hits = 0
+        self.misses = 0
+        if path:
+            self._execute("CREATE TABLE IF NOT EXISTS recognition_cache "
+                          "(key TEXT PRIMARY KEY, expires_at REAL NOT NULL, embedding BLOB NOT NULL, similarity REAL NOT NULL)")
+
+    @staticmethod
+    def key(data, student_id, model_version):
+        """Return the cache key of an image's recognition against one student."""
+        digest = hashlib.sha256(data)
+        digest.update(f'\0{student_id}\0{model_version}'.encode())
+        return digest.hexdigest()
+
+    def _connection(self):
+        connection = getattr(self._connections, 'connection', None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=1, isolation_level=None)
+            connection.execute('PRAGMA journal_mode=WAL')
+            self._connections.connection = connection
+        return connection
+
+    def _execute(self, sql, parameters=()):
+        try:
+            return self._connection().execute(sql, parameters).fetchall()
+        except sqlite3.Error as e:
+            logging.warning(f"Recognition cache file {self.path} failed: {e}")
+            return None
+
+    def get(self, key):
+        """Return (embedding, similarity) for a key, or None on a miss."""
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if entry[0] > now:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return entry[1], entry[2]
+                del self._entries[key]
+
+        if self.path:
+            rows = self._execute("SELECT expires_at, embedding, similarity FROM recognition_cache "
+                                 "WHERE key = ? AND expires_at > ?", (key, now))
+            if rows:
+                expires_at, embedding, similarity = rows[0]
+                embedding = np.frombuffer(embedding, dtype=np.float32)
+                self._remember(key, expires_at, embedding, similarity)
+                with self._lock:
+                    self.shared_hits += 1
+                return embedding, similarity
+
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def _remember(self, key, expires_at, embedding, similarity):
+        with self._lock:
+            self._entries[key] = (expires_at, embedding, similarity)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def put(self, key, embedding, similarity):
+        """Remember the embedding of an image and its similarity to the student's enrollment."""
+        embedding = np.ascontiguousarray(embedding, dtype=np.float32)
+        embedding.setflags(write=False)
+        expires_at = time.time() + self.ttl
+        self._remember(key, expires_at, embedding, float(similarity))
+        if not self.path:
+            return
+        self._execute("INSERT OR REPLACE INTO recognition_cache (key, expires_at, embedding, similarity) "
+                      "VALUES (?, ?, ?, ?)", (key, expires_at, embedding.tobytes(), float(similarity)))
+        with self._lock:
+            self._writes += 1
+            purge = self._writes % SHARED_PURGE_INTERVAL == 0
+        if purge:
+            self._execute("DELETE FROM recognition_cache WHERE expires_at <= ?", (time.time(),))
+
+    def clear(self):
+        """Forget every result, e.g. after the extractor's weights changed."""
+        with self._lock:
+            self._entries.clear()
+        if self.path:
+            self._execute("DELETE FROM recognition_cache")
+
+    def stats(self):
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'hits': self.hits,
+                'shared_hits': self.shared_hits,
+                'misses': self.misses,
+                'shared': bool(self.path),
+            }
+
+_recognition_cache = None
+_recognition_cache_lock = threading.Lock()
+
+def get_recognition_cache():
+    """Return the process-wide recognition cache."""
+    global _recognition_cache
+    with _recognition_cache_lock:
+        if _recognition_cache is None:
+            _recognition_cache = RecognitionCache(path=RECOGNITION_CACHE_FILE)
+        return _recognition_cache
@@ -0,0 +1,157 @@
+import os
+import math
+import mmap
+import struct
+import hashlib
+import secrets
+import threading
+import time
+from contextlib import contextmanager
+from functools import wraps
+from flask import request, make_response
+from flask_login import current_user
+
+try:
+    import fcntl
+except ImportError:  # Windows: only in-process locking is available
+    fcntl = None
+
+# Data that clients poll and that only changes when someone edits it. Each has
+# a version counter that writers bump after committing; responses built from
+# it carry an ETag made of those versions. Append new names, never reorder.
+RESOURCES = ('schedules', 'attendance_status', 'roster', 'campus_sites')
+
+# On-disk layout of resource_versions.bin, memory-mapped by every worker:
+#   header - magic, and a random epoch so ETags from a deleted file never match again
+#   slots  - (version, last modified unix time) per resource, in RESOURCES order
+VERSIONS_MAGIC = b'SASVER\x00\x00'
+HEADER_FORMAT = '<8sQ'
+HEADER_SIZE = struct.calcsize(HEADER_FORMAT)
+SLOT_FORMAT = '<Qd'
+SLOT_SIZE = struct.calcsize(SLOT_FORMAT)
+FILE_SIZE = HEADER_SIZE + SLOT_SIZE * len(RESOURCES)
+
+RESOURCE_VERSIONS_FILE = os.getenv('RESOURCE_VERSIONS_FILE')
+
+class ResourceVersions:
+    """Version counters shared by all worker processes on a host through a memory-mapped file.
+
+    Reading a version is a memory read, so a conditional GET can be answered
+    without touching the database. Bumps are serialized with a lock (plus an
+    flock on POSIX). Hosts behind a load balancer each keep their own file;
+    point RESOURCE_VERSIONS_FILE at shared storage to keep their ETags equal.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.lock_path = path + '.lock'
+        self._lock = threading.Lock()
+        with self._file_lock():
+            with open(self.path, 'a+b') as f:
+                f.seek(0, os.SEEK_END)
+                size = f.tell()
+                if size < HEADER_SIZE:
+                    f.truncate(0)
+                    f.write(struct.pack(HEADER_FORMAT, VERSIONS_MAGIC, secrets.randbits(64)))
+                    size = HEADER_SIZE
+                if size < FILE_SIZE:
+                    f.write(b'\x00' * (FILE_SIZE - size))
+            with open(self.path, 'r+b') as f:
+                self._map = mmap.mmap(f.fileno(), FILE_SIZE)
+        magic, self.epoch = struct.unpack_from(HEADER_FORMAT, self._map, 0)
+        if magic != VERSIONS_MAGIC:
+            raise ValueError(f"{self.path} is not a resource versions file.")
+
+    @contextmanager
+    def _file_lock(self):
+        """Serialize bumps across threads and, where flock exists, across processes."""
+        with self._lock:
+            if fcntl is None:
+                yield
+                return
+            with open(self.lock_path, 'a') as handle:
+                fcntl.flock(handle, fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    fcntl.flock(handle, fcntl.LOCK_UN)
+
+    def _offset(self, resource):
+        return HEADER_SIZE + SLOT_SIZE * RESOURCES.index(resource)
+
+    def get(self, resource):
+        """Return (version, last modified unix time) of a resource."""
+        return struct.unpack_from(SLOT_FORMAT, self._map, self._offset(resource))
+
+    def bump(self, *resources):
+        """Mark resources as changed; call after the change is committed."""
+        with self._file_lock():
+            now = time.time()
+            for resource in resources:
+                version, _ = self.get(resource)
+                struct.pack_into(SLOT_FORMAT, self._map, self._offset(resource), version + 1, now)
+
+    def validators(self, resources, variant=''):
+        """Return (ETag, last modified unix time) for a response built from resources.
+
+        variant tells apart responses built from the same resources, such as
+        different users or query strings.
+        """
+        slots = [self.get(resource) for resource in resources]
+        versions = '.'.join(str(version) for version, _ in slots)
+        digest = hashlib.sha1(variant.encode()).hexdigest()[:12]
+        # Last-Modified only has whole seconds; round up so it is never earlier than the change
+        last_modified = math.ceil(max(modified for _, modified in slots))
+        return f'{self.epoch:x}-{versions}-{digest}', last_modified
+
+_resource_versions = None
+_resource_versions_lock = threading.Lock()
+
+def get_resource_versions():
+    """Return the process-wide resource versions, kept next to the model files unless configured."""
+    global _resource_versions
+    with _resource_versions_lock:
+        if _resource_versions is None:
+            path = RESOURCE_VERSIONS_FILE
+            if not path:
+                from flask_backend.facial_recognition import get_model_directory
+                path = os.path.join(get_model_directory(), 'resource_versions.bin')
+            _resource_versions = ResourceVersions(path)
+        return _resource_versions
+
+def bump_versions(*resources):
+    get_resource_versions().bump(*resources)
+
+def conditional(*resources, per_user=False):
+    """Answer GETs of a view from resources with 304 while none of them changed.
+
+    The ETag covers the query string, and the logged-in user when per_user is
+    set. A 304 is returned before the view runs, so nothing is queried or
+    serialized; clients have to revalidate every time (Cache-Control: no-cache).
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            variant = request.query_string.decode()
+            if per_user:
+                variant += f'|{current_user.get_id()}'
+            etag, last_modified = get_resource_versions().validators(resources, variant)
+
+            if request.if_none_match:
+                not_modified = request.if_none_match.contains(etag)
+            else:
+                since = request.if_modified_since
+                not_modified = since is not None and last_modified > 0 and since.timestamp() >= last_modified
+            if not_modified:
+                response = make_response('', 304)
+            else:
+                response = make_response(view(*args, **kwargs))
+                if response.status_code != 200:
+                    return response
+            response.set_etag(etag)
+            if last_modified > 0:
+                response.last_modified = last_modified
+            response.cache_control.no_cache = True
+            return response
+        return wrapper
+    return decorator
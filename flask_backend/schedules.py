@@ -0,0 +1,298 @@
+import io
+import csv
+import re
+import json
+from bisect import bisect_left, bisect_right
+from collections import defaultdict
+from flask_backend.models import db, Teacher, Class, ScheduleEntry, dialect_insert
+
+# Rows per INSERT statement, to keep statements a reasonable size
+UPSERT_CHUNK_SIZE = 1000
+
+SCHEDULE_COLUMNS = ('teacher_id', 'day_of_week', 'time_start', 'time_end',
+                    'classroom', 'course_name', 'department', 'batch', 'semester')
+COHORT_COLUMNS = ('department', 'batch', 'semester')
+SLOT_COLUMNS = ('day_of_week', 'time_start', 'time_end')
+
+def _upsert(rows, key_columns, index_where, update_columns):
+    table = ScheduleEntry.__table__
+    for start in range(0, len(rows), UPSERT_CHUNK_SIZE):
+        stmt = dialect_insert(ScheduleEntry).values(rows[start:start + UPSERT_CHUNK_SIZE])
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[table.c[column] for column in key_columns],
+            index_where=index_where,
+            set_={column: stmt.excluded[column] for column in update_columns},
+        )
+        db.session.execute(stmt)
+
+def upsert_schedule_entries(entries):
+    """Insert schedule entries, updating whichever already exist for the same slot.
+
+    Entries are dicts of ScheduleEntry columns. A cohort's entry is keyed by
+    (department, batch, semester, day, start, end) and replaces the teacher's
+    cohort-less entry for the same slot; a cohort-less entry is keyed by
+    (teacher_id, day, start, end). Runs in the caller's transaction.
+    """
+    rows = [{column: entry.get(column) for column in SCHEDULE_COLUMNS} for entry in entries]
+    table = ScheduleEntry.__table__
+    teacher_rows = [row for row in rows if row['department'] is None]
+    cohort_rows = [row for row in rows if row['department'] is not None]
+
+    if teacher_rows:
+        _upsert(teacher_rows, ('teacher_id',) + SLOT_COLUMNS, table.c.department.is_(None),
+                ('classroom', 'course_name'))
+    if cohort_rows:
+        _upsert(cohort_rows, COHORT_COLUMNS + SLOT_COLUMNS, table.c.department.isnot(None),
+                ('teacher_id', 'classroom', 'course_name'))
+        teacher_slots = list({tuple(row[column] for column in ('teacher_id',) + SLOT_COLUMNS) for row in cohort_rows})
+        for start in range(0, len(teacher_slots), UPSERT_CHUNK_SIZE):
+            db.session.execute(table.delete().where(
+                table.c.department.is_(None),
+                db.tuple_(table.c.teacher_id, table.c.day_of_week, table.c.time_start, table.c.time_end)
+                .in_(teacher_slots[start:start + UPSERT_CHUNK_SIZE]),
+            ))
+
+SCHEDULE_DAYS = ('Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday')
+
+TIMETABLE_REQUIRED_FIELDS = ('day_of_week', 'time_start', 'time_end', 'classroom', 'teacher_id', 'course_name')
+
+class IntervalIndex:
+    """Booked time intervals per key (a teacher, room or cohort on one day), sorted by start.
+
+    Each interval carries the entry that owns it, so the import can ignore the
+    bookings of the entries a row is about to overwrite.
+    """
+
+    def __init__(self):
+        # Parallel lists, ordered by start alone: owners and labels need not be comparable
+        self._starts = defaultdict(list)
+        self._intervals = defaultdict(list)
+
+    def add(self, key, start, end, owner, label):
+        starts = self._starts[key]
+        position = bisect_right(starts, start)
+        starts.insert(position, start)
+        self._intervals[key].insert(position, (start, end, owner, label))
+
+    def discard(self, key, owner):
+        """Remove the intervals under key that belong to owner."""
+        intervals = self._intervals.get(key, [])
+        keep = [i for i, interval in enumerate(intervals) if interval[2] != owner]
+        if len(keep) < len(intervals):
+            self._intervals[key] = [intervals[i] for i in keep]
+            self._starts[key] = [self._starts[key][i] for i in keep]
+
+    def overlapping(self, key, start, end, ignore_owners=()):
+        """Return the labels of the intervals under key that overlap [start, end)."""
+        intervals = self._intervals.get(key, [])
+        # Only intervals starting before this one ends can overlap it
+        candidates = intervals[:bisect_left(self._starts.get(key, []), end)]
+        return [label for other_start, other_end, owner, label in candidates
+                if other_end > start and owner not in ignore_owners]
+
+def entry_key(teacher_id, cohort, day, start, end):
+    """The unique key of a schedule entry: its cohort and slot, or its teacher and slot without a cohort.
+
+    start and end are minutes since midnight, so differently written times of one slot share a key.
+    """
+    if cohort[0] is not None:
+        return ('cohort',) + tuple(cohort) + (day, start, end)
+    return ('teacher', teacher_id, day, start, end)
+
+# Schedule times are stored the way the app offers them: a 12-hour clock with
+# neither am/pm nor zero padding ('10:30', '12:30', '1:30'). Classes run from
+# DAY_START_HOUR to before DAY_END_HOUR, so hours below DAY_START_HOUR are in
+# the afternoon: '1:30' is 13:30 and '6:00' is 18:00.
+DAY_START_HOUR = 7
+DAY_END_HOUR = 19
+TIME_PATTERN = re.compile(r'(?P<hour>\d{1,2}):(?P<minute>[0-5]\d)\s*(?P<meridiem>am|pm)?')
+
+def parse_time(value):
+    """Return (minutes since midnight, the time as the app stores it) for a schedule time.
+
+    Accepts the app's own form, 24-hour times ('13:30') and times with an
+    explicit am/pm ('1:30 pm'). Raises ValueError for anything else and for
+    times outside the teaching day, which the stored form cannot tell apart.
+    """
+    match = TIME_PATTERN.fullmatch(value.strip().lower())
+    if match is None:
+        raise ValueError(f"Invalid time {value!r}")
+    hour, minute, meridiem = int(match['hour']), int(match['minute']), match['meridiem']
+    if meridiem:
+        if not 1 <= hour <= 12:
+            raise ValueError(f"Invalid time {value!r}")
+        hour = hour % 12 + (12 if meridiem == 'pm' else 0)
+    elif 1 <= hour < DAY_START_HOUR:
+        hour += 12
+    if not DAY_START_HOUR <= hour < DAY_END_HOUR:
+        raise ValueError(f"Time {value!r} is outside the teaching day")
+    return hour * 60 + minute, f"{(hour - 1) % 12 + 1}:{minute:02d}"
+
+def read_timetable(stream, filename):
+    """Yield (row number, row dict) from a CSV or JSON timetable, reading CSV line by line."""
+    if filename.lower().endswith('.json'):
+        rows = json.load(stream)
+        if not isinstance(rows, list):
+            raise ValueError('A JSON timetable must be a list of rows.')
+        yield from enumerate(rows, start=1)
+        return
+    reader = csv.DictReader(io.TextIOWrapper(stream, encoding='utf-8-sig', newline=''))
+    # Row 1 is the header
+    yield from enumerate(reader, start=2)
+
+def _text(row, field):
+    value = row.get(field)
+    return str(value).strip() if value is not None else ''
+
+class TimetableImport:
+    """Validates timetable rows one at a time and writes the valid ones in bulk.
+
+    Everything a row is checked against is loaded up front: the teachers, and
+    the slots already booked per teacher, room and cohort, kept in interval
+    indexes so a clash check never queries the database.
+    """
+
+    def __init__(self):
+        self.rows = 0
+        self.errors = []
+        self.slots = []
+        self._seen = {}
+        self._teachers = {}
+        for teacher_pk, teacher_code in db.session.query(Teacher.id, Teacher.teacher_id):
+            self._teachers[str(teacher_pk)] = teacher_pk
+            self._teachers.setdefault(teacher_code, teacher_pk)
+        self._teacher_slots = IntervalIndex()
+        self._room_slots = IntervalIndex()
+        self._cohort_slots = IntervalIndex()
+        self._stored_slots = {}  # key of an existing entry -> its (day, time_start, time_end) as stored
+        self._existing_bookings = {}  # key of an existing entry -> (teacher_id, classroom, cohort, day) it is booked under
+        self._replaced_teacher_slots = []  # (teacher_id, day, time_start, time_end) of entries cohort rows replace
+        existing = db.session.query(ScheduleEntry.teacher_id, ScheduleEntry.day_of_week, ScheduleEntry.time_start,
+                                    ScheduleEntry.time_end, ScheduleEntry.classroom, ScheduleEntry.course_name,
+                                    ScheduleEntry.department, ScheduleEntry.batch, ScheduleEntry.semester)
+        for teacher_id, day, time_start, time_end, classroom, course_name, *cohort in existing:
+            try:
+                start, end = parse_time(time_start)[0], parse_time(time_end)[0]
+            except ValueError:
+                continue
+            owner = entry_key(teacher_id, cohort, day.capitalize(), start, end)
+            self._stored_slots[owner] = (day, time_start, time_end)
+            self._existing_bookings[owner] = (teacher_id, classroom, tuple(cohort), day.capitalize())
+            self._book(teacher_id, classroom, tuple(cohort), day.capitalize(), start, end, owner,
+                       f"existing {course_name} on {day} {time_start}-{time_end}")
+
+    def _book(self, teacher_id, classroom, cohort, day, start, end, owner, label):
+        self._teacher_slots.add((teacher_id, day), start, end, owner, label)
+        self._room_slots.add((classroom, day), start, end, owner, label)
+        if cohort[0] is not None:
+            self._cohort_slots.add(cohort + (day,), start, end, owner, label)
+
+    def _unbook(self, owner):
+        """Forget the bookings of an existing entry an accepted row replaces."""
+        booking = self._existing_bookings.pop(owner, None)
+        if booking is None:
+            return
+        teacher_id, classroom, cohort, day = booking
+        self._teacher_slots.discard((teacher_id, day), owner)
+        self._room_slots.discard((classroom, day), owner)
+        if cohort[0] is not None:
+            self._cohort_slots.discard(cohort + (day,), owner)
+
+    def validate(self, row_number, row):
+        """Check one row against the teachers, its own fields and every slot accepted so far."""
+        self.rows += 1
+        if not isinstance(row, dict):
+            self.errors.append({'row': row_number, 'errors': ['Row must be an object']})
+            return
+        errors = [f"Missing {field}" for field in TIMETABLE_REQUIRED_FIELDS if not _text(row, field)]
+        if errors:
+            self.errors.append({'row': row_number, 'errors': errors})
+            return
+
+        day = _text(row, 'day_of_week').capitalize()
+        if day not in SCHEDULE_DAYS:
+            errors.append(f"Unknown day {day!r}")
+        teacher_id = self._teachers.get(_text(row, 'teacher_id'))
+        if teacher_id is None:
+            errors.append(f"Unknown teacher {_text(row, 'teacher_id')!r}")
+        try:
+            (start, time_start), (end, time_end) = parse_time(_text(row, 'time_start')), parse_time(_text(row, 'time_end'))
+            if start >= end:
+                errors.append('time_start must be before time_end')
+        except ValueError:
+            last_hour = (DAY_END_HOUR - 2) % 12 + 1
+            errors.append(f"Times must be H:MM from {DAY_START_HOUR}:00 to {last_hour}:59, "
+                          f"where 1:00 to {DAY_START_HOUR - 1}:59 are in the afternoon")
+        cohort = tuple(_text(row, field) or None for field in COHORT_COLUMNS)
+        if any(cohort) and not all(cohort):
+            errors.append('department, semester and batch must be given together')
+        if errors:
+            self.errors.append({'row': row_number, 'errors': errors})
+            return
+
+        classroom = _text(row, 'classroom')
+        course_name = _text(row, 'course_name')
+        owner = entry_key(teacher_id, cohort, day, start, end)
+        if owner in self._seen:
+            errors.append(f"Same slot as row {self._seen[owner]}")
+        # The entry this row overwrites, and the teacher's cohort-less entry a cohort entry replaces
+        replaced = {owner, entry_key(teacher_id, (None,), day, start, end)}
+        errors.extend(f"Teacher is already booked for {label}"
+                      for label in self._teacher_slots.overlapping((teacher_id, day), start, end, replaced))
+        errors.extend(f"Room {classroom} is already booked for {label}"
+                      for label in self._room_slots.overlapping((classroom, day), start, end, replaced))
+        if cohort[0] is not None:
+            errors.extend(f"Cohort is already booked for {label}"
+                          for label in self._cohort_slots.overlapping(cohort + (day,), start, end, replaced))
+        if errors:
+            self.errors.append({'row': row_number, 'errors': errors})
+            return
+
+        self._seen[owner] = row_number
+        for replaced_owner in replaced:
+            self._unbook(replaced_owner)
+        self._book(teacher_id, classroom, cohort, day, start, end, owner, f"row {row_number}")
+        if cohort[0] is not None:
+            teacher_slot = self._stored_slots.get(entry_key(teacher_id, (None,), day, start, end))
+            if teacher_slot is not None:
+                self._replaced_teacher_slots.append((teacher_id,) + teacher_slot)
+        # Rewriting an existing entry keeps its stored strings, so the upsert updates it in place
+        day, time_start, time_end = self._stored_slots.get(owner, (day, time_start, time_end))
+        department, batch, semester = cohort
+        self.slots.append({
+            'teacher_id': teacher_id,
+            'day_of_week': day,
+            'time_start': time_start,
+            'time_end': time_end,
+            'classroom': classroom,
+            'course_name': course_name,
+            'department': department,
+            'semester': semester,
+            'batch': batch,
+        })
+
+    def write(self):
+        """Create the missing classes and upsert one entry per accepted slot.
+
+        Runs in the caller's transaction; returns (classes created, entries written).
+        """
+        teacher_ids = {slot['teacher_id'] for slot in self.slots}
+        existing_classes = set(db.session.query(Class.name, Class.teacher_id, Class.schedule)
+                               .filter(Class.teacher_id.in_(teacher_ids)))
+        new_classes = {}
+        for slot in self.slots:
+            key = (slot['course_name'], slot['teacher_id'], f"{slot['day_of_week']} {slot['time_start']}-{slot['time_end']}")
+            if key not in existing_classes:
+                new_classes[key] = Class(name=key[0], teacher_id=key[1], schedule=key[2])
+        db.session.add_all(new_classes.values())
+
+        # The upsert removes these too, but only when they were stored with the same strings
+        table = ScheduleEntry.__table__
+        for start in range(0, len(self._replaced_teacher_slots), UPSERT_CHUNK_SIZE):
+            db.session.execute(table.delete().where(
+                table.c.department.is_(None),
+                db.tuple_(table.c.teacher_id, table.c.day_of_week, table.c.time_start, table.c.time_end)
+                .in_(self._replaced_teacher_slots[start:start + UPSERT_CHUNK_SIZE]),
+            ))
+        upsert_schedule_entries(self.slots)
+        return len(new_classes), len(self.slots)
@@ -0,0 +1,51 @@
+import os
+import sys
+import pytest
+from flask import Flask
+from flask_login import LoginManager, login_user
+
+# flask_backend is imported from the repository root, as the app does
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flask_backend.models import db, User
+
+@pytest.fixture
+def app(tmp_path):
+    """A bare app on a fresh SQLite database, with the models and logins of the real one.
+
+    Tests register the routes they need; GET /test-login/<user id> logs a user
+    in. No app context is left pushed, so every request gets its own, as in
+    production; push one to use the database from a test.
+    """
+    app = Flask(__name__)
+    app.config.update(
+        TESTING=True,
+        SECRET_KEY='test',
+        SQLALCHEMY_DATABASE_URI=f"sqlite:///{tmp_path / 'test.db'}",
+    )
+    db.init_app(app)
+    login_manager = LoginManager(app)
+    login_manager.user_loader(lambda user_id: db.session.get(User, int(user_id)))
+
+    @app.route('/test-login/<int:user_id>')
+    def test_login(user_id):
+        login_user(db.session.get(User, user_id))
+        return ''
+
+    with app.app_context():
+        db.create_all()
+    yield app
+    with app.app_context():
+        db.drop_all()
+
+def create_user(app, email):
+    """Add a teacher account and return its id."""
+    with app.app_context():
+        user = User(email=email, is_teacher=True)
+        db.session.add(user)
+        db.session.commit()
+        return user.id
+
+@pytest.fixture
+def user_id(app):
+    return create_user(app, 'teacher@example.com')
@@ -0,0 +1,115 @@
+import os
+import struct
+import numpy as np
+import pytest
+from flask_backend.embedding_store import (EmbeddingStore, record_dtype, HEADER_SIZE, STORE_MAGIC,
+                                           LEGACY_MODEL)
+
+MODEL = 'keras/frame'
+
+def features(rows, value, dimension=4):
+    return np.full((rows, dimension), value, dtype=np.float32)
+
+@pytest.fixture
+def path(tmp_path):
+    return str(tmp_path / 'embeddings.bin')
+
+def test_append_and_get(path):
+    store = EmbeddingStore(path)
+    assert store.append('s1', features(2, 1.0), MODEL) == 1
+    assert store.append('s2', features(1, 2.0), MODEL) == 2
+
+    assert len(store) == 2
+    assert store.dimension == 4
+    np.testing.assert_array_equal(store.get('s1'), features(2, 1.0))
+    np.testing.assert_array_equal(store.get('s2'), features(1, 2.0))
+    assert store.get('missing') is None
+    assert store.model('s1') == MODEL
+
+def test_reenrollment_supersedes_previous_rows(path):
+    store = EmbeddingStore(path)
+    store.append('s1', features(3, 1.0), MODEL)
+    generation = store.append('s1', features(2, 5.0), MODEL)
+
+    assert store.generation('s1') == generation
+    np.testing.assert_array_equal(store.get('s1'), features(2, 5.0))
+    assert store.dead_rows() == 3
+
+def test_refresh_sees_appends_of_another_instance(path):
+    writer = EmbeddingStore(path)
+    writer.append('s1', features(1, 1.0), MODEL)
+    reader = EmbeddingStore(path)
+    assert 's1' in reader
+
+    writer.append('s2', features(2, 2.0), MODEL)
+    writer.append('s1', features(1, 3.0), MODEL)
+    assert 's2' not in reader
+    reader.refresh()
+
+    assert reader.generations() == writer.generations()
+    np.testing.assert_array_equal(reader.get('s1'), features(1, 3.0))
+    np.testing.assert_array_equal(reader.get('s2'), features(2, 2.0))
+
+def test_appends_of_two_instances_keep_increasing_enrollments(path):
+    first, second = EmbeddingStore(path), EmbeddingStore(path)
+    assert first.append('s1', features(1, 1.0), MODEL) == 1
+    # The second instance has not refreshed, but append re-reads the file under the lock
+    assert second.append('s1', features(1, 2.0), MODEL) == 2
+
+    first.refresh()
+    np.testing.assert_array_equal(first.get('s1'), features(1, 2.0))
+
+def test_compaction_keeps_live_rows(path):
+    store = EmbeddingStore(path)
+    store.append('s1', features(3, 1.0), MODEL)
+    store.append('s2', features(1, 2.0), MODEL)
+    store.append('s1', features(2, 3.0), MODEL)
+    reader = EmbeddingStore(path)
+
+    assert store.compact() == 3
+    assert store.dead_rows() == 0
+    assert store.compact() == 0
+    assert os.path.getsize(path) == HEADER_SIZE + 3 * record_dtype(4).itemsize
+    np.testing.assert_array_equal(store.get('s1'), features(2, 3.0))
+    np.testing.assert_array_equal(store.get('s2'), features(1, 2.0))
+
+    # Another instance notices the file was replaced and reindexes it
+    reader.refresh()
+    assert reader.generations() == store.generations()
+    np.testing.assert_array_equal(reader.get('s1'), features(2, 3.0))
+
+def test_torn_tail_is_ignored_and_truncated(path):
+    store = EmbeddingStore(path)
+    store.append('s1', features(1, 1.0), MODEL)
+    with open(path, 'ab') as f:
+        f.write(b'\x01' * (record_dtype(4).itemsize // 2))
+
+    reader = EmbeddingStore(path)
+    assert reader.generations() == {'s1': 1}
+
+    store.append('s2', features(1, 2.0), MODEL)
+    assert os.path.getsize(path) == HEADER_SIZE + 2 * record_dtype(4).itemsize
+    reader.refresh()
+    np.testing.assert_array_equal(reader.get('s2'), features(1, 2.0))
+
+def test_version_1_file_is_read_and_upgraded(path):
+    records = np.zeros(2, dtype=record_dtype(4, model_width=0))
+    records['student_id'] = [b's1', b's2']
+    records['enrollment'] = [1, 2]
+    records['vector'] = [[1, 1, 1, 1], [2, 2, 2, 2]]
+    with open(path, 'wb') as f:
+        f.write(struct.pack('<8sIII44x', STORE_MAGIC, 1, 4, 64))
+        f.write(records.tobytes())
+
+    store = EmbeddingStore(path)
+    assert store.models() == {'s1': LEGACY_MODEL, 's2': LEGACY_MODEL}
+    store.append('s3', features(1, 3.0), 'tflite-int8/face')
+
+    assert store.models() == {'s1': LEGACY_MODEL, 's2': LEGACY_MODEL, 's3': 'tflite-int8/face'}
+    np.testing.assert_array_equal(store.get('s2'), features(1, 2.0))
+
+def test_rejects_mismatched_dimension(path):
+    store = EmbeddingStore(path)
+    store.append('s1', features(1, 1.0), MODEL)
+    with pytest.raises(ValueError):
+        store.append('s2', features(1, 1.0, dimension=8), MODEL)
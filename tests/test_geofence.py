@@ -0,0 +1,90 @@
+import numpy as np
+import pytest
+from geopy.distance import geodesic
+from flask_backend.geofence import Geofence, parse_polygon, haversine_meters
+
+CAMPUS = (9.0405, 38.7626)
+
+def circle(name, center, radius):
+    return {'name': name, 'latitude': center[0], 'longitude': center[1], 'radius': radius, 'polygon': None}
+
+def polygon(name, vertices):
+    return {'name': name, 'latitude': None, 'longitude': None, 'radius': None, 'polygon': vertices}
+
+def offset(center, meters, bearing):
+    """The point the given geodesic distance and bearing away from center."""
+    point = geodesic(meters=meters).destination(center, bearing)
+    return point.latitude, point.longitude
+
+@pytest.mark.parametrize('bearing', [0, 45, 90, 180, 270])
+def test_circle_boundary_is_settled_geodesically(bearing):
+    fence = Geofence([circle('main', CAMPUS, 200)])
+    # Within the haversine tolerance of the edge, so these go through the geodesic check
+    assert fence.locate(*offset(CAMPUS, 199.5, bearing)) == 'main'
+    assert fence.locate(*offset(CAMPUS, 200.5, bearing)) is None
+
+def test_points_well_inside_and_outside_a_circle():
+    fence = Geofence([circle('main', CAMPUS, 200)])
+    assert fence.contains(*CAMPUS)
+    assert fence.contains(*offset(CAMPUS, 150, 30))
+    assert not fence.contains(*offset(CAMPUS, 250, 30))
+    assert not fence.contains(CAMPUS[0] + 1, CAMPUS[1])
+
+def test_circle_across_the_antimeridian():
+    center = (-17.0, 179.9995)
+    fence = Geofence([circle('island', center, 300)])
+    east = offset(center, 250, 90)
+    assert east[1] < 0
+    assert fence.contains(*east)
+    assert not fence.contains(*offset(center, 350, 90))
+
+def test_circle_at_high_latitude():
+    center = (78.22, 15.65)
+    fence = Geofence([circle('north', center, 500)])
+    assert fence.contains(*offset(center, 499, 90))
+    assert not fence.contains(*offset(center, 501, 90))
+
+def test_polygon_membership():
+    square = [[9.0, 38.0], [9.0, 38.01], [9.01, 38.01], [9.01, 38.0]]
+    fence = Geofence([polygon('annex', square)])
+    assert fence.locate(9.005, 38.005) == 'annex'
+    assert fence.locate(9.0001, 38.0099) == 'annex'
+    assert fence.locate(9.011, 38.005) is None
+    assert fence.locate(9.005, 37.999) is None
+
+def test_concave_polygon_notch_is_outside():
+    # A U shape: the notch between the arms is inside the bounding box but not the polygon
+    shape = [[0.0, 0.0], [0.0, 0.03], [0.03, 0.03], [0.03, 0.02], [0.01, 0.02], [0.01, 0.01],
+             [0.03, 0.01], [0.03, 0.0]]
+    fence = Geofence([polygon('u', shape)])
+    assert fence.contains(0.005, 0.015)
+    assert fence.contains(0.02, 0.005)
+    assert not fence.contains(0.02, 0.015)
+
+def test_locate_many_matches_each_point_to_the_first_site_it_is_on():
+    square = [[9.0, 38.0], [9.0, 38.01], [9.01, 38.01], [9.01, 38.0]]
+    fence = Geofence([circle('a', CAMPUS, 200), circle('b', CAMPUS, 400), polygon('annex', square)])
+    points = [CAMPUS, offset(CAMPUS, 300, 0), (9.005, 38.005), (0.0, 0.0)]
+    assert fence.locate_many([p[0] for p in points], [p[1] for p in points]) == ['a', 'b', 'annex', None]
+    assert len(fence) == 3
+
+def test_empty_geofence_contains_nothing():
+    fence = Geofence([])
+    assert fence.locate_many([9.0, 10.0], [38.0, 39.0]) == [None, None]
+
+def test_haversine_is_close_to_geodesic():
+    distance = haversine_meters(*np.radians([CAMPUS[0], CAMPUS[1], 9.05, 38.77]))
+    assert distance == pytest.approx(geodesic(CAMPUS, (9.05, 38.77)).meters, rel=0.006)
+
+@pytest.mark.parametrize('value', [
+    [[9.0, 38.0], [9.0, 38.01]],
+    [[9.0, 38.0, 1.0], [9.0, 38.01, 1.0], [9.01, 38.01, 1.0]],
+    [[91.0, 38.0], [9.0, 38.01], [9.01, 38.01]],
+    '[[9.0, 181.0], [9.0, 38.01], [9.01, 38.01]]',
+])
+def test_parse_polygon_rejects_invalid_polygons(value):
+    with pytest.raises(ValueError):
+        parse_polygon(value)
+
+def test_parse_polygon_accepts_json():
+    assert parse_polygon('[[9.0, 38.0], [9.0, 38.01], [9.01, 38.01]]').shape == (3, 2)
@@ -0,0 +1,47 @@
+import sys
+import numpy as np
+import pytest
+from flask_backend.embedding_store import get_embedding_store
+
+# facial_recognition rewraps stdout and stderr on import; put pytest's capture
+# back, and keep the rewrapped streams alive so they do not close its files
+_captured = sys.stdout, sys.stderr
+from flask_backend import facial_recognition as fr
+_rewrapped = sys.stdout, sys.stderr
+sys.stdout, sys.stderr = _captured
+
+def enroll(model_directory, student_id, model):
+    get_embedding_store(model_directory).append(student_id, np.ones((1, 4), dtype=np.float32), model)
+
+def blank_photo():
+    cv2 = pytest.importorskip('cv2')
+    return cv2.imencode('.png', np.zeros((120, 160, 3), dtype=np.uint8))[1].tobytes()
+
+@pytest.fixture
+def model_directory(tmp_path):
+    return str(tmp_path)
+
+def test_default_configuration_refuses_group_photos(model_directory):
+    # FACE_DETECTION defaults to off, so enrollments are whole frames and cannot match face crops
+    assert not fr.FACE_DETECTION
+    enroll(model_directory, 's1', fr.embedding_model())
+
+    with pytest.raises(fr.GroupMatchingUnavailable):
+        fr.match_group_faces([blank_photo()], ['s1'], model_directory)
+
+def test_frame_enrollments_are_refused_with_face_detection_on(model_directory, monkeypatch):
+    enroll(model_directory, 's1', f'{fr.EXTRACTOR_BACKEND}/frame')
+    monkeypatch.setattr(fr, 'FACE_DETECTION', True)
+
+    with pytest.raises(fr.GroupMatchingUnavailable):
+        fr.match_group_faces([blank_photo()], ['s1', 's2'], model_directory)
+
+def test_stale_enrollments_are_reported_and_not_matched(model_directory, monkeypatch):
+    monkeypatch.setattr(fr, 'FACE_DETECTION', True)
+    enroll(model_directory, 's1', fr.embedding_model())
+    enroll(model_directory, 's2', f'{fr.EXTRACTOR_BACKEND}/frame')
+
+    result = fr.match_group_faces([blank_photo()], ['s1', 's2', 's3'], model_directory)
+    assert result['faces'] == 0
+    assert {student_id: (row['enrolled'], row['stale']) for student_id, row in result['students'].items()} == {
+        's1': (True, False), 's2': (False, True), 's3': (False, False)}
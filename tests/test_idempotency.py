@@ -0,0 +1,116 @@
+from datetime import datetime, timedelta
+import pytest
+from flask import jsonify, request
+from flask_login import login_required
+from flask_backend.idempotency import idempotent, request_fingerprint, IDEMPOTENCY_LOCK_TIMEOUT
+from flask_backend.models import db, IdempotencyKey
+from conftest import create_user
+
+@pytest.fixture
+def calls(app):
+    """Register an idempotent POST /mark view; returns the list of forms it ran with."""
+    calls = []
+
+    @app.route('/mark', methods=['POST'])
+    @login_required
+    @idempotent
+    def mark():
+        calls.append(request.form.to_dict())
+        if request.form.get('outcome') == 'fail':
+            return jsonify({'message': 'failed'}), 500
+        if request.form.get('outcome') == 'raise':
+            raise RuntimeError('boom')
+        return jsonify({'marked': len(calls)}), 201
+
+    return calls
+
+@pytest.fixture
+def client(app, user_id, calls):
+    return login(app, user_id)
+
+def login(app, user_id):
+    client = app.test_client()
+    client.get(f'/test-login/{user_id}')
+    return client
+
+def post(client, key, **form):
+    return client.post('/mark', data=form, headers={'Idempotency-Key': key} if key else {})
+
+def store_running_key(app, user_id, key, started, **form):
+    """Record a key as claimed by an attempt of the given request that has not finished."""
+    with app.test_request_context('/mark', method='POST', data=form):
+        fingerprint = request_fingerprint()
+        db.session.add(IdempotencyKey(user_id=user_id, key=key, request_hash=fingerprint, created_at=started))
+        db.session.commit()
+
+def stored_keys(app):
+    with app.app_context():
+        return IdempotencyKey.query.count()
+
+def test_retry_replays_the_stored_response(client, calls):
+    first = post(client, 'k1', student='S1')
+    retry = post(client, 'k1', student='S1')
+
+    assert len(calls) == 1
+    assert first.status_code == retry.status_code == 201
+    assert retry.get_json() == first.get_json()
+    assert retry.headers['Idempotent-Replayed'] == 'true'
+    assert 'Idempotent-Replayed' not in first.headers
+
+def test_requests_without_a_key_always_run(client, calls):
+    post(client, None, student='S1')
+    post(client, None, student='S1')
+    assert len(calls) == 2
+
+def test_key_reused_for_a_different_request_is_422(client, calls):
+    post(client, 'k1', student='S1')
+    response = post(client, 'k1', student='S2')
+
+    assert response.status_code == 422
+    assert len(calls) == 1
+
+def test_retry_while_the_first_attempt_runs_is_409(app, client, user_id, calls):
+    store_running_key(app, user_id, 'k1', datetime.utcnow(), student='S1')
+
+    response = post(client, 'k1', student='S1')
+    assert response.status_code == 409
+    assert response.headers['Retry-After'] == '1'
+    assert calls == []
+
+def test_abandoned_attempt_is_run_again(app, client, user_id, calls):
+    started = datetime.utcnow() - timedelta(seconds=IDEMPOTENCY_LOCK_TIMEOUT + 1)
+    store_running_key(app, user_id, 'k1', started, student='S1')
+
+    assert post(client, 'k1', student='S1').status_code == 201
+    assert len(calls) == 1
+
+def test_server_error_releases_the_key(app, client, calls):
+    assert post(client, 'k1', student='S1', outcome='fail').status_code == 500
+    assert stored_keys(app) == 0
+
+    # The retry is a different request body, but the failed attempt left nothing to conflict with
+    retry = post(client, 'k1', student='S1')
+    assert retry.status_code == 201
+    assert 'Idempotent-Replayed' not in retry.headers
+    assert len(calls) == 2
+
+def test_exception_releases_the_key(app, client, calls):
+    app.config['PROPAGATE_EXCEPTIONS'] = False
+    assert post(client, 'k1', student='S1', outcome='raise').status_code == 500
+    assert stored_keys(app) == 0
+
+    assert post(client, 'k1', student='S1', outcome='raise').status_code == 500
+    assert len(calls) == 2
+
+def test_keys_are_per_user(app, client, calls):
+    other_client = login(app, create_user(app, 'other@example.com'))
+
+    post(client, 'k1', student='S1')
+    response = post(other_client, 'k1', student='S1')
+    assert 'Idempotent-Replayed' not in response.headers
+    assert len(calls) == 2
+
+def test_invalid_key_is_400(client, calls):
+    assert post(client, ' ', student='S1').status_code == 400
+    assert post(client, 'k' * 256, student='S1').status_code == 400
+    assert calls == []
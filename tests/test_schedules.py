@@ -0,0 +1,193 @@
+import io
+import pytest
+from flask_backend.models import db, Teacher, ScheduleEntry
+from flask_backend.schedules import IntervalIndex, TimetableImport, read_timetable, parse_time
+from conftest import create_user
+
+@pytest.mark.parametrize('value, expected', [
+    ('10:30', (630, '10:30')),
+    ('12:30', (750, '12:30')),
+    ('1:30', (810, '1:30')),
+    ('6:00', (1080, '6:00')),
+    ('13:30', (810, '1:30')),
+    ('09:00', (540, '9:00')),
+    ('1:30 PM', (810, '1:30')),
+    ('11:00am', (660, '11:00')),
+])
+def test_parse_time_reads_the_apps_12_hour_times(value, expected):
+    assert parse_time(value) == expected
+
+@pytest.mark.parametrize('value', ['0:30', '19:00', '7:00 pm', '12:00 am', '9', '9:60', 'nine'])
+def test_parse_time_rejects_times_outside_the_teaching_day(value):
+    with pytest.raises(ValueError):
+        parse_time(value)
+
+def test_interval_index_overlaps():
+    index = IntervalIndex()
+    index.add('room', 540, 600, 'a', '09:00-10:00')
+    index.add('room', 600, 660, 'b', '10:00-11:00')
+    index.add('room', 480, 720, 'c', '08:00-12:00')
+
+    assert sorted(index.overlapping('room', 570, 610)) == ['08:00-12:00', '09:00-10:00', '10:00-11:00']
+    # Touching intervals do not clash
+    assert index.overlapping('room', 720, 780) == []
+    assert index.overlapping('room', 420, 480) == []
+    assert index.overlapping('room', 540, 600, ignore_owners={'a', 'c'}) == []
+    assert index.overlapping('other room', 540, 600) == []
+
+def test_interval_index_owners_need_not_be_comparable():
+    index = IntervalIndex()
+    index.add('day', 540, 600, ('cohort', 'CS', None, '1', 'Monday', '09:00', '10:00'), 'first')
+    index.add('day', 540, 600, ('cohort', 'CS', '2024', '1', 'Monday', '09:00', '10:00'), 'second')
+    index.add('day', 540, 600, ('teacher', 1, 'Monday', '09:00', '10:00'), 'third')
+    assert sorted(index.overlapping('day', 550, 560)) == ['first', 'second', 'third']
+
+@pytest.fixture
+def teachers(app):
+    """Two teachers, T1 and T2; returns {code: primary key}. The test runs in an app context."""
+    ids = {}
+    for code in ('T1', 'T2'):
+        user_id = create_user(app, f'{code.lower()}@example.com')
+        with app.app_context():
+            teacher = Teacher(user_id=user_id, teacher_id=code, name=code, department='CS')
+            db.session.add(teacher)
+            db.session.commit()
+            ids[code] = teacher.id
+    with app.app_context():
+        yield ids
+
+def add_entry(teacher_id, day, time_start, time_end, classroom, course_name, cohort=(None, None, None)):
+    department, batch, semester = cohort
+    db.session.add(ScheduleEntry(teacher_id=teacher_id, day_of_week=day, time_start=time_start, time_end=time_end,
+                                 classroom=classroom, course_name=course_name,
+                                 department=department, batch=batch, semester=semester))
+    db.session.commit()
+
+def row(teacher='T1', day='Monday', start='09:00', end='10:00', room='R1', course='Math', cohort=('', '', '')):
+    department, batch, semester = cohort
+    return {'teacher_id': teacher, 'day_of_week': day, 'time_start': start, 'time_end': end, 'classroom': room,
+            'course_name': course, 'department': department, 'batch': batch, 'semester': semester}
+
+def run_import(*rows):
+    timetable = TimetableImport()
+    for number, values in enumerate(rows, start=2):
+        timetable.validate(number, values)
+    return timetable
+
+def errors_of(timetable):
+    return {error['row']: error['errors'] for error in timetable.errors}
+
+def test_rows_clashing_with_each_other(teachers):
+    timetable = run_import(
+        row(),
+        row(teacher='T2', start='09:30', end='10:30', course='Physics'),
+        row(room='R2', start='09:45', end='10:45', course='Chemistry'),
+        row(teacher='T2', room='R3', start='10:00', end='11:00', course='Art', cohort=('CS', 'A', '1')),
+        row(teacher='T1', room='R4', start='10:30', end='11:30', course='Music', cohort=('CS', 'A', '1')),
+    )
+    errors = errors_of(timetable)
+    assert errors[3] == ['Room R1 is already booked for row 2']
+    assert errors[4] == ['Teacher is already booked for row 2']
+    assert errors[6] == ['Cohort is already booked for row 5']
+    assert [slot['course_name'] for slot in timetable.slots] == ['Math', 'Art']
+
+def test_row_clashing_with_an_existing_entry(teachers):
+    add_entry(teachers['T2'], 'Monday', '08:30', '09:30', 'R1', 'History')
+    timetable = run_import(row())
+    assert errors_of(timetable) == {2: ['Room R1 is already booked for existing History on Monday 08:30-09:30']}
+
+def test_row_for_an_existing_slot_replaces_it(teachers):
+    add_entry(teachers['T1'], 'Monday', '09:00', '10:00', 'R1', 'Math')
+    timetable = run_import(row(start='9:00', room='R2', course='Algebra'))
+    assert timetable.errors == []
+
+    timetable.write()
+    db.session.commit()
+    entries = ScheduleEntry.query.all()
+    assert [(entry.time_start, entry.classroom, entry.course_name) for entry in entries] == [('09:00', 'R2', 'Algebra')]
+
+def test_cohort_row_replaces_the_teachers_own_entry(teachers):
+    add_entry(teachers['T1'], 'Monday', '09:00', '10:00', 'R1', 'Math')
+    timetable = run_import(row(cohort=('CS', 'A', '1')))
+    assert timetable.errors == []
+
+    timetable.write()
+    db.session.commit()
+    entries = ScheduleEntry.query.all()
+    assert [(entry.department, entry.batch, entry.semester) for entry in entries] == [('CS', 'A', '1')]
+
+def test_slot_across_noon_is_accepted(teachers):
+    timetable = run_import(row(start='12:30', end='1:30', cohort=('CS', 'A', '1')))
+    assert timetable.errors == []
+    assert (timetable.slots[0]['time_start'], timetable.slots[0]['time_end']) == ('12:30', '1:30')
+
+def test_reimporting_an_existing_afternoon_slot_replaces_it(teachers):
+    add_entry(teachers['T1'], 'Monday', '1:30', '2:00', 'R1', 'Math', ('CS', 'A', '1'))
+    timetable = run_import(row(start='1:30', end='2:00', course='Algebra', cohort=('CS', 'A', '1')))
+    assert timetable.errors == []
+
+    timetable.write()
+    db.session.commit()
+    entries = ScheduleEntry.query.all()
+    assert [(entry.time_start, entry.time_end, entry.course_name) for entry in entries] == [('1:30', '2:00', 'Algebra')]
+
+def test_24_hour_times_are_the_same_slot_as_the_apps_times(teachers):
+    add_entry(teachers['T1'], 'Monday', '1:30', '2:00', 'R1', 'Math', ('CS', 'A', '1'))
+    timetable = run_import(
+        row(start='13:30', end='14:00', cohort=('CS', 'A', '1')),
+        row(teacher='T2', room='R2', start='13:45', end='14:30', course='Art', cohort=('CS', 'A', '1')),
+    )
+    assert errors_of(timetable) == {3: ['Cohort is already booked for row 2']}
+
+    timetable.write()
+    db.session.commit()
+    # Stored the way the app writes it, so the attendance keys of the schedule screens match it
+    entries = ScheduleEntry.query.all()
+    assert [(entry.time_start, entry.time_end) for entry in entries] == [('1:30', '2:00')]
+
+def test_replaced_entry_no_longer_books_its_room(teachers):
+    add_entry(teachers['T1'], 'Monday', '1:30', '2:00', 'R1', 'Math', ('CS', 'A', '1'))
+    timetable = run_import(
+        row(start='1:30', end='2:00', room='R2', cohort=('CS', 'A', '1')),
+        row(teacher='T2', start='1:30', end='2:00', room='R1', course='History'),
+    )
+    assert timetable.errors == []
+
+def test_afternoon_slot_clashes_with_an_existing_one(teachers):
+    add_entry(teachers['T2'], 'Monday', '1:30', '2:00', 'R1', 'History')
+    timetable = run_import(row(start='1:45', end='3:00'))
+    assert errors_of(timetable) == {2: ['Room R1 is already booked for existing History on Monday 1:30-2:00']}
+
+def test_invalid_rows(teachers):
+    timetable = run_import(
+        row(teacher='T9'),
+        row(day='Sunday', start='10:00', end='09:00'),
+        row(start='nine'),
+        row(cohort=('CS', '', '1')),
+        {'day_of_week': 'Monday'},
+        row(),
+        row(course='Math again'),
+    )
+    errors = errors_of(timetable)
+    assert errors[2] == ["Unknown teacher 'T9'"]
+    assert errors[3] == ["Unknown day 'Sunday'", 'time_start must be before time_end']
+    assert errors[4] == ['Times must be H:MM from 7:00 to 6:59, where 1:00 to 6:59 are in the afternoon']
+    assert errors[5] == ['department, semester and batch must be given together']
+    assert errors[6][0] == 'Missing time_start'
+    assert errors[8][0] == 'Same slot as row 7'
+    assert len(timetable.slots) == 1
+    assert timetable.rows == 7
+
+def test_teacher_is_found_by_code_or_primary_key(teachers):
+    timetable = run_import(row(teacher=str(teachers['T2'])))
+    assert timetable.slots[0]['teacher_id'] == teachers['T2']
+
+def test_read_timetable_csv_and_json():
+    csv_rows = list(read_timetable(io.BytesIO(b'\xef\xbb\xbfday_of_week,time_start\nMonday,09:00\n'), 'week.csv'))
+    assert csv_rows == [(2, {'day_of_week': 'Monday', 'time_start': '09:00'})]
+
+    json_rows = list(read_timetable(io.BytesIO(b'[{"day_of_week": "Monday"}]'), 'week.JSON'))
+    assert json_rows == [(1, {'day_of_week': 'Monday'})]
+
+    with pytest.raises(ValueError):
+        list(read_timetable(io.BytesIO(b'{"day_of_week": "Monday"}'), 'week.json'))